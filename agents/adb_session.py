@@ -0,0 +1,174 @@
+import queue
+import shlex
+import subprocess
+import threading
+import uuid
+from agents.tracing import span
+from agents.qa_logging import get_logger
+
+log = get_logger("ADB")
+
+# Read-only or state-setting commands that are safe to run twice
+IDEMPOTENT_PREFIXES = (
+    "cmd package query-activities", "pm list", "pm path", "dumpsys", "getprop",
+    "settings get", "wm size", "wm density", "am force-stop", "echo", "cat", "ls",
+)
+NOT_RESENT = "Error: adb shell lost before this command completed; not re-sent since it may already have run"
+
+
+class AdbError(Exception):
+    pass
+
+
+def is_idempotent(command):
+    command = command.strip()
+    return any(command == p or command.startswith(p + " ") for p in IDEMPOTENT_PREFIXES)
+
+
+class AdbSession:
+    """
+    One long-lived ``adb shell`` per device. Commands are written to the
+    shell's stdin, each followed by an ``echo <sentinel> $?`` so completion and
+    exit status can be read back without forking a new adb process.
+
+    Any executable that speaks the same protocol (e.g. a script that execs
+    ``sh``) can stand in for adb in tests.
+    """
+
+    def __init__(self, adb_path, serial=None, timeout=15.0, max_reconnects=2):
+        self.adb_path = adb_path
+        self.serial = serial
+        self.timeout = timeout
+        self.max_reconnects = max_reconnects
+        self._proc = None
+        self._lines = None
+        self._lock = threading.Lock()
+        self._token = f"__ADB_DONE_{uuid.uuid4().hex[:12]}__"
+        self._seq = 0
+        self.round_trips = 0
+        self.reconnects = 0
+
+    def run(self, command, check=True):
+        """
+        Runs one shell command; returns its output lines.
+        """
+        return self.run_batch([command], check=check)[0][1]
+
+    def run_batch(self, commands, check=True):
+        """
+        Sends several commands in a single write and waits for all of them.
+
+        :param commands: Shell strings or argv lists.
+        :param check: Raise AdbError on the first non-zero exit status.
+        :return: list of (exit_status, output_lines), one per command.
+
+        If the shell dies mid-batch, the unacknowledged commands are re-sent
+        after reconnecting only when they are all idempotent; otherwise (taps,
+        key events, launches) they get exit status -1 and NOT_RESENT as output.
+        """
+        commands = [c if isinstance(c, str) else shlex.join(c) for c in commands]
+        results = []
+        with self._lock, span("adb.run_batch", commands=len(commands)):
+            attempts = 0
+            while len(results) < len(commands):
+                sent = False
+                try:
+                    self._ensure_started()
+                    sent = True
+                    self._exchange(commands[len(results):], results)
+                except (BrokenPipeError, EOFError, TimeoutError, OSError) as e:
+                    self._kill()
+                    pending = commands[len(results):]
+                    if sent and not all(is_idempotent(c) for c in pending):
+                        log.warning(f"Shell session lost ({e}); not re-sending {len(pending)} command(s) that may have run")
+                        results.extend((-1, [NOT_RESENT]) for _ in pending)
+                        break
+                    attempts += 1
+                    if attempts > self.max_reconnects:
+                        raise AdbError(f"adb shell unavailable: {e}") from e
+                    self.reconnects += 1
+                    log.warning(f"Shell session lost ({e}); reconnecting ({attempts}/{self.max_reconnects})")
+        if check:
+            for cmd, (status, output) in zip(commands, results):
+                if status != 0:
+                    raise AdbError(f"'{cmd}' exited with {status}: {' '.join(output)}")
+        return results
+
+    def close(self):
+        with self._lock:
+            if self._proc and self._proc.poll() is None:
+                try:
+                    self._proc.stdin.write("exit\n")
+                    self._proc.stdin.flush()
+                    self._proc.wait(timeout=2)
+                except Exception:
+                    pass
+            self._kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _ensure_started(self):
+        if self._proc and self._proc.poll() is None:
+            return
+        cmd = [self.adb_path] + (["-s", self.serial] if self.serial else []) + ["shell"]
+        self._proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        self._lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self._proc, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _pump(proc, lines):
+        for line in proc.stdout:
+            lines.put(line.rstrip("\r\n"))
+        lines.put(None)
+
+    def _exchange(self, commands, results):
+        markers = []
+        payload = []
+        for cmd in commands:
+            self._seq += 1
+            marker = f"{self._token}{self._seq}"
+            markers.append(marker)
+            payload.append(f"{cmd}\necho {marker} $?\n")
+        self._proc.stdin.write("".join(payload))
+        self._proc.stdin.flush()
+        self.round_trips += 1
+
+        output = []
+        for marker in markers:
+            while True:
+                try:
+                    line = self._lines.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"no response from adb shell within {self.timeout}s")
+                if line is None:
+                    raise EOFError("adb shell exited")
+                pos = line.find(marker + " ")
+                if pos >= 0 and not line[:pos].endswith("echo "):  # skip pty echo of our own input
+                    # Output without a trailing newline shares the sentinel's line
+                    if pos > 0:
+                        output.append(line[:pos])
+                    results.append((int(line.split()[-1]), output))
+                    output = []
+                    break
+                output.append(line)
+
+    def _kill(self):
+        if self._proc is not None:
+            if self._proc.poll() is None:
+                self._proc.kill()
+            try:
+                self._proc.wait(timeout=2)
+            except Exception:
+                pass
+        self._proc = None
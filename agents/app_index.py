@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import Counter
+from agents.fuzzy_match import FuzzyMatcher
+from agents.fingerprint import is_status_bar
+from agents.qa_logging import get_logger
+
+log = get_logger("AppIndex")
+
+LAUNCHER_QUERY = (
+    "cmd package query-activities --brief "
+    "-a android.intent.action.MAIN -c android.intent.category.LAUNCHER"
+)
+COMPONENT_RE = re.compile(r"^([A-Za-z0-9_.]+)/([A-Za-z0-9_.$]+)$")
+
+# Drawer labels that cannot be derived from the package name
+APP_ALIASES = {
+    "messages": "com.google.android.apps.messaging",
+    "phone": "com.google.android.dialer",
+    "contacts": "com.google.android.contacts",
+    "clock": "com.google.android.deskclock",
+    "camera": "com.android.camera2",
+    "files": "com.google.android.documentsui",
+    "photos": "com.google.android.apps.photos",
+    "gmail": "com.google.android.gm",
+    "maps": "com.google.android.apps.maps",
+    "calendar": "com.google.android.calendar",
+    "play store": "com.android.vending",
+    "youtube": "com.google.android.youtube",
+}
+
+
+def normalize_label(label):
+    return " ".join((label or "").lower().split())
+
+
+def parse_launcher_activities(lines):
+    """
+    {package: "package/activity"} from ``cmd package query-activities --brief`` output.
+    """
+    components = {}
+    for line in lines:
+        m = COMPONENT_RE.match(line.strip())
+        if not m:
+            continue
+        package, activity = m.groups()
+        if activity.startswith("."):
+            activity = package + activity
+        components.setdefault(package, f"{package}/{activity}")
+    return components
+
+
+def derived_labels(package, component):
+    """
+    Labels guessable from the component: the last package segment and the
+    activity's simple name without an "Activity" suffix.
+    """
+    labels = {package.rsplit(".", 1)[-1]}
+    simple = component.rsplit("/", 1)[-1].rsplit(".", 1)[-1]
+    simple = re.sub(r"Activity$", "", simple)
+    if simple and simple.lower() not in ("main", "launcher", "home"):
+        labels.add(simple)
+    return {normalize_label(l) for l in labels if l}
+
+
+def foreground_package(ui_elements):
+    """
+    Package owning most of the non-status-bar elements on screen.
+    """
+    counts = Counter(el.package_name for el in ui_elements if el.package_name and not is_status_bar(el))
+    return counts.most_common(1)[0][0] if counts else None
+
+
+class AppIndex:
+    """
+    Per-device map of app labels to launcher components, built from the
+    package manager over the executor's ADB session and cached on disk, so
+    ``open_app`` is a single ``am start -n`` instead of a drawer search.
+
+    Labels come from APP_ALIASES, the package/activity names and labels
+    learned from successful drawer launches (``learn``).
+    """
+
+    def __init__(self, adb, path=None, ttl=24 * 3600, miss_refresh_interval=60.0):
+        """
+        :param adb: AdbSession of the device.
+        :param path: JSON cache file; defaults to logs/app_index/<serial>.json.
+        :param ttl: Seconds before the package listing is rebuilt.
+        :param miss_refresh_interval: Minimum seconds between rebuilds triggered by a lookup miss.
+        """
+        self.adb = adb
+        self.path = path or os.path.join("logs", "app_index", f"{adb.serial or 'default'}.json")
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self.components = {}  # package -> component
+        self.learned = {}  # label -> package
+        self.built_at = 0.0
+        self._matcher = None
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def resolve(self, name, package_name=None):
+        """
+        Launcher component for an app label (or a known package), or None.
+        """
+        with self._lock:
+            if not self.components or self._expired():
+                self._refresh()
+            component = self._lookup(name, package_name)
+            if component is None and time.time() - self.built_at >= self.miss_refresh_interval:
+                log.info(f"No entry for {name!r}; refreshing the package listing.")
+                self._refresh()
+                component = self._lookup(name, package_name)
+            return component
+
+    def learn(self, label, package):
+        """
+        Remembers the package a drawer label launched.
+        """
+        label = normalize_label(label)
+        if not label or not package or self.learned.get(label) == package:
+            return
+        with self._lock:
+            self.learned[label] = package
+            self._reindex()
+            self._save()
+
+    def forget(self, package):
+        """
+        Drops a package whose launch failed (uninstalled, disabled).
+        """
+        with self._lock:
+            self.components.pop(package, None)
+            self.learned = {l: p for l, p in self.learned.items() if p != package}
+            self._reindex()
+            self._save()
+
+    def _lookup(self, name, package_name):
+        if package_name and package_name in self.components:
+            return self.components[package_name]
+        label = normalize_label(name)
+        if not label:
+            return None
+        package = self._labels.get(label)
+        if package is None and self._matcher is not None:
+            # A near miss is only trusted if every close label names the same app;
+            # otherwise the drawer search picks the right one from the screen
+            packages = {self._labels[hit] for _, hit in self._matcher.query(label, 0.8)}
+            if len(packages) == 1:
+                package = packages.pop()
+            elif packages:
+                log.info(f"{name!r} is ambiguous between {sorted(packages)}; using the app drawer.")
+        return self.components.get(package)
+
+    def _refresh(self):
+        try:
+            lines = self.adb.run(LAUNCHER_QUERY)
+        except Exception as e:
+            log.warning(f"Could not list launcher activities: {e}")
+            return
+        self.components = parse_launcher_activities(lines)
+        self.built_at = time.time()
+        self._reindex()
+        self._save()
+        log.info(f"Indexed {len(self.components)} launchable apps")
+
+    def _reindex(self):
+        labels = {}
+        for package, component in self.components.items():
+            for label in derived_labels(package, component):
+                labels.setdefault(label, package)
+        for label, package in APP_ALIASES.items():
+            if package in self.components:
+                labels[label] = package
+        for label, package in self.learned.items():
+            if package in self.components:
+                labels[label] = package
+        self._labels = labels
+        self._matcher = FuzzyMatcher(labels) if labels else None
+
+    def _expired(self):
+        return self.ttl is not None and time.time() - self.built_at > self.ttl
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.components = data.get("components", {})
+            self.learned = data.get("learned", {})
+            self.built_at = data.get("built_at", 0.0)
+            self._reindex()
+        except Exception as e:
+            log.warning(f"Could not load index ({e}); it will be rebuilt.")
+            self.components, self.learned, self.built_at = {}, {}, 0.0
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"built_at": self.built_at, "components": self.components, "learned": self.learned}, f, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,47 @@
+class Checkpoint:
+    def __init__(self, subgoal, fingerprint):
+        self.subgoal = subgoal
+        self.fingerprint = fingerprint
+
+    def __repr__(self):
+        return f"Checkpoint({self.subgoal}, {self.fingerprint})"
+
+
+class CheckpointLog:
+    """
+    Verified progress through a plan. Checkpoint 0 is the starting screen;
+    checkpoint k is the screen produced by the k-th successful subgoal.
+    """
+
+    def __init__(self, start_fingerprint=None):
+        self.checkpoints = []
+        if start_fingerprint is not None:
+            self.reset(start_fingerprint)
+
+    def reset(self, start_fingerprint):
+        self.checkpoints = [Checkpoint(None, start_fingerprint)]
+
+    def record(self, subgoal, fingerprint):
+        self.checkpoints.append(Checkpoint(subgoal, fingerprint))
+
+    def completed_subgoals(self):
+        return [c.subgoal for c in self.checkpoints[1:]]
+
+    def match(self, fingerprint):
+        """
+        Index of the most advanced checkpoint whose screen matches, or None.
+        """
+        for k in range(len(self.checkpoints) - 1, -1, -1):
+            if self.checkpoints[k].fingerprint == fingerprint:
+                return k
+        return None
+
+    def rewind(self, k):
+        """
+        Drops every checkpoint after ``k``; returns the subgoals still completed.
+        """
+        del self.checkpoints[k + 1:]
+        return self.completed_subgoals()
+
+    def __len__(self):
+        return len(self.checkpoints)
@@ -0,0 +1,170 @@
+import json
+from agents.fuzzy_match import FuzzyMatcher
+from agents.fingerprint import is_status_bar
+
+# Rough chars-per-token of English/JSON text for GPT and Gemini tokenizers
+CHARS_PER_TOKEN = 4
+MAX_CELL_CHARS = 60
+LOG_COLUMNS = ("step", "agent", "action", "label", "status", "reason", "n")
+UI_COLUMNS = ("text", "desc", "class", "state", "x,y")
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _cell(value):
+    if value is None or value == "":
+        return ""
+    text = " ".join(str(value).replace("|", "/").split())
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS - 1] + "…"
+
+
+def _row(cells):
+    return "|".join(_cell(c) for c in cells)
+
+
+def is_informative(el):
+    """
+    False for layout containers and decorations: no text, description or
+    hint, and nothing to toggle or type into. The status bar is never informative.
+    """
+    if is_status_bar(el):
+        return False
+    if el.text or el.content_description or getattr(el, "hint_text", None):
+        return True
+    return bool(getattr(el, "is_checkable", False) or getattr(el, "is_editable", False))
+
+
+def _element_state(el):
+    state = []
+    if getattr(el, "is_checkable", False):
+        state.append("on" if getattr(el, "is_checked", False) else "off")
+    if getattr(el, "is_editable", False):
+        state.append("edit")
+    elif getattr(el, "is_clickable", False):
+        state.append("click")
+    if getattr(el, "is_selected", False):
+        state.append("selected")
+    if getattr(el, "is_enabled", True) is False:
+        state.append("disabled")
+    return " ".join(state)
+
+
+class CompactContext:
+    """
+    A serialized prompt section and its estimated token count.
+    """
+
+    def __init__(self, text, tokens, kept, total):
+        self.text = text
+        self.tokens = tokens
+        self.kept = kept
+        self.total = total
+
+    @property
+    def omitted(self):
+        return self.total - self.kept
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"CompactContext({self.kept}/{self.total} rows, ~{self.tokens} tokens)"
+
+
+class ContextCompactor:
+    """
+    Serializes UI snapshots and test logs for LLM prompts as pipe-separated
+    tables within a token budget. Rows are ranked by relevance to a query
+    (the subgoal label) and the best ones kept; kept rows stay in their
+    original order so the table still reads top-to-bottom.
+    """
+
+    def __init__(self, max_tokens=1500):
+        """
+        :param max_tokens: Budget for the table, header and omission note included.
+        """
+        self.max_tokens = max_tokens
+
+    def ui_table(self, ui_elements, query=None):
+        """
+        Informative elements of a screen, most relevant to ``query`` first when
+        over budget. Switches in the same row as a matching label are ranked
+        with it, since they carry its state.
+        """
+        elements = [el for el in ui_elements if is_informative(el)]
+        rows, labels = [], []
+        for el in elements:
+            bbox = getattr(el, "bbox_pixels", None)
+            center = f"{(bbox.x_min + bbox.x_max) // 2},{(bbox.y_min + bbox.y_max) // 2}" if bbox else ""
+            class_name = (el.class_name or "").rsplit(".", 1)[-1]
+            rows.append(_row((el.text, el.content_description or getattr(el, "hint_text", None), class_name, _element_state(el), center)))
+            labels.append(" ".join(v for v in (el.text, el.content_description) if v).lower())
+
+        scores = self._relevance(query, labels)
+        for i, el in enumerate(elements):
+            bbox = getattr(el, "bbox_pixels", None)
+            if scores[i] < 0.8 or bbox is None:
+                continue
+            for j, other in enumerate(elements):
+                obox = getattr(other, "bbox_pixels", None)
+                if obox is not None and getattr(other, "is_checkable", False) and obox.y_min < bbox.y_max and obox.y_max > bbox.y_min:
+                    scores[j] = max(scores[j], scores[i])
+        return self._fit(_row(UI_COLUMNS), rows, scores, len(ui_elements) - len(elements))
+
+    def log_table(self, logs, query=None):
+        """
+        Test log entries with consecutive repeats collapsed into one row
+        (``n`` = count). Failures and the steps around them outrank passes.
+        """
+        rows, scores, labels = [], [], []
+        previous = None
+        for i, entry in enumerate(logs):
+            action = entry.get("action")
+            if not isinstance(action, dict):
+                action = {"action": action}
+            key = (entry.get("agent"), json.dumps(action, sort_keys=True), entry.get("status"), entry.get("reason"))
+            if key == previous:
+                rows[-1][-1] += 1
+                continue
+            previous = key
+            rows.append([i, entry.get("agent"), action.get("action"), action.get("label") or action.get("name") or action.get("direction"), entry.get("status"), entry.get("reason"), 1])
+            labels.append(str(rows[-1][3] or "").lower())
+
+        relevance = self._relevance(query, labels)
+        fails = {k for k, r in enumerate(rows) if r[4] == "fail"}
+        for k in range(len(rows)):
+            near_fail = k - 1 in fails or k + 1 in fails
+            # Failures, then their neighbours, then relevance, then recency
+            scores.append(3.0 * (k in fails) + 1.5 * near_fail + relevance[k] + 0.5 * k / max(len(rows), 1))
+        text_rows = [_row(r[:-1] + [r[-1] if r[-1] > 1 else ""]) for r in rows]
+        return self._fit(_row(LOG_COLUMNS), text_rows, scores, counts=[r[-1] for r in rows])
+
+    def _relevance(self, query, labels):
+        if not query:
+            return [0.0] * len(labels)
+        query = query.lower()
+        scored = dict((label, score) for score, label in FuzzyMatcher(labels).query(query, 0.0))
+        return [1.0 if label and (query in label or label in query) else scored.get(label, 0.0) for label in labels]
+
+    def _fit(self, header, rows, scores, dropped=0, counts=None):
+        """
+        :param dropped: Source items filtered out before ranking.
+        :param counts: Source items behind each row (collapsed repeats); 1 each by default.
+        """
+        counts = counts or [1] * len(rows)
+        budget = self.max_tokens - estimate_tokens(header) - estimate_tokens(f"({len(rows)} more rows omitted)")
+        order = sorted(range(len(rows)), key=lambda k: -scores[k])
+        keep, used = set(), 0
+        for k in order:
+            cost = estimate_tokens(rows[k]) + 1
+            if used + cost > budget:
+                continue
+            keep.add(k)
+            used += cost
+        lines = [header] + [rows[k] for k in sorted(keep)]
+        if len(keep) < len(rows):
+            lines.append(f"({len(rows) - len(keep)} more rows omitted)")
+        text = "\n".join(lines)
+        return CompactContext(text, estimate_tokens(text), sum(counts[k] for k in keep), sum(counts) + dropped)
@@ -1,18 +1,40 @@
-import time
 import os
-import subprocess
 from android_world.env import json_action
+from agents.ui_index import UIIndex
+from agents.fingerprint import ui_fingerprint
+from agents.ui_diff import diff_ui
+from agents.ui_settle import SettleEngine
+from agents.adb_session import AdbSession
+from agents.observation import ObservationManager
+from agents.app_index import AppIndex, foreground_package
+from agents.qa_logging import get_logger, format_ui
+from agents.tracing import span
+
+log = get_logger("Executor")
 
 class ExecutorAgent:
-    def __init__(self, env, retries=3, delay=1.2):
+    def __init__(
+        self, env, retries=3, delay=1.2, settle=None, adb_serial=None, observations=None, nav_graph=None, app_index=None
+    ):
+        """
+        :param nav_graph: NavGraph of known screens, used to take the shortest known
+                          route to a screen or label instead of the launcher route.
+        :param app_index: AppIndex for direct launches; built over the ADB session by default.
+        """
         self.env = env
+        self.nav_graph = nav_graph
+        self.observations = observations or ObservationManager(env)
         self.adb_path = os.getenv("ADB_PATH")
+        self.adb = AdbSession(self.adb_path, serial=adb_serial) if self.adb_path else None
+        self.app_index = app_index if app_index is not None else (AppIndex(self.adb) if self.adb else None)
         self.retries = retries
         self.delay = delay
+        self.settle = settle or SettleEngine(env, observations=self.observations)
+        self._recording = None
 
     def execute(self, subgoal, ui_elements):
         action = subgoal.get("action")
-        print(f"\n[Executor] Executing: {subgoal}")
+        log.info(f"Executing: {subgoal}")
 
         if action == "open_app_drawer":
             return self._open_app_drawer()
@@ -26,17 +48,89 @@ class ExecutorAgent:
             return self._tap_by_label(subgoal, ui_elements)
         return {"status": "fail", "reason": f"Unknown action: {action}"}
 
+    def begin_recording(self):
+        """
+        Starts capturing the resolved device actions (tap coordinates, ADB
+        commands) performed for the current subgoal.
+        """
+        self._recording = []
+
+    def end_recording(self):
+        actions, self._recording = self._recording or [], None
+        return actions
+
+    def replay_actions(self, actions):
+        """
+        Re-performs recorded actions verbatim, settling after each; returns the final state.
+        """
+        state = None
+        for action in actions:
+            if action["type"] == "tap":
+                state = self._click(action["x"], action["y"], settle=action.get("settle") or "tap")
+            elif action["type"] == "adb":
+                if not self.adb:
+                    raise RuntimeError("Recorded ADB action but no ADB path set")
+                self._adb(action["commands"], action.get("settle"))
+                state = self.settle.wait(action.get("settle") or "default")
+        return state if state is not None else self.observations.current()
+
+    def navigate_to(self, target=None, label=None, max_edges=8):
+        """
+        Replays the shortest known path from the current screen to the screen with
+        fingerprint ``target`` (or to any screen showing ``label``). Returns the
+        reached state, or None when no path is known or the device diverged from it.
+        """
+        if self.nav_graph is None:
+            return None
+        state = self.observations.current()
+        current = ui_fingerprint(state.ui_elements)
+        if target is not None:
+            path = self.nav_graph.shortest_path(current, target)
+        else:
+            path = self.nav_graph.path_to_label(current, label)
+        if path is None or len(path) > max_edges:
+            return None
+        if path:
+            log.info(f"Following known route of {len(path)} screen(s) to {target or repr(label)}")
+        for edge in path:
+            try:
+                state = self.replay_actions(edge["actions"])
+            except Exception as e:
+                log.warning(f"Route replay failed: {e}")
+                return None
+            if ui_fingerprint(state.ui_elements) != edge["to"]:
+                log.warning("Device left the known route; dropping that edge.")
+                self.nav_graph.forget_edge(edge["from"], edge["to"])
+                return None
+        return state
+
+    def close(self):
+        if self.adb:
+            self.adb.close()
+
+    def close_apps(self, packages):
+        """
+        Force-stops ``packages`` in one ADB round trip so the next task starts them cold.
+        """
+        if not packages or not self.adb:
+            return
+        log.info(f"Stopping apps used by the last task: {', '.join(sorted(packages))}")
+        try:
+            self._adb([["am", "force-stop", p] for p in sorted(packages)], "default")
+        except Exception as e:
+            log.warning(f"Could not stop apps: {e}")
+
     def go_home(self, retries=3):
-        print("[Executor] Going HOME using ADB keyevent.")
-        if self.adb_path:
-            for i in range(retries):
-                try:
-                    subprocess.run([self.adb_path, "shell", "input", "keyevent", "3"], check=True)
-                    time.sleep(1)
-                except Exception as e:
-                    print(f"[Executor] Failed to go home: {e}")
+        log.info("Going HOME using ADB keyevent.")
+        if self.adb:
+            try:
+                # All HOME presses go to the device in one round trip
+                self._adb([["input", "keyevent", "3"]] * retries, "home")
+                self.settle.wait("home")
+            except Exception as e:
+                log.error(f"Failed to go home: {e}")
         else:
-            print("[Executor] No ADB path set—cannot go home.")
+            log.warning("No ADB path set—cannot go home.")
 
     def _is_home_screen(self, ui_elements):
         for el in ui_elements:
@@ -58,92 +152,114 @@ class ExecutorAgent:
                     "network & internet", "apps", "notifications", "display"
                 ] and not any(x in label for x in ["&", ":", " "]):
                     app_icon_count += 1
-        print(f"[Executor] Detected {app_icon_count} app-like icons on screen.")
+        log.debug("Detected %d app-like icons on screen.", app_icon_count)
         return app_icon_count >= 6
 
     def _open_app_drawer(self):
         for attempt in range(3):
-            print(f"[Executor] Attempting to open app drawer (attempt {attempt + 1})")
-            state = self.env.get_state(wait_to_stabilize=True)
+            log.info(f"Attempting to open app drawer (attempt {attempt + 1})")
+            state = self.observations.current()
             ui_elements = state.ui_elements
 
             if self._is_app_drawer_open(ui_elements):
-                print("[Executor] 🟢 App drawer is already open!")
+                log.info("🟢 App drawer is already open!")
                 return {"status": "success", "state": state}
 
             if not self._is_home_screen(ui_elements):
-                print("[Executor] 🚫 Not on home screen — attempting to go home again.")
+                log.info("🚫 Not on home screen — attempting to go home again.")
                 self.go_home()
-                time.sleep(1)
                 continue
 
-            print("[Executor] Performing swipe to open app drawer...")
+            log.info("Performing swipe to open app drawer...")
+            before = ui_fingerprint(ui_elements)
             self._mid_screen_scroll()
-            time.sleep(2)
-
-            state = self.env.get_state(wait_to_stabilize=True)
+            state = self.settle.wait("swipe", before=before)
             ui_elements = state.ui_elements
 
             if self._is_app_drawer_open(ui_elements):
-                print("[Executor] ✅ App drawer opened after swipe.")
+                log.info("✅ App drawer opened after swipe.")
                 return {"status": "success", "state": state}
 
-        print("[Executor] ❌ App drawer failed to open after 3 attempts! Dumping UI for debug:")
-        for el in ui_elements:
-            print(f"   [UI] TEXT='{el.text}', CLASS='{el.class_name}', BBOX={getattr(el, 'bbox_pixels', None)}")
+        log.error("❌ App drawer failed to open after 3 attempts!")
+        log.debug(lambda: f"UI dump:\n{format_ui(ui_elements, '   ')}")
         return {"status": "fail", "reason": "App drawer failed to open"}
 
     def _open_app(self, subgoal, ui_elements):
+        if self.app_index is not None:
+            result = self._launch_indexed(subgoal.get("name", ""), subgoal.get("package_name"))
+            if result is not None:
+                return result
         app_name = subgoal.get("name", "").lower()
         for scroll_attempt in range(3):
             for el in ui_elements:
                 if app_name in (el.text or "").lower() and el.bbox_pixels:
-                    print(f"[Executor] Found app visually: {el.text}")
-                    return self._tap(el)
-            print(f"[Executor] App '{app_name}' not found, scrolling (attempt {scroll_attempt + 1})")
+                    log.info(f"Found app visually: {el.text}")
+                    # A cold start can outlast the tap bound; a second tap would land inside the app
+                    result = self._tap(el, ui_elements, retry=False, settle="launch")
+                    if result["status"] == "success" and self.app_index is not None:
+                        self.app_index.learn(el.text, foreground_package(result["state"].ui_elements))
+                    return result
+            log.info(f"App '{app_name}' not found, scrolling (attempt {scroll_attempt + 1})")
+            before = ui_fingerprint(ui_elements)
             self._mid_screen_scroll()
-            ui_elements = self.env.get_state(wait_to_stabilize=True).ui_elements
+            ui_elements = self.settle.wait("swipe", before=before).ui_elements
         pkg = subgoal.get("package_name")
-        if pkg and self.adb_path:
+        if pkg and self.adb:
             try:
-                print(f"[Executor] Using ADB fallback to launch package: {pkg}")
-                subprocess.run([
-                    self.adb_path, "shell", "monkey",
-                    "-p", pkg, "-c", "android.intent.category.LAUNCHER", "1"
-                ], check=True)
-                time.sleep(2)
-                return {"status": "success"}
+                log.info(f"Using ADB fallback to launch package: {pkg}")
+                self._adb([["monkey", "-p", pkg, "-c", "android.intent.category.LAUNCHER", "1"]], "launch")
+                return {"status": "success", "state": self.settle.wait("launch")}
             except Exception as e:
-                print(f"[Executor] ADB fallback failed: {e}")
+                log.error(f"ADB fallback failed: {e}")
                 return {"status": "fail", "reason": f"ADB fallback failed: {e}"}
         else:
             return {"status": "fail", "reason": f"App '{app_name}' not found and no fallback provided"}
 
+    def _launch_indexed(self, app_name, package_name=None):
+        """
+        Starts the app's launcher activity directly; None when the index has no
+        entry or the launch failed, so the caller falls back to the drawer.
+        """
+        component = self.app_index.resolve(app_name, package_name)
+        if component is None:
+            return None
+        log.info(f"Launching '{app_name}' directly: {component}")
+        try:
+            output = self._adb([["am", "start", "-n", component]], "launch")[0][1]
+        except Exception as e:
+            output = [f"Error: {e}"]
+        if any(line.startswith("Error") for line in output):
+            log.warning(f"Direct launch failed ({' '.join(output)}); using the app drawer.")
+            if self._recording:
+                self._recording.pop()
+            self.app_index.forget(component.split("/", 1)[0])
+            return None
+        return {"status": "success", "state": self.settle.wait("launch")}
+
     def _mid_screen_scroll(self):
-        if self.adb_path:
+        if self.adb:
             try:
-                print("[Executor] Performing ADB mid-screen swipe (540,1300) → (540,700)")
-                subprocess.run([
-                    self.adb_path, "shell", "input", "swipe", "540", "1300", "540", "700"
-                ], check=True)
+                log.info("Performing ADB mid-screen swipe (540,1300) → (540,700)")
+                self._adb([["input", "swipe", "540", "1300", "540", "700"]], "swipe")
             except Exception as e:
-                print(f"[Executor] ADB swipe failed: {e}")
+                log.error(f"ADB swipe failed: {e}")
         else:
-            print("[Executor] No ADB path set — cannot perform swipe")
+            log.warning("No ADB path set — cannot perform swipe")
 
     def _scroll(self):
-        current_ui = self.env.get_state(wait_to_stabilize=True).ui_elements
+        current_ui = self.observations.current().ui_elements
         visible_texts = [el.text.lower() for el in current_ui if el.text]
-        print(f"[Executor] Visible text elements before scroll: {visible_texts}")
+        log.debug("Visible text elements before scroll: %s", visible_texts)
         if any(term in txt for term in ["wifi", "wi-fi", "network", "internet"] for txt in visible_texts):
-            print("[Executor] Scroll skipped — relevant label already visible")
-            return {"status": "skipped", "state": self.env.get_state(wait_to_stabilize=True)}
+            log.info("Scroll skipped — relevant label already visible")
+            return {"status": "skipped", "state": self.observations.current()}
+        before = ui_fingerprint(current_ui)
         self._mid_screen_scroll()
-        return {"status": "success", "state": self.env.get_state(wait_to_stabilize=True)}
+        return {"status": "success", "state": self.settle.wait("swipe", before=before)}
 
     def _tap_by_label(self, subgoal, ui_elements):
         label = subgoal.get("label", "").lower()
-        print(f"[Executor] Looking for label match: '{label}'")
+        log.info(f"Looking for label match: '{label}'")
         alias_map = {
             "wi-fi": ["wifi", "wi-fi"],
             "wifi": ["wi-fi", "wifi"],
@@ -153,42 +269,104 @@ class ExecutorAgent:
         search_terms = [label] + alias_map.get(label, [])
 
         # Find all label elements
-        label_els = [el for el in ui_elements if any(term in (el.text or '').lower() for term in search_terms)]
+        index = UIIndex.for_elements(ui_elements)
+        label_els = index.find_any(search_terms, fields=("text",))
         if not label_els:
-            print(f"[Executor] ❌ No elements with label '{label}' found!")
+            # A screen showing the label may be a few known taps away
+            state = self.navigate_to(label=label)
+            if state is not None and state.ui_elements is not ui_elements:
+                return self._tap_by_label(subgoal, state.ui_elements)
+            log.warning(f"❌ No elements with label '{label}' found!")
             return {"status": "fail", "reason": f"No label match for '{label}'"}
 
         # For toggles, look for Switches that are spatially close to the label
         if subgoal.get("action") == "toggle":
             for lbl in label_els:
+                if not lbl.bbox_pixels:
+                    continue
                 # Find Switches in same row (y-center within 60px, and close in x)
-                y_center = (lbl.bbox_pixels.y_min + lbl.bbox_pixels.y_max) // 2
-                candidates = [
-                    el for el in ui_elements
-                    if "switch" in (el.class_name or '').lower() and el.bbox_pixels
-                    and abs(((el.bbox_pixels.y_min + el.bbox_pixels.y_max) // 2) - y_center) < 60
-                ]
+                y_center = UIIndex.y_center(lbl)
+                candidates = index.in_row(y_center, 60, class_contains="switch")
                 # Pick the Switch with highest x (usually rightmost in the row)
                 if candidates:
                     switch_el = max(candidates, key=lambda el: el.bbox_pixels.x_min)
-                    print(f"[Executor] ✅ Found switch for label '{label}' at y={y_center}: {switch_el}")
-                    return self._tap(switch_el)
+                    log.info(f"✅ Found switch for label '{label}' at y={y_center}")
+                    log.debug(lambda: f"Switch element: {switch_el}")
+                    return self._tap(switch_el, ui_elements, retry=False)
 
-            print(f"[Executor] ❌ No matching Switch found in row with label '{label}'! Falling back to label tap.")
+            log.warning(f"❌ No matching Switch found in row with label '{label}'! Falling back to label tap.")
 
         # If not toggle or failed above, tap the label itself
         # Use the first match
         el = label_els[0]
-        print(f"[Executor] ✅ Matched label/desc for '{label}': {el.text or el.content_description}")
-        return self._tap(el)
+        log.info(f"✅ Matched label/desc for '{label}': {el.text or el.content_description}")
+        return self._tap(el, ui_elements, retry=subgoal.get("action") != "toggle")
 
 
-    def _tap(self, el):
+    def _tap(self, el, ui_elements=None, retry=True, settle="tap"):
+        """
+        :param retry: Tap again when the first tap had no visible effect. Never done
+                      for checkable elements (a late-flipping switch would be toggled
+                      twice) or for taps with a slower settle type than "tap".
+        :param settle: Settle type to wait for, e.g. "launch" for app icons.
+        """
         bbox = el.bbox_pixels
         x = (bbox.x_min + bbox.x_max) // 2
         y = (bbox.y_min + bbox.y_max) // 2
-        print(f"[Executor] Tapping at ({x}, {y}) on '{el.text}'")
-        tap = json_action.JSONAction(action_type="click", x=x, y=y)
-        self.env.execute_action(tap)
-        time.sleep(1.5)
-        return {"status": "success", "state": self.env.get_state(wait_to_stabilize=True)}
+        log.info(f"Tapping at ({x}, {y}) on '{el.text}'")
+        if ui_elements is None:
+            return {"status": "success", "state": self._click(x, y, settle=settle)}
+        if getattr(el, "is_checkable", False) or "switch" in (el.class_name or "").lower() or settle != "tap":
+            retry = False
+        attempts = max(1, self.retries) if retry else 1
+        before = ui_fingerprint(ui_elements)
+        for attempt in range(attempts):
+            started = self.settle.clock()
+            state = self._click(x, y, before, settle)
+            diff = diff_ui(ui_elements, state.ui_elements)
+            if diff.empty:
+                state, diff = self._await_effect(ui_elements, state, started, settle)
+            if not diff.empty:
+                log.debug(f"Tap effect: {diff}")
+                return {"status": "success", "state": state, "diff": diff}
+            # No-op tap: drop it from the macro before any retry
+            if self._recording:
+                self._recording.pop()
+            log.warning(f"Tap at ({x}, {y}) changed nothing (attempt {attempt + 1}/{attempts})")
+        return {"status": "fail", "reason": f"Tap on '{el.text}' had no visible effect", "state": state}
+
+    def _await_effect(self, ui_elements, state, started, settle="tap"):
+        """
+        Keeps polling until the full max bound of ``settle`` has passed since
+        ``started``, diffing each snapshot against the pre-tap ``ui_elements``.
+        Returns (state, diff).
+        """
+        max_s = self.settle.bounds_for(settle)[1]
+        diff = diff_ui(ui_elements, state.ui_elements)
+        while diff.empty and self.settle.clock() - started < max_s:
+            self.settle.sleep(self.settle.poll_interval)
+            state = self.observations.poll()
+            diff = diff_ui(ui_elements, state.ui_elements)
+        return state, diff
+
+    def _click(self, x, y, before=None, settle="tap"):
+        if self._recording is not None:
+            action = {"type": "tap", "x": x, "y": y}
+            if settle != "tap":
+                action["settle"] = settle
+            self._recording.append(action)
+        with span("env.execute_action", action="click"):
+            self.env.execute_action(json_action.JSONAction(action_type="click", x=x, y=y))
+        self.observations.invalidate()
+        return self.settle.wait(settle, before=before)
+
+    def _adb(self, commands, settle):
+        """
+        :param settle: Settle type a replay should wait for after these commands.
+        """
+        if self._recording is not None:
+            self._recording.append({"type": "adb", "commands": commands, "settle": settle})
+        try:
+            return self.adb.run_batch(commands)
+        finally:
+            self.observations.invalidate()
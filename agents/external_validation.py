@@ -3,11 +3,13 @@ import sys
 import json
 import numpy as np
 from PIL import Image
-from skimage.metrics import structural_similarity as ssim
 
 # Adjust path to import main from project root
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from main import main as run_agent  # Now you can run your pipeline from here
+from main import QASession  # Now you can run your pipeline from here
+from agents.trace_store import open_trace
+from agents.trace_compare import GroundTruthCache, preprocess_frames, compare_preprocessed
+from agents.suite_runner import SuiteRunner, parse_devices
 
 # Paths (relative to project root)
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -15,6 +17,7 @@ EXTERNAL_DIR = os.path.join(PROJECT_ROOT, "external_validation")
 GT_TRACES_DIR = os.path.join(EXTERNAL_DIR, "gt_traces")
 PROMPT_FILE = os.path.join(EXTERNAL_DIR, "gt_prompts.json")
 RESULTS_DIR = os.path.join(EXTERNAL_DIR, "results")
+GT_CACHE_DIR = os.path.join(EXTERNAL_DIR, "cache")
 
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
@@ -35,57 +38,79 @@ def load_gt_trace(trace_path):
 
 def compare_traces(gt_frames, agent_frames):
     """
-    Compares ground truth frames to agent frames using SSIM (structural similarity).
-    Returns average similarity and step counts.
+    Compares ground truth frames to agent frames using SSIM (structural similarity),
+    aligning the two traces with dynamic time warping.
+    Returns average similarity, per-step similarities, the alignment and step counts.
+    Already-preprocessed (N, 320, 320) uint8 stacks are used as-is.
     """
-    min_len = min(len(gt_frames), len(agent_frames))
-    step_similarity = []
-    for i in range(min_len):
-        gt = np.array(Image.fromarray(gt_frames[i]).convert('L').resize((320, 320)))
-        ag = np.array(Image.fromarray(agent_frames[i]).convert('L').resize((320, 320)))
-        sim, _ = ssim(gt, ag, full=True)
-        step_similarity.append(sim)
-    avg_ssim = float(np.mean(step_similarity)) if step_similarity else 0.0
-    return {
-        "steps_gt": len(gt_frames),
-        "steps_agent": len(agent_frames),
-        "avg_ssim": avg_ssim,
-        "frame_similarities": step_similarity,
-    }
+    return compare_preprocessed(_as_preprocessed(gt_frames), _as_preprocessed(agent_frames))
 
-def external_validation():
-    # Load prompt mapping
-    with open(PROMPT_FILE, 'r') as f:
-        prompts = json.load(f)  # [{"trace_file": "...", "prompt": "..."}]
+def _as_preprocessed(frames):
+    if isinstance(frames, np.ndarray) and frames.dtype == np.uint8 and frames.shape[1:] == (320, 320):
+        return frames
+    return preprocess_frames([] if frames is None else frames)
 
-    summary = []
+def _validate_entry(entry, device, run_dir, session, gt_cache):
+    trace_file = entry["trace_file"]
+    prompt = entry["prompt"]
+    print(f"\n=== [Validation on {device.name}] User prompt: {prompt}")
 
-    for i, entry in enumerate(prompts):
-        trace_file = entry["trace_file"]
-        prompt = entry["prompt"]
-        print(f"\n=== [Validation #{i+1}] User prompt: {prompt}")
+    # Load preprocessed ground truth frames (cached on disk by file hash)
+    gt_frames = gt_cache.load(os.path.join(GT_TRACES_DIR, trace_file))
 
-        # Load ground truth frames
-        gt_frames = load_gt_trace(os.path.join(GT_TRACES_DIR, trace_file))
+    # Run agent pipeline on prompt in the device's warm session; logs and trace go to this run's own directory
+    session.run(prompt, log_dir=run_dir)
+    agent_frames = open_trace(os.path.join(run_dir, "visual_trace"))
 
-        # Run agent pipeline on prompt (generates logs/visual_trace.npy)
-        run_agent(prompt)  # This should overwrite logs/visual_trace.npy
-        agent_frames = np.load(os.path.join(PROJECT_ROOT, "logs", "visual_trace.npy"), allow_pickle=True)
+    # Compare traces
+    result = compare_traces(gt_frames, agent_frames)
+    print(f"  Steps in ground truth: {result['steps_gt']}")
+    print(f"  Steps by agent: {result['steps_agent']}")
+    print(f"  Avg frame SSIM: {result['avg_ssim']:.2f}")
+    return result
 
-        # Compare traces
-        result = compare_traces(gt_frames, agent_frames)
-        print(f"  Steps in ground truth: {result['steps_gt']}")
-        print(f"  Steps by agent: {result['steps_agent']}")
-        print(f"  Avg frame SSIM: {result['avg_ssim']:.2f}")
+def external_validation(devices=None):
+    """
+    :param devices: list of DeviceEndpoint; defaults to EMULATOR_DEVICES
+                    ("console:grpc[:serial],...") or the single 5554/8554 emulator.
+    """
+    # Load prompt mapping
+    with open(PROMPT_FILE, 'r') as f:
+        prompts = json.load(f)  # [{"trace_file": "...", "prompt": "..."}]
 
-        # Save per-task result
+    devices = devices or parse_devices(os.getenv("EMULATOR_DEVICES", "5554:8554"))
+    gt_cache = GroundTruthCache(GT_CACHE_DIR, load_gt_trace)
+    runner = SuiteRunner(
+        devices,
+        lambda entry, device, run_dir, session: _validate_entry(entry, device, run_dir, session, gt_cache),
+        runs_dir=os.path.join(RESULTS_DIR, "runs"),
+        session_factory=lambda device: QASession(
+            console_port=device.console_port, grpc_port=device.grpc_port, adb_serial=device.serial,
+        ),
+    )
+    outcomes = runner.run(prompts)
+
+    summary = []
+    for i, (entry, outcome) in enumerate(zip(prompts, outcomes)):
         result_out = {
-            "prompt": prompt,
-            "trace_file": trace_file,
-            "steps_gt": result["steps_gt"],
-            "steps_agent": result["steps_agent"],
-            "avg_ssim": result["avg_ssim"],
+            "prompt": entry["prompt"],
+            "trace_file": entry["trace_file"],
+            "device": outcome.get("device"),
+            "attempts": outcome.get("attempts"),
         }
+        if "error" in outcome:
+            result_out["error"] = outcome["error"]
+        else:
+            result = outcome["result"]
+            result_out.update({
+                "run_dir": outcome["run_dir"],
+                "steps_gt": result["steps_gt"],
+                "steps_agent": result["steps_agent"],
+                "avg_ssim": result["avg_ssim"],
+                "frame_similarities": result["frame_similarities"],
+                "alignment": result["alignment"],
+            })
+        # Save per-task result
         with open(os.path.join(RESULTS_DIR, f"result_{i+1}.json"), "w") as f:
             json.dump(result_out, f, indent=2)
         summary.append(result_out)
@@ -93,7 +118,7 @@ def external_validation():
     # Save all results
     with open(os.path.join(RESULTS_DIR, "summary.json"), "w") as f:
         json.dump(summary, f, indent=2)
-    print("\nAll external validation tasks completed.")
+    print(f"\nAll external validation tasks completed. Device stats: {runner.stats}")
 
 if __name__ == "__main__":
     external_validation()
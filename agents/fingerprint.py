@@ -0,0 +1,40 @@
+import hashlib
+
+STATUS_BAR_PACKAGE = "com.android.systemui"
+STATUS_BAR_MAX_HEIGHT = 100
+
+
+def _bbox_key(el):
+    bbox = getattr(el, "bbox_pixels", None)
+    if not bbox:
+        return ""
+    return f"{bbox.x_min},{bbox.y_min},{bbox.x_max},{bbox.y_max}"
+
+
+def is_status_bar(el):
+    """
+    Status-bar icons (clock, battery, signal) change on their own and say
+    nothing about which screen is showing.
+    """
+    bbox = getattr(el, "bbox_pixels", None)
+    return (
+        getattr(el, "package_name", None) == STATUS_BAR_PACKAGE
+        and bbox is not None and bbox.y_min <= 0 and bbox.y_max <= STATUS_BAR_MAX_HEIGHT
+    )
+
+
+def ui_fingerprint(ui_elements):
+    """
+    Cheap, process-stable digest of a UI tree: text, description, class,
+    position and checked/selected state of every element outside the status bar.
+    """
+    h = hashlib.blake2b(digest_size=12)
+    for el in ui_elements:
+        if is_status_bar(el):
+            continue
+        h.update((
+            f"{el.text or ''}\x1f{el.content_description or ''}\x1f{el.class_name or ''}\x1f"
+            f"{_bbox_key(el)}\x1f{int(bool(getattr(el, 'is_checked', False)))}"
+            f"{int(bool(getattr(el, 'is_selected', False)))}\x1e"
+        ).encode("utf-8", "replace"))
+    return h.hexdigest()
@@ -0,0 +1,155 @@
+import queue
+import threading
+import numpy as np
+from PIL import Image
+from agents.tracing import span
+from agents.qa_logging import get_logger
+
+log = get_logger("Capture")
+
+POLICIES = ("every_step", "on_change", "on_failure", "every_n")
+
+
+class CapturePolicy:
+    """
+    Decides which steps get a frame. Failed steps are always captured.
+
+    - ``every_step``: every step
+    - ``on_change``: only when the UI fingerprint differs from the last captured frame
+    - ``on_failure``: only failed steps
+    - ``every_n``: steps 0, n, 2n, ...
+    """
+
+    def __init__(self, mode="every_step", every_n=5):
+        if mode not in POLICIES:
+            raise ValueError(f"Unknown capture policy {mode!r}; expected one of {POLICIES}")
+        self.mode = mode
+        self.every_n = max(1, every_n)
+        self._last_fingerprint = None
+
+    def should_capture(self, step, fingerprint=None, failed=False):
+        if failed or self.mode == "every_step":
+            capture = True
+        elif self.mode == "on_change":
+            capture = fingerprint is None or fingerprint != self._last_fingerprint
+        elif self.mode == "every_n":
+            capture = step % self.every_n == 0
+        else:
+            capture = False
+        if capture:
+            self._last_fingerprint = fingerprint
+        return capture
+
+
+def downscale(frame, max_size):
+    """
+    Shrinks an RGB frame to fit within ``max_size`` (width, height), keeping the
+    aspect ratio; frames already small enough are returned as they are.
+    """
+    if max_size is None:
+        return frame
+    h, w = frame.shape[:2]
+    scale = min(max_size[0] / w, max_size[1] / h)
+    if scale >= 1:
+        return frame
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return np.asarray(Image.fromarray(np.asarray(frame, dtype=np.uint8)).resize(size, Image.BILINEAR))
+
+
+class FrameCapture:
+    """
+    Records the visual trace on a background worker so the control loop never
+    waits on rendering, resizing or compression.
+
+    ``step()`` applies the policy and enqueues the step's screenshot. The
+    pixels of the current observation are reused when there are some (no
+    extra device round trip); otherwise ``step()`` calls ``env.render()`` on
+    the caller's thread, since the env is not safe to use from two threads
+    and a later render could show a later screen than the step's.
+    The queue is bounded: when the worker falls behind, ``step()`` blocks
+    (or, with ``drop_when_full``, skips the frame), so memory stays flat.
+    """
+
+    def __init__(self, env, writer, policy=None, max_size=(540, 1200), queue_size=4, drop_when_full=False):
+        """
+        :param env: Environment whose ``render()`` is the fallback frame source (called from ``step()``).
+        :param writer: TraceWriter the frames are appended to (only the worker touches it).
+        :param policy: CapturePolicy, or a policy name.
+        :param max_size: (width, height) frames are downscaled to fit; None keeps full resolution.
+        :param queue_size: Frames waiting for the worker before ``step()`` applies backpressure.
+        :param drop_when_full: Skip frames instead of blocking when the queue is full.
+        """
+        self.env = env
+        self.writer = writer
+        self.policy = policy if isinstance(policy, CapturePolicy) else CapturePolicy(policy or "every_step")
+        self.max_size = max_size
+        self.drop_when_full = drop_when_full
+        self.captured = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = threading.Thread(target=self._run, name="frame-capture", daemon=True)
+        self._worker.start()
+
+    def step(self, i, fingerprint=None, state=None, failed=False):
+        """
+        Captures step ``i`` if the policy wants it.
+
+        :param state: Current observation; its ``pixels`` are used instead of rendering.
+        :return: True if a frame was queued.
+        """
+        if not self.policy.should_capture(i, fingerprint, failed):
+            self.skipped += 1
+            return False
+        frame = getattr(state, "pixels", None)
+        if frame is None:
+            try:
+                with span("env.render", step=i):
+                    frame = self.env.render()
+            except Exception as e:
+                self.errors += 1
+                log.warning(f"Render for step {i} failed: {e}")
+                return False
+            if frame is None:
+                log.warning(f"No frame captured at step {i} (env.render() returned None)")
+                return False
+        item = (i, frame, failed)
+        if self.drop_when_full:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                log.warning(f"Queue full; dropped frame for step {i}")
+                return False
+        else:
+            with span("capture.enqueue", step=i):
+                self._queue.put(item)
+        return True
+
+    def close(self):
+        """
+        Waits for queued frames to be written and stops the worker.
+        """
+        if self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+
+    def stats(self):
+        return {"captured": self.captured, "skipped": self.skipped, "dropped": self.dropped, "errors": self.errors}
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            i, frame, failed = item
+            try:
+                with span("capture.downscale", step=i):
+                    frame = downscale(frame, self.max_size)
+                with span("trace.append", step=i):
+                    self.writer.append(frame, step=i, failed=failed)
+                self.captured += 1
+            except Exception as e:
+                self.errors += 1
+                log.warning(f"Frame for step {i} failed: {e}")
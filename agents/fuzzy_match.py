@@ -0,0 +1,60 @@
+import difflib
+from collections import Counter
+
+
+class FuzzyMatcher:
+    """
+    Finds labels whose ``difflib.SequenceMatcher(None, query, label).ratio()``
+    exceeds a threshold, with the same results as running SequenceMatcher on
+    every label.
+
+    A character (1-gram) posting index yields, for every label sharing a
+    character with the query, the multiset overlap that bounds the ratio from
+    above (difflib's quick_ratio). Only labels passing that bound get the
+    exact computation, which reuses one SequenceMatcher per label so the
+    label side is analysed once per snapshot.
+    """
+
+    def __init__(self, labels):
+        self.labels = []
+        self._ids = {}
+        for label in labels:
+            if label not in self._ids:
+                self._ids[label] = len(self.labels)
+                self.labels.append(label)
+        self._postings = {}
+        for lid, label in enumerate(self.labels):
+            for ch, count in Counter(label).items():
+                self._postings.setdefault(ch, []).append((lid, count))
+        self._matchers = {}
+
+    def query(self, text, threshold=0.8):
+        """
+        Labels scoring strictly above ``threshold``, ranked as [(score, label)],
+        best first.
+        """
+        if not text:
+            return [(1.0, "")] if "" in self._ids and threshold < 1.0 else []
+        overlap = {}
+        for ch, qcount in Counter(text).items():
+            for lid, lcount in self._postings.get(ch, ()):
+                overlap[lid] = overlap.get(lid, 0) + min(qcount, lcount)
+
+        n = len(text)
+        hits = []
+        for lid, common in overlap.items():
+            label = self.labels[lid]
+            if 2.0 * common / (n + len(label)) <= threshold:
+                continue
+            matcher = self._matchers.get(lid)
+            if matcher is None:
+                matcher = self._matchers[lid] = difflib.SequenceMatcher(None, "", label)
+            matcher.set_seq1(text)
+            score = matcher.ratio()
+            if score > threshold:
+                hits.append((score, lid))
+        hits.sort(key=lambda h: (-h[0], h[1]))
+        return [(score, self.labels[lid]) for score, lid in hits]
+
+    def query_many(self, texts, threshold=0.8):
+        return {text: self.query(text, threshold) for text in texts}
@@ -0,0 +1,323 @@
+import os
+import time
+import queue
+import random
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from agents.tracing import span
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeoutError(LLMError):
+    pass
+
+
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self, api_key=None):
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+
+    async def complete(self, model, prompt, temperature=None, images=None):
+        kwargs = {} if temperature is None else {"temperature": temperature}
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            **kwargs,
+        )
+        return response.choices[0].message.content
+
+    async def stream(self, model, prompt, temperature=None, images=None):
+        kwargs = {} if temperature is None else {"temperature": temperature}
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            **kwargs,
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self, api_key=None):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+        self._genai = genai
+        self._models = {}
+
+    async def complete(self, model, prompt, temperature=None, images=None):
+        config = None if temperature is None else {"temperature": temperature}
+        response = await self._model(model).generate_content_async(
+            [prompt] + list(images or []), generation_config=config
+        )
+        return response.text
+
+    async def stream(self, model, prompt, temperature=None, images=None):
+        config = None if temperature is None else {"temperature": temperature}
+        response = await self._model(model).generate_content_async(
+            [prompt] + list(images or []), generation_config=config, stream=True
+        )
+        async for chunk in response:
+            yield chunk.text
+
+    def _model(self, model):
+        if model not in self._models:
+            self._models[model] = self._genai.GenerativeModel(model)
+        return self._models[model]
+
+
+class StubProvider:
+    """
+    Local provider for tests and benchmarks. ``responder`` is a string or a
+    callable(model, prompt) returning the completion text, after ``delay``
+    seconds. ``stream`` yields it in ``chunk_size`` pieces ``chunk_delay``
+    seconds apart; ``complete`` waits for the same total generation time.
+    """
+
+    def __init__(self, responder="", name="stub", delay=0.0, chunk_size=16, chunk_delay=0.0):
+        self.name = name
+        self.responder = responder
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+
+    async def complete(self, model, prompt, temperature=None, images=None):
+        text = await self._respond(model, prompt)
+        if self.chunk_delay:
+            await asyncio.sleep(self.chunk_delay * len(range(0, len(text), self.chunk_size)))
+        return text
+
+    async def stream(self, model, prompt, temperature=None, images=None):
+        text = await self._respond(model, prompt)
+        for i in range(0, len(text), self.chunk_size):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield text[i:i + self.chunk_size]
+
+    async def _respond(self, model, prompt):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.responder(model, prompt) if callable(self.responder) else self.responder
+
+
+_PROVIDER_FACTORIES = {"openai": OpenAIProvider, "gemini": GeminiProvider}
+
+
+class LLMGateway:
+    """
+    Single entry point for LLM calls. Runs an asyncio loop on a background
+    thread; sync callers use ``complete`` (blocking) or ``submit`` (returns a
+    concurrent.futures.Future). Provides per-provider concurrency limits,
+    deadlines that cancel the underlying request, exponential-backoff
+    retries, coalescing of identical in-flight requests and latency counters.
+    """
+
+    def __init__(self, providers=None, concurrency=4, timeout=60.0, retries=2, backoff=0.5, max_backoff=8.0):
+        """
+        :param providers: Provider instances; openai/gemini are created lazily when first used.
+        :param concurrency: Max in-flight requests per provider (int or {name: int}).
+        :param timeout: Default deadline in seconds per attempt.
+        :param retries: Extra attempts after a failed or timed-out call.
+        """
+        self._providers = {p.name: p for p in providers or []}
+        self._concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._semaphores = {}
+        self._inflight = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+    def register(self, provider):
+        with self._lock:
+            self._providers[provider.name] = provider
+
+    def has_provider(self, name):
+        return name in self._providers
+
+    def submit(self, provider, model, prompt, images=None, temperature=None, timeout=None, retries=None):
+        coro = self.acomplete(provider, model, prompt, images, temperature, timeout, retries)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def complete(self, provider, model, prompt, images=None, temperature=None, timeout=None, retries=None):
+        return self.submit(provider, model, prompt, images, temperature, timeout, retries).result()
+
+    def stream(self, provider, model, prompt, images=None, temperature=None, timeout=None):
+        """
+        Blocking iterator over completion chunks as they arrive. ``timeout`` bounds
+        the whole stream; streams are not retried or coalesced. Providers without
+        ``stream`` yield their full completion as one chunk.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        chunks = queue.Queue()
+        end = object()
+
+        async def pump():
+            try:
+                async for chunk in self._astream(provider, model, prompt, images, temperature):
+                    chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e if isinstance(e, LLMError) else LLMError(f"{provider}/{model} stream failed: {e}"))
+            finally:
+                chunks.put(end)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    self._stat(provider)["timeouts"] += 1
+                    raise LLMTimeoutError(f"{provider}/{model} stream timed out after {timeout}s")
+                if item is end:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    async def _astream(self, provider_name, model, prompt, images, temperature):
+        provider = self._provider(provider_name)
+        stats = self._stat(provider_name)
+        async with self._semaphore(provider_name):
+            stats["calls"] += 1
+            start = time.perf_counter()
+            try:
+                with span(f"llm.{provider_name}.stream", model=model):
+                    if hasattr(provider, "stream"):
+                        async for chunk in provider.stream(model, prompt, temperature=temperature, images=images):
+                            if chunk:
+                                yield chunk
+                    else:
+                        yield await provider.complete(model, prompt, temperature=temperature, images=images)
+            except Exception:
+                stats["errors"] += 1
+                raise
+            stats["latencies"].append(time.perf_counter() - start)
+
+    async def acomplete(self, provider, model, prompt, images=None, temperature=None, timeout=None, retries=None):
+        key = self._request_key(provider, model, prompt, images, temperature)
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stat(provider)["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._call(provider, model, prompt, images, temperature, timeout, retries))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one waiter giving up does not cancel the shared request
+        return await asyncio.shield(task)
+
+    async def _call(self, provider_name, model, prompt, images, temperature, timeout, retries):
+        provider = self._provider(provider_name)
+        semaphore = self._semaphore(provider_name)
+        stats = self._stat(provider_name)
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        error = None
+        for attempt in range(retries + 1):
+            async with semaphore:
+                start = time.perf_counter()
+                stats["calls"] += 1
+                try:
+                    with span(f"llm.{provider_name}", model=model, attempt=attempt):
+                        text = await asyncio.wait_for(
+                            provider.complete(model, prompt, temperature=temperature, images=images), timeout
+                        )
+                    stats["latencies"].append(time.perf_counter() - start)
+                    return text
+                except asyncio.TimeoutError:
+                    stats["timeouts"] += 1
+                    error = LLMTimeoutError(f"{provider_name}/{model} timed out after {timeout}s")
+                except Exception as e:
+                    stats["errors"] += 1
+                    error = e
+            if attempt < retries:
+                stats["retries"] += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+        if isinstance(error, LLMError):
+            raise error
+        raise LLMError(f"{provider_name}/{model} failed: {error}") from error
+
+    def latency_summary(self):
+        summary = {}
+        for name, stats in self._stats.items():
+            lat = sorted(stats["latencies"])
+            summary[name] = {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "timeouts": stats["timeouts"],
+                "retries": stats["retries"],
+                "coalesced": stats["coalesced"],
+                "p50": lat[int(0.5 * (len(lat) - 1))] if lat else None,
+                "p95": lat[int(0.95 * (len(lat) - 1))] if lat else None,
+            }
+        return summary
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def _provider(self, name):
+        with self._lock:
+            if name not in self._providers:
+                if name not in _PROVIDER_FACTORIES:
+                    raise LLMError(f"Unknown LLM provider '{name}'")
+                self._providers[name] = _PROVIDER_FACTORIES[name]()
+            return self._providers[name]
+
+    def _semaphore(self, name):
+        if name not in self._semaphores:
+            limit = self._concurrency.get(name, 4) if isinstance(self._concurrency, dict) else self._concurrency
+            self._semaphores[name] = asyncio.Semaphore(limit)
+        return self._semaphores[name]
+
+    def _stat(self, name):
+        if name not in self._stats:
+            self._stats[name] = {
+                "calls": 0, "errors": 0, "timeouts": 0, "retries": 0, "coalesced": 0,
+                "latencies": deque(maxlen=1000),
+            }
+        return self._stats[name]
+
+    @staticmethod
+    def _request_key(provider, model, prompt, images, temperature):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{provider}\x1f{model}\x1f{temperature}\x1f{prompt}".encode("utf-8", "replace"))
+        for img in images or []:
+            h.update(img.tobytes() if hasattr(img, "tobytes") else repr(img).encode())
+        return h.hexdigest()
+
+
+_default_gateway = None
+_default_lock = threading.Lock()
+
+
+def get_gateway():
+    """
+    Process-wide gateway shared by all agents.
+    """
+    global _default_gateway
+    with _default_lock:
+        if _default_gateway is None:
+            _default_gateway = LLMGateway()
+        return _default_gateway
@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from agents.plan_cache import normalize_prompt
+
+
+class MacroStore:
+    """
+    On-disk macros of successful runs, one JSON file per normalized prompt.
+    Each step holds the subgoal, the UI fingerprint it started from and the
+    resolved device actions the executor performed for it. A macro with fewer
+    steps than the plan it was recorded from is never loaded.
+    """
+
+    def __init__(self, path="logs/macros"):
+        self.path = path
+
+    def _file(self, task_prompt):
+        digest = hashlib.sha256(normalize_prompt(task_prompt).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.path, f"{digest}.json")
+
+    def load(self, task_prompt):
+        path = self._file(task_prompt)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                macro = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Macro] Could not read macro ({e}); ignoring it.")
+            return None
+        if macro.get("prompt") != normalize_prompt(task_prompt) or not macro.get("steps"):
+            return None
+        if macro.get("plan_steps") != len(macro["steps"]):
+            print(f"[Macro] Macro has {len(macro['steps'])} of {macro.get('plan_steps')} plan steps; ignoring it.")
+            return None
+        return macro
+
+    def save(self, task_prompt, steps, plan_steps):
+        """
+        :param plan_steps: Number of subgoals in the plan the steps were recorded from.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        path = self._file(task_prompt)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        macro = {"prompt": normalize_prompt(task_prompt), "recorded_at": time.time(), "plan_steps": plan_steps, "steps": steps}
+        with open(tmp_path, "w") as f:
+            json.dump(macro, f, indent=2)
+        os.replace(tmp_path, path)
+        print(f"[Macro] Recorded {len(steps)} steps for {task_prompt!r}")
+
+    def invalidate(self, task_prompt):
+        path = self._file(task_prompt)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+
+class MacroReplay:
+    """
+    Walks a stored macro alongside the live loop. ``guard(i, fingerprint)``
+    says whether step i can be replayed from the current screen; after the
+    first mismatch the rest of the run stays on the live planner/executor path.
+    """
+
+    def __init__(self, macro):
+        self.steps = macro["steps"]
+        self.active = True
+        self.replayed = 0
+
+    @property
+    def subgoals(self):
+        return [step["subgoal"] for step in self.steps]
+
+    def guard(self, i, fingerprint):
+        if not self.active:
+            return None
+        if i >= len(self.steps) or self.steps[i]["pre_fingerprint"] != fingerprint:
+            print(f"[Macro] Guard mismatch at step {i}; continuing on the live path.")
+            self.active = False
+            return None
+        self.replayed += 1
+        return self.steps[i]
+
+    def stop(self):
+        self.active = False
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from agents.fingerprint import is_status_bar
+from agents.qa_logging import get_logger
+
+log = get_logger("NavGraph")
+
+_save_lock = threading.Lock()
+
+
+def screen_labels(ui_elements):
+    """
+    Lower-cased texts and descriptions on a screen, status bar excluded.
+    """
+    labels = set()
+    for el in ui_elements:
+        if is_status_bar(el):
+            continue
+        for value in (el.text, el.content_description):
+            if value:
+                labels.add(value.lower())
+    return labels
+
+
+class NavGraph:
+    """
+    Screens seen across runs (nodes are UI fingerprints, labelled with their
+    visible texts) and the recorded device actions that moved between them.
+
+    ``shortest_path`` / ``path_to_label`` run a BFS over known edges, so
+    recovery can replay the fewest known actions instead of the launcher route.
+    """
+
+    def __init__(self, path="logs/nav_graph.json", max_nodes=2000):
+        """
+        :param path: JSON file the graph is persisted to.
+        :param max_nodes: Least recently seen screens (and their edges) are dropped beyond this.
+        """
+        self.path = path
+        self.max_nodes = max_nodes
+        self.nodes = {}  # fingerprint -> {"labels": [...], "last_seen": ts}
+        self.edges = {}  # fingerprint -> {fingerprint: {"actions": [...], "count": n, "last_seen": ts}}
+        self._dirty = False
+        self._forgotten = set()
+        self._load()
+
+    def observe(self, before, after, actions, ui_elements=None, navigational=True):
+        """
+        Records that ``actions`` took the device from screen ``before`` to ``after``.
+
+        :param ui_elements: The ``after`` screen, used to label the node.
+        :param navigational: False for actions that change state in place (toggles);
+                             both screens are still recorded, but no edge is, since
+                             replaying it would flip the state back.
+        """
+        now = time.time()
+        for fp in (before, after):
+            self.nodes.setdefault(fp, {"labels": [], "last_seen": now})["last_seen"] = now
+        if ui_elements is not None:
+            self.nodes[after]["labels"] = sorted(screen_labels(ui_elements))
+        if before == after or not actions or not navigational:
+            return
+        edge = self.edges.setdefault(before, {}).get(after)
+        if edge is None or edge["actions"] != actions:
+            # Latest working actions win; a changed route restarts its count
+            edge = self.edges[before][after] = {"actions": actions, "count": 0}
+        edge["count"] += 1
+        edge["last_seen"] = now
+        self._dirty = True
+
+    def forget_edge(self, before, after):
+        """
+        Drops an edge whose replay did not reach ``after``.
+        """
+        if self.edges.get(before, {}).pop(after, None) is not None:
+            self._forgotten.add((before, after))
+            self._dirty = True
+
+    def shortest_path(self, source, target):
+        """
+        Edges [{"from", "to", "actions"}] of the shortest known path, [] if already
+        there, None if ``target`` is unreachable.
+        """
+        return self._bfs(source, lambda fp: fp == target)
+
+    def path_to_label(self, source, label):
+        """
+        Shortest known path to any screen showing ``label`` (substring, case-insensitive).
+        """
+        label = label.lower()
+        return self._bfs(source, lambda fp: any(label in l for l in self.nodes.get(fp, {}).get("labels", ())))
+
+    def _bfs(self, source, is_target):
+        if is_target(source):
+            return []
+        parents = {source: None}
+        queue = deque([source])
+        while queue:
+            fp = queue.popleft()
+            for nxt, edge in self.edges.get(fp, {}).items():
+                if nxt in parents:
+                    continue
+                parents[nxt] = (fp, edge)
+                if is_target(nxt):
+                    path = []
+                    while parents[nxt] is not None:
+                        prev, e = parents[nxt]
+                        path.append({"from": prev, "to": nxt, "actions": e["actions"]})
+                        nxt = prev
+                    return path[::-1]
+                queue.append(nxt)
+        return None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def save(self):
+        """
+        Merges into the file on disk (other runs may have saved since we loaded),
+        then writes atomically.
+        """
+        if not self._dirty:
+            return
+        with _save_lock:
+            disk = NavGraph(self.path, self.max_nodes) if os.path.exists(self.path) else None
+            if disk is not None:
+                self._merge(disk)
+            self._evict()
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"nodes": self.nodes, "edges": self.edges}, f)
+            os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def _merge(self, other):
+        for fp, node in other.nodes.items():
+            mine = self.nodes.get(fp)
+            if mine is None or node["last_seen"] > mine["last_seen"]:
+                self.nodes[fp] = node
+        for fp, targets in other.edges.items():
+            for nxt, edge in targets.items():
+                if (fp, nxt) in self._forgotten:
+                    continue
+                mine = self.edges.setdefault(fp, {}).get(nxt)
+                if mine is None or edge["last_seen"] > mine["last_seen"]:
+                    self.edges[fp][nxt] = edge
+
+    def _evict(self):
+        if len(self.nodes) <= self.max_nodes:
+            return
+        keep = sorted(self.nodes, key=lambda fp: self.nodes[fp]["last_seen"])[-self.max_nodes:]
+        self.nodes = {fp: self.nodes[fp] for fp in keep}
+        self.edges = {
+            fp: {nxt: e for nxt, e in targets.items() if nxt in self.nodes}
+            for fp, targets in self.edges.items() if fp in self.nodes
+        }
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.nodes = data.get("nodes", {})
+            self.edges = data.get("edges", {})
+        except Exception as e:
+            log.warning(f"Could not load graph ({e}); starting empty.")
+            self.nodes, self.edges = {}, {}
@@ -0,0 +1,70 @@
+import threading
+from agents.tracing import span
+
+
+class ObservationManager:
+    """
+    Owns the current UI snapshot. ``current()`` returns the cached state until
+    something that changes the device calls ``invalidate()``; every fetch
+    bumps ``version`` and counts as one device round trip.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.version = 0
+        self.round_trips = 0
+        self.hits = 0
+        self._state = None
+        self._lock = threading.Lock()
+
+    def current(self, refresh=False):
+        """
+        The cached snapshot, or a stabilized fetch if it was invalidated.
+
+        :param refresh: Always fetch from the device.
+        """
+        with self._lock:
+            if self._state is not None and not refresh:
+                self.hits += 1
+                return self._state
+        return self._fetch(True)
+
+    def peek(self):
+        """
+        The cached snapshot or None; never touches the device.
+        """
+        return self._state
+
+    def poll(self):
+        """
+        Unconditional fetch without waiting to stabilize (settle polling); the
+        result becomes current, so the settled state is reused afterwards.
+        """
+        return self._fetch(False)
+
+    def update(self, state):
+        """
+        Adopts a state obtained elsewhere, e.g. from ``env.reset()``.
+        """
+        with self._lock:
+            self._state = state
+            self.version += 1
+        return state
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    @property
+    def valid(self):
+        return self._state is not None
+
+    def stats(self):
+        return {"version": self.version, "round_trips": self.round_trips, "hits": self.hits}
+
+    def _fetch(self, stabilize):
+        with span("env.get_state", stabilize=stabilize):
+            state = self.env.get_state(wait_to_stabilize=stabilize)
+        with self._lock:
+            self.round_trips += 1
+        return self.update(state)
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+SUPPORTED_ACTIONS = {"open_app_drawer", "open_app", "tap", "toggle", "verify", "scroll"}
+
+
+def normalize_prompt(task_prompt):
+    return " ".join((task_prompt or "").lower().split())
+
+
+def is_valid_plan(subgoals):
+    """
+    A plan is cacheable only if it is a non-empty list of subgoal dicts whose
+    actions the executor/verifier understand.
+    """
+    if not isinstance(subgoals, list) or not subgoals:
+        return False
+    for step in subgoals:
+        if not isinstance(step, dict) or step.get("action") not in SUPPORTED_ACTIONS:
+            return False
+    return True
+
+
+class PlanCache:
+    """
+    LRU of validated plans persisted as JSON. Safe to share between threads
+    (the streaming planner calls put() from its producer thread).
+    """
+
+    def __init__(self, path="logs/plan_cache.json", max_entries=256, ttl=7 * 24 * 3600):
+        """
+        :param path: JSON file the cache is persisted to.
+        :param max_entries: LRU capacity; least recently used plans are evicted first.
+        :param ttl: Seconds a plan stays valid (None disables expiry).
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def key(self, task_prompt, model, temperature, template=""):
+        """
+        :param template: Version of the prompt template the plan is generated
+                         with (e.g. planner_agent.PROMPT_VERSION).
+        """
+        raw = json.dumps([normalize_prompt(task_prompt), model, float(temperature), template])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, task_prompt, model, temperature, template=""):
+        key = self.key(task_prompt, model, temperature, template)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                print(f"[PlanCache] Entry expired for: {task_prompt!r}")
+                del self._entries[key]
+                self._dirty = True
+                return None
+            # Hit metadata is written with the next put() or save(), not per lookup
+            self._entries.move_to_end(key)
+            entry["hits"] = entry.get("hits", 0) + 1
+            self._dirty = True
+            return [dict(step) for step in entry["subgoals"]]
+
+    def put(self, task_prompt, model, temperature, subgoals, template=""):
+        if not is_valid_plan(subgoals):
+            print("[PlanCache] Refusing to cache invalid plan.")
+            return False
+        key = self.key(task_prompt, model, temperature, template)
+        with self._lock:
+            self._entries[key] = {
+                "prompt": normalize_prompt(task_prompt),
+                "model": model,
+                "temperature": float(temperature),
+                "template": template,
+                "subgoals": subgoals,
+                "created_at": time.time(),
+                "hits": 0,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+        return True
+
+    def invalidate(self, task_prompt, model=None, temperature=None):
+        """
+        Drops the entries for a prompt, under every template version. With
+        model/temperature omitted, every entry for that prompt is dropped.
+        """
+        with self._lock:
+            prompt = normalize_prompt(task_prompt)
+            keys = [
+                k for k, e in self._entries.items()
+                if e["prompt"] == prompt
+                and (model is None or e["model"] == model)
+                and (temperature is None or e["temperature"] == float(temperature))
+            ]
+            removed = 0
+            for k in keys:
+                if self._entries.pop(k, None) is not None:
+                    removed += 1
+            if removed:
+                self._save()
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._save()
+
+    def purge_expired(self):
+        with self._lock:
+            expired = [k for k, e in self._entries.items() if self._expired(e)]
+            for k in expired:
+                del self._entries[k]
+            if expired:
+                self._save()
+        return len(expired)
+
+    def save(self):
+        """
+        Writes pending hit counts, LRU order and expiries; a no-op if nothing changed.
+        """
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, entry):
+        return self.ttl is not None and time.time() - entry["created_at"] > self.ttl
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            for k, e in data.get("entries", []):
+                if is_valid_plan(e.get("subgoals")):
+                    self._entries[k] = e
+        except Exception as e:
+            print(f"[PlanCache] Could not load cache ({e}); starting empty.")
+            self._entries.clear()
+
+    def _save(self):
+        # Callers hold self._lock
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": list(self._entries.items())}, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
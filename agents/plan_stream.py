@@ -0,0 +1,170 @@
+import json
+import threading
+from agents.tracing import span
+from agents.qa_logging import get_logger
+
+log = get_logger("Planner")
+
+
+class JSONArrayStream:
+    """
+    Incremental parser for a streamed top-level JSON array. ``feed`` returns
+    every element whose closing brace/bracket has arrived; anything before the
+    opening ``[`` (prose, code fences) is skipped. An element that fails to
+    parse is counted in ``errors`` and dropped without losing its neighbours.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.done = False
+        self.errors = 0
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+        self._buf = []
+
+    def feed(self, chunk):
+        items = []
+        for ch in chunk:
+            if self.done:
+                break
+            if not self.started:
+                self.started = ch == "["
+                continue
+            if self._in_str:
+                if self._depth:
+                    self._buf.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+            if self._depth == 0:
+                # Between elements: only containers are collected
+                if ch == "]":
+                    self.done = True
+                elif ch in "{[":
+                    self._depth = 1
+                    self._buf = [ch]
+                elif ch == '"':
+                    self._in_str = True
+                continue
+            self._buf.append(ch)
+            if ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        items.append(json.loads("".join(self._buf)))
+                    except ValueError:
+                        self.errors += 1
+                    self._buf = []
+        return items
+
+    @property
+    def truncated(self):
+        """
+        True if the input ended before the closing ``]``.
+        """
+        return self.started and not self.done
+
+
+def parse_json_array(text):
+    """
+    Elements of the first JSON array in ``text``, keeping every well-formed
+    element even if others (or the end of the array) are broken.
+
+    :return: (items, complete); complete is False if the array never closed
+             or any element failed to parse.
+    """
+    parser = JSONArrayStream()
+    items = parser.feed(text)
+    if not parser.started:
+        raise ValueError("no JSON array in output")
+    return items, parser.done and not parser.errors
+
+
+class StreamingPlan:
+    """
+    Subgoal list filled by a background thread while the planner streams, so
+    the main loop can execute step 0 before the plan is complete.
+
+    ``complete`` tells, once finished, whether the plan arrived in full: False
+    if the stream failed or the source generator returned False (as
+    PlannerAgent.stream_subgoals does for a truncated or malformed array).
+    """
+
+    def __init__(self, subgoals):
+        """
+        :param subgoals: Iterable yielding subgoal dicts, e.g. PlannerAgent.stream_subgoals().
+        """
+        self._items = []
+        self._finished = False
+        self._cond = threading.Condition()
+        self.error = None
+        self.complete = False
+        self._thread = threading.Thread(target=self._consume, args=(subgoals,), name="plan-stream", daemon=True)
+        self._thread.start()
+
+    def _consume(self, subgoals):
+        try:
+            with span("planner.stream_plan"):
+                iterator = iter(subgoals)
+                while True:
+                    try:
+                        subgoal = next(iterator)
+                    except StopIteration as stop:
+                        self.complete = stop.value is not False
+                        break
+                    with self._cond:
+                        self._items.append(subgoal)
+                        self._cond.notify_all()
+        except Exception as e:
+            self.error = e
+            log.error(f"Plan stream failed: {e}")
+        finally:
+            with self._cond:
+                self._finished = True
+                self._cond.notify_all()
+
+    def has_step(self, i, timeout=None):
+        """
+        Blocks until step ``i`` has arrived (True) or the stream ended without it (False).
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._items) > i or self._finished, timeout)
+            return len(self._items) > i
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def result(self, timeout=None):
+        """
+        The complete plan once streaming has finished.
+        """
+        self._thread.join(timeout)
+        with self._cond:
+            return list(self._items)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def __getitem__(self, i):
+        with self._cond:
+            return self._items[i]
+
+
+def has_step(subgoals, i):
+    """
+    ``i < len(subgoals)``, waiting for streamed plans to deliver step ``i``.
+    """
+    if isinstance(subgoals, StreamingPlan):
+        return subgoals.has_step(i)
+    return i < len(subgoals)
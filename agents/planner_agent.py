@@ -1,15 +1,11 @@
-import os
 import json
-from openai import OpenAI
+import hashlib
+from agents.plan_cache import PlanCache, is_valid_plan
+from agents.llm_gateway import get_gateway
+from agents.tracing import span
+from agents.plan_stream import JSONArrayStream, parse_json_array
 
-class PlannerAgent:
-    def __init__(self, task_prompt: str, model: str = "gpt-3.5-turbo"):
-        self.task_prompt = task_prompt
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = model
-
-    def generate_subgoals(self):
-        prompt = f"""
+PLANNER_PROMPT = """
 You are a mobile QA planner.
 
 Your job is to convert a high-level natural language goal into a **sequence of JSON subgoals** for automated testing on Android.
@@ -37,20 +33,133 @@ Subgoals:
   {{ "action": "verify", "label": "Wi-Fi", "state": "off" }}
 ]
 
+{context}
 Now generate subgoals for:
-"{self.task_prompt}"
+"{task}"
 Only return a valid JSON array.
 """
+
+# Part of every plan cache key: editing the prompt retires plans made with the old one
+PROMPT_VERSION = hashlib.sha256(PLANNER_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+class PlannerAgent:
+    def __init__(
+        self,
+        task_prompt: str,
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.3,
+        cache=None,
+        gateway=None,
+        provider: str = "openai",
+        timeout: float = 30.0,
+    ):
+        self.task_prompt = task_prompt
+        self.gateway = gateway or get_gateway()
+        self.provider = provider
+        self.model = model
+        self.temperature = temperature
+        self.timeout = timeout
+        self.cache = cache if cache is not None else PlanCache()
+        # Whether the last plan from generate_subgoals/generate_suffix arrived in full
+        self.complete = False
+
+    def generate_subgoals(self, use_cache=True, refresh=False):
+        """
+        :param use_cache: If False, always call the LLM and leave the cache untouched.
+        :param refresh: If True, skip the cached plan and overwrite it with the new one.
+        """
+        if use_cache and not refresh:
+            cached = self.cache.get(self.task_prompt, self.model, self.temperature, PROMPT_VERSION)
+            if cached is not None:
+                print(f"[Planner] Using cached plan ({len(cached)} subgoals).")
+                self.complete = True
+                return cached
+
+        subgoals, self.complete = self._request_subgoals()
+        if use_cache and self.complete and is_valid_plan(subgoals):
+            self.cache.put(self.task_prompt, self.model, self.temperature, subgoals, PROMPT_VERSION)
+        return subgoals
+
+    def stream_subgoals(self, use_cache=True, refresh=False):
+        """
+        Like generate_subgoals, but yields each subgoal as soon as its JSON object
+        has streamed in. If the stream breaks off, the complete subgoals received
+        so far are kept; only a plan that streamed in full and cleanly is cached.
+        Returns (as the generator's value, see StreamingPlan.complete) whether it did.
+        """
+        if use_cache and not refresh:
+            cached = self.cache.get(self.task_prompt, self.model, self.temperature, PROMPT_VERSION)
+            if cached is not None:
+                print(f"[Planner] Using cached plan ({len(cached)} subgoals).")
+                yield from cached
+                return True
+
+        parser = JSONArrayStream()
+        subgoals = []
+        dropped = 0
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
+            chunks = self.gateway.stream(
+                self.provider, self.model, self._build_prompt(), temperature=self.temperature, timeout=self.timeout
             )
-            message = response.choices[0].message.content
-            subgoals = json.loads(message)
-            return subgoals
+            for chunk in chunks:
+                for subgoal in parser.feed(chunk):
+                    if not isinstance(subgoal, dict):
+                        dropped += 1
+                        continue
+                    subgoals.append(subgoal)
+                    yield subgoal
+        except Exception as e:
+            print(f"[Planner Error] {e}")
+        if parser.truncated or parser.errors or dropped:
+            print(f"[Planner] Plan stream incomplete; keeping {len(subgoals)} well-formed subgoals.")
+        if not subgoals:
+            yield {"action": "noop"}
+            return False
+        complete = parser.done and not parser.errors and not dropped
+        if use_cache and complete and is_valid_plan(subgoals):
+            self.cache.put(self.task_prompt, self.model, self.temperature, subgoals, PROMPT_VERSION)
+        return complete
+
+    def generate_suffix(self, completed, failed_step=None, reason=""):
+        """
+        Plans only the remaining subgoals, starting from the screen produced by
+        ``completed`` (the subgoals already executed and verified). Not cached.
+        """
+        context = (
+            "Progress so far (these subgoals were already executed and verified; "
+            "the device is currently on the screen they produced):\n"
+            f"{json.dumps(completed)}\n"
+        )
+        if failed_step is not None:
+            context += f"The next subgoal failed: {json.dumps(failed_step)} (reason: {reason or 'unknown'}).\n"
+        context += "Return ONLY the remaining subgoals needed from the current screen; do not repeat the steps above.\n"
+        print(f"[Planner] Requesting suffix plan after {len(completed)} completed subgoals.")
+        subgoals, self.complete = self._request_subgoals(context)
+        return subgoals
+
+    def _request_subgoals(self, context=""):
+        """
+        Returns (subgoals, complete). A broken array keeps its well-formed
+        subgoals but is not complete; with none left the plan is a failing noop.
+        """
+        try:
+            with span("planner.llm", model=self.model, suffix=bool(context)):
+                message = self.gateway.complete(
+                    self.provider, self.model, self._build_prompt(context),
+                    temperature=self.temperature, timeout=self.timeout
+                )
+            items, complete = parse_json_array(message)
+            subgoals = [s for s in items if isinstance(s, dict)]
+            if not subgoals:
+                raise ValueError("no subgoals in output")
+            if not complete or len(subgoals) < len(items):
+                print(f"[Planner] Plan incomplete; keeping {len(subgoals)} well-formed subgoals.")
+                complete = False
+            return subgoals, complete
 
         except Exception as e:
             print(f"[Planner Error] {e}")
-            return [{"action": "noop"}]
+            return [{"action": "noop"}], False
+
+    def _build_prompt(self, context=""):
+        return PLANNER_PROMPT.format(context=context, task=self.task_prompt)
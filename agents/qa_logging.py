@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import logging
+
+LOG_LEVEL_ENV = "QA_LOG_LEVEL"
+TEST_LOG_KEYS = ("agent", "action", "status", "reason")
+
+_root = logging.getLogger("qa")
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _root.addHandler(_handler)
+    _root.propagate = False
+    _root.setLevel(os.getenv(LOG_LEVEL_ENV, "INFO").upper())
+
+
+def set_log_level(level):
+    _root.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+class QALogger:
+    """
+    Leveled logger that keeps the "[Agent] message" console format.
+
+    ``msg`` may be a zero-argument callable; it is only called (and
+    %-style ``args`` only applied) when the level is enabled, so dumps of
+    large UI trees cost nothing at INFO.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._logger = logging.getLogger(f"qa.{prefix.lower()}")
+
+    def enabled(self, level):
+        return self._logger.isEnabledFor(level)
+
+    def debug(self, msg, *args):
+        self._log(logging.DEBUG, msg, args)
+
+    def info(self, msg, *args):
+        self._log(logging.INFO, msg, args)
+
+    def warning(self, msg, *args):
+        self._log(logging.WARNING, msg, args)
+
+    def error(self, msg, *args):
+        self._log(logging.ERROR, msg, args)
+
+    def _log(self, level, msg, args):
+        if not self._logger.isEnabledFor(level):
+            return
+        if callable(msg):
+            msg = msg()
+        elif args:
+            msg = msg % args
+        self._logger.log(level, f"[{self.prefix}] {msg}")
+
+
+def get_logger(prefix):
+    return QALogger(prefix)
+
+
+def format_ui(ui_elements, indent="    "):
+    """
+    One line per element; pass as ``lambda: format_ui(...)`` so it only runs at DEBUG.
+    """
+    return "\n".join(
+        f"{indent}[UI] TEXT='{el.text}' | CLASS='{el.class_name}' | BBOX={getattr(el, 'bbox_pixels', None)}"
+        for el in ui_elements
+    )
+
+
+class StepLog:
+    """
+    Append-only JSONL step log, flushed after every record so a crash keeps
+    every completed step.
+    """
+
+    def __init__(self, path="logs/test_log.jsonl", fsync=False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.fsync = fsync
+        self.count = 0
+        self._file = open(path, "w")
+
+    def append(self, record):
+        record = dict(record)
+        record.setdefault("ts", time.time())
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.count += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_step_log(path):
+    """
+    Records from a JSONL step log; a truncated last line (crash mid-write) is skipped.
+    """
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+def to_test_log(records):
+    """
+    Converts step records to the test_log.json shape SupervisorAgent expects.
+    """
+    return [{k: r.get(k, "") for k in TEST_LOG_KEYS} for r in records]
+
+
+def write_test_log(jsonl_path, json_path):
+    logs = to_test_log(read_step_log(jsonl_path)) if os.path.exists(jsonl_path) else []
+    with open(json_path, "w") as f:
+        json.dump(logs, f, indent=2)
+    return logs
@@ -0,0 +1,220 @@
+import os
+import time
+import json
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL,
+    device TEXT,
+    started_at REAL NOT NULL,
+    duration_ms REAL,
+    completed INTEGER NOT NULL,
+    replans INTEGER NOT NULL,
+    steps INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    step INTEGER,
+    agent TEXT,
+    action TEXT,
+    label TEXT,
+    status TEXT,
+    reason TEXT,
+    duration_ms REAL,
+    replans INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs(started_at);
+CREATE INDEX IF NOT EXISTS steps_run ON steps(run_id);
+CREATE INDEX IF NOT EXISTS steps_label ON steps(label, run_id, status);
+CREATE INDEX IF NOT EXISTS steps_action_latency ON steps(action, duration_ms);
+"""
+
+
+def step_label(action):
+    """
+    The subgoal's target as stored in the ``label`` column.
+    """
+    if not isinstance(action, dict):
+        return None
+    label = action.get("label") or action.get("name") or action.get("direction")
+    return label.lower() if isinstance(label, str) else label
+
+
+class RunHistory:
+    """
+    Append-only SQLite store of every run and its step records, indexed for
+    the aggregates the Supervisor reports across runs: flaky subgoal labels,
+    p95 step latency per action type and recovery success after replans.
+
+    Sessions on several devices may share one file; SQLite's WAL journal
+    lets them append concurrently.
+    """
+
+    def __init__(self, path="logs/run_history.sqlite3"):
+        """
+        :param path: Database file; ":memory:" for a throwaway store.
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def record_run(self, task, records, device=None, completed=False, duration_ms=None, started_at=None, replans=None):
+        """
+        Appends one run and its step records (the test_log.jsonl dicts). Returns the run id.
+
+        :param replans: The run's replan count; step records only carry the count
+                        before their own step, so without it the last replan is missed.
+        """
+        if replans is None:
+            replans = max((r.get("replans", 0) for r in records), default=0)
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO runs (task, device, started_at, duration_ms, completed, replans, steps) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task, device, started_at or time.time(), duration_ms, int(bool(completed)), replans, len(records)),
+            )
+            run_id = cur.lastrowid
+            self._conn.executemany(
+                "INSERT INTO steps (run_id, step, agent, action, label, status, reason, duration_ms, replans) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id, r.get("step"), r.get("agent"),
+                        r["action"].get("action") if isinstance(r.get("action"), dict) else r.get("action"),
+                        step_label(r.get("action")), r.get("status"), r.get("reason"),
+                        r.get("duration_ms"), r.get("replans", 0),
+                    )
+                    for r in records
+                ],
+            )
+        return run_id
+
+    def run_count(self):
+        return self._query("SELECT COUNT(*) FROM runs")[0][0]
+
+    def flakiness(self, last_runs=None, min_runs=3, limit=10):
+        """
+        Labels that both passed and failed across runs, flakiest (closest to a
+        50% failure rate) first: [{"label", "runs", "failed_runs", "fail_rate"}].
+        A run counts as failed for a label if any of its steps on it failed.
+
+        :param last_runs: Only consider the most recent N runs.
+        """
+        rows = self._query(
+            f"""
+            WITH per_run AS (
+                SELECT label, run_id, MAX(status = 'fail') AS failed
+                FROM steps
+                WHERE label IS NOT NULL AND status != 'skip' {self._window(last_runs)}
+                GROUP BY label, run_id
+            )
+            SELECT label, COUNT(*) AS runs, SUM(failed) AS failed_runs
+            FROM per_run
+            GROUP BY label
+            HAVING runs >= ? AND failed_runs > 0 AND failed_runs < runs
+            ORDER BY ABS(0.5 - 1.0 * failed_runs / runs), runs DESC
+            LIMIT ?
+            """,
+            self._window_args(last_runs) + (min_runs, limit),
+        )
+        return [{"label": l, "runs": n, "failed_runs": f, "fail_rate": f / n} for l, n, f in rows]
+
+    def latency_by_action(self, last_runs=None, quantile=0.95):
+        """
+        {action: {"n", "p50_ms", "p95_ms"}} over step durations (nearest-rank percentiles).
+        """
+        rows = self._query(
+            f"""
+            WITH ranked AS (
+                SELECT action, duration_ms,
+                       ROW_NUMBER() OVER (PARTITION BY action ORDER BY duration_ms) AS rank,
+                       COUNT(*) OVER (PARTITION BY action) AS n
+                FROM steps
+                WHERE duration_ms IS NOT NULL AND action IS NOT NULL {self._window(last_runs)}
+            )
+            SELECT action, n,
+                   MIN(CASE WHEN rank >= 0.5 * n THEN duration_ms END),
+                   MIN(CASE WHEN rank >= ? * n THEN duration_ms END)
+            FROM ranked
+            GROUP BY action
+            ORDER BY action
+            """,
+            self._window_args(last_runs) + (quantile,),
+        )
+        return {a: {"n": n, "p50_ms": p50, "p95_ms": p95} for a, n, p50, p95 in rows}
+
+    def recovery(self, last_runs=None):
+        """
+        {"runs", "replanned", "recovered", "rate"}: of the runs that replanned,
+        the fraction that still completed their plan.
+        """
+        where = "WHERE id IN (SELECT id FROM runs ORDER BY id DESC LIMIT ?)" if last_runs else ""
+        runs, replanned, recovered = self._query(
+            f"SELECT COUNT(*), COALESCE(SUM(replans > 0), 0), COALESCE(SUM(replans > 0 AND completed), 0) FROM runs {where}",
+            (last_runs,) if last_runs else (),
+        )[0]
+        return {"runs": runs, "replanned": replanned, "recovered": recovered, "rate": recovered / replanned if replanned else None}
+
+    def pass_rate(self, last_runs=None, offset=0):
+        """
+        Fraction of runs that completed, over the ``last_runs`` runs before the latest ``offset``.
+        """
+        limit = last_runs if last_runs else -1
+        n, completed = self._query(
+            "SELECT COUNT(*), COALESCE(SUM(completed), 0) FROM (SELECT completed FROM runs ORDER BY id DESC LIMIT ? OFFSET ?)",
+            (limit, offset),
+        )[0]
+        return completed / n if n else None
+
+    def trends(self, window=50):
+        """
+        Latest ``window`` runs against the ``window`` before them.
+        """
+        return {
+            "runs": self.run_count(),
+            "window": window,
+            "pass_rate": self.pass_rate(window),
+            "previous_pass_rate": self.pass_rate(window, offset=window),
+            "recovery": self.recovery(window),
+            "latency": self.latency_by_action(window),
+            "flaky": self.flakiness(window),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _window(self, last_runs):
+        return "AND run_id IN (SELECT id FROM runs ORDER BY id DESC LIMIT ?)" if last_runs else ""
+
+    def _window_args(self, last_runs):
+        return (last_runs,) if last_runs else ()
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+
+def format_trends(trends):
+    """
+    Console lines for RunHistory.trends(), in the style of the Supervisor metrics.
+    """
+    def pct(value):
+        return "n/a" if value is None else f"{value:.2f}"
+
+    lines = [f" - Runs recorded: {trends['runs']} (trends over the last {trends['window']})"]
+    lines.append(f" - Pass rate: {pct(trends['pass_rate'])} (previous window: {pct(trends['previous_pass_rate'])})")
+    rec = trends["recovery"]
+    lines.append(f" - Recovery after replanning: {pct(rec['rate'])} ({rec['recovered']}/{rec['replanned']} runs)")
+    for action, stats in trends["latency"].items():
+        lines.append(f" - {action}: n={stats['n']} p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms")
+    for flaky in trends["flaky"]:
+        lines.append(f" - Flaky: {json.dumps(flaky['label'])} failed in {flaky['failed_runs']}/{flaky['runs']} runs")
+    return "\n".join(lines)
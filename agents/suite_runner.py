@@ -0,0 +1,235 @@
+import os
+import threading
+import traceback
+from collections import deque
+from agents.adb_session import AdbError
+
+try:
+    from grpc import RpcError
+except ImportError:  # grpc comes with android_world
+    RpcError = AdbError
+
+# Exceptions that mean the device or its connection failed, not the task. Not
+# OSError as a whole: a missing or unreadable local file is the task's problem.
+INFRA_ERRORS = (ConnectionError, BrokenPipeError, TimeoutError, EOFError, AdbError, RpcError)
+
+
+class DeviceEndpoint:
+    def __init__(self, console_port, grpc_port, serial=None):
+        self.console_port = int(console_port)
+        self.grpc_port = int(grpc_port)
+        self.serial = serial or f"emulator-{self.console_port}"
+
+    @property
+    def name(self):
+        return self.serial
+
+    def __repr__(self):
+        return f"DeviceEndpoint({self.console_port}, {self.grpc_port}, {self.serial!r})"
+
+
+def parse_devices(spec):
+    """
+    Parses "console:grpc[:serial],..." e.g. "5554:8554,5556:8556".
+    """
+    devices = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        fields = part.split(":")
+        devices.append(DeviceEndpoint(fields[0], fields[1], fields[2] if len(fields) > 2 else None))
+    return devices
+
+
+class _Task:
+    def __init__(self, index, payload):
+        self.index = index
+        self.payload = payload
+        self.attempts = 0
+        self.failed_on = set()
+
+
+class SuiteRunner:
+    """
+    Runs a list of tasks across a pool of devices, one worker thread per
+    device. Tasks are sharded round-robin into per-device queues; an idle
+    worker steals from the back of the busiest queue. An ``infra_errors``
+    exception raised by ``run_task`` is treated as an infrastructure failure
+    and the task is re-queued on a device it has not failed on yet; any other
+    exception is a task error, recorded once without retrying or counting
+    against the device.
+
+    With a ``session_factory`` each worker keeps one warm session for its
+    device across tasks; a session whose task raised is closed and rebuilt
+    before the device's next task.
+    """
+
+    def __init__(
+        self, devices, run_task, runs_dir="logs/runs", max_attempts=2, max_device_failures=3, session_factory=None,
+        infra_errors=INFRA_ERRORS
+    ):
+        """
+        :param devices: list of DeviceEndpoint.
+        :param run_task: callable(payload, device, run_dir) -> result dict, or
+                         callable(payload, device, run_dir, session) with a ``session_factory``.
+        :param session_factory: callable(device) -> session with a ``close()`` (e.g. main.QASession).
+        :param infra_errors: Exception types that count as infrastructure failures.
+        :param runs_dir: Each attempt gets its own sub-directory here.
+        :param max_attempts: Attempts per task before it is recorded as an infra error.
+        :param max_device_failures: Consecutive infra failures before a device is retired.
+        """
+        if not devices:
+            raise ValueError("SuiteRunner needs at least one device")
+        self.devices = list(devices)
+        self.run_task = run_task
+        self.runs_dir = runs_dir
+        self.max_attempts = max_attempts
+        self.max_device_failures = max_device_failures
+        self.session_factory = session_factory
+        self.infra_errors = infra_errors
+        self._sessions = {}  # device name -> session; each is only used by its device's worker
+        self._queues = {d.name: deque() for d in self.devices}
+        self._healthy = {d.name for d in self.devices}
+        self._cond = threading.Condition()
+        self._outstanding = 0
+        self._results = {}
+        self.stats = {d.name: {"completed": 0, "stolen": 0, "infra_failures": 0, "task_errors": 0, "sessions": 0} for d in self.devices}
+
+    def run(self, payloads):
+        """
+        :return: results in the same order as ``payloads``.
+        """
+        tasks = [_Task(i, p) for i, p in enumerate(payloads)]
+        with self._cond:
+            for i, task in enumerate(tasks):
+                self._queues[self.devices[i % len(self.devices)].name].append(task)
+            self._outstanding = len(tasks)
+
+        workers = [threading.Thread(target=self._worker, args=(d,), name=f"suite-{d.name}") for d in self.devices]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        return [self._results.get(i) for i in range(len(tasks))]
+
+    def _worker(self, device):
+        try:
+            self._work(device)
+        finally:
+            self._close_session(device)
+
+    def _work(self, device):
+        consecutive_failures = 0
+        while True:
+            task = self._next_task(device)
+            if task is None:
+                return
+            task.attempts += 1
+            run_dir = os.path.join(self.runs_dir, f"task_{task.index:03d}_{device.name}_try{task.attempts}")
+            os.makedirs(run_dir, exist_ok=True)
+            try:
+                if self.session_factory is None:
+                    result = self.run_task(task.payload, device, run_dir)
+                else:
+                    result = self.run_task(task.payload, device, run_dir, self._session(device))
+            except self.infra_errors as e:
+                consecutive_failures += 1
+                self.stats[device.name]["infra_failures"] += 1
+                print(f"[Suite] Infra failure on {device.name} for task {task.index}: {e}")
+                self._close_session(device)
+                self._requeue_or_fail(task, device, e)
+                if consecutive_failures >= self.max_device_failures:
+                    self._retire(device)
+                    return
+                continue
+            except Exception as e:
+                print(f"[Suite] Task {task.index} failed on {device.name}: {type(e).__name__}: {e}")
+                self.stats[device.name]["task_errors"] += 1
+                self._finish(task, {
+                    "device": device.name,
+                    "run_dir": run_dir,
+                    "attempts": task.attempts,
+                    "error": f"{type(e).__name__}: {e}",
+                    "traceback": traceback.format_exc(),
+                })
+                continue
+            consecutive_failures = 0
+            self.stats[device.name]["completed"] += 1
+            self._finish(task, {"device": device.name, "run_dir": run_dir, "attempts": task.attempts, "result": result})
+
+    def _session(self, device):
+        session = self._sessions.get(device.name)
+        if session is None:
+            session = self._sessions[device.name] = self.session_factory(device)
+            self.stats[device.name]["sessions"] += 1
+        return session
+
+    def _close_session(self, device):
+        session = self._sessions.pop(device.name, None)
+        if session is None:
+            return
+        try:
+            session.close()
+        except Exception as e:
+            print(f"[Suite] Could not close session on {device.name}: {e}")
+
+    def _next_task(self, device):
+        with self._cond:
+            while True:
+                if self._outstanding == 0 or device.name not in self._healthy:
+                    return None
+                own = self._queues[device.name]
+                if own:
+                    return own.popleft()
+                victim = max(self._queues.values(), key=len)
+                if victim:
+                    # Prefer a task this device has not already failed
+                    for k in range(len(victim) - 1, -1, -1):
+                        if device.name not in victim[k].failed_on:
+                            task = victim[k]
+                            del victim[k]
+                            self.stats[device.name]["stolen"] += 1
+                            return task
+                self._cond.wait(timeout=0.5)
+
+    def _requeue_or_fail(self, task, device, error):
+        task.failed_on.add(device.name)
+        with self._cond:
+            if task.attempts >= self.max_attempts or not self._healthy:
+                self._finish_locked(task, {
+                    "device": device.name,
+                    "attempts": task.attempts,
+                    "error": f"{type(error).__name__}: {error}",
+                    "traceback": traceback.format_exc(),
+                })
+                return
+            candidates = [n for n in self._healthy if n not in task.failed_on] or list(self._healthy)
+            target = min(candidates, key=lambda n: len(self._queues[n]))
+            self._queues[target].appendleft(task)
+            self._cond.notify_all()
+
+    def _retire(self, device):
+        print(f"[Suite] Retiring {device.name} after {self.max_device_failures} consecutive infra failures")
+        with self._cond:
+            self._healthy.discard(device.name)
+            orphaned = self._queues[device.name]
+            self._queues[device.name] = deque()
+            if not self._healthy:
+                while orphaned:
+                    task = orphaned.popleft()
+                    self._finish_locked(task, {"device": None, "attempts": task.attempts, "error": "no healthy devices left"})
+                return
+            for task in orphaned:
+                target = min(self._healthy, key=lambda n: len(self._queues[n]))
+                self._queues[target].append(task)
+            self._cond.notify_all()
+
+    def _finish(self, task, result):
+        with self._cond:
+            self._finish_locked(task, result)
+
+    def _finish_locked(self, task, result):
+        self._results[task.index] = result
+        self._outstanding -= 1
+        self._cond.notify_all()
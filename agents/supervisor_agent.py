@@ -1,61 +1,171 @@
 import os
+import re
 import json
+import hashlib
+import multiprocessing
 import numpy as np
 from PIL import Image
-import google.generativeai as genai
-import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from agents.trace_store import open_trace
+from agents.llm_gateway import get_gateway, GeminiProvider
+from agents.qa_logging import read_step_log, to_test_log
+from agents.tracing import get_tracer, format_summary
+from agents.context_compactor import ContextCompactor
+from agents.run_history import format_trends
+
+FRAME_MANIFEST = "manifest.json"
+FRAME_FILE_RE = re.compile(r"^frame_(\d+)\.png$")
+# Encoder processes must not be forked: the gateway loop, ADB pumps, plan
+# streams and other devices' workers are running threads at this point
+_POOL_CONTEXT = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _encode_png(frame, path):
+    Image.fromarray(frame).save(path)
+    return path
+
 
 class SupervisorAgent:
     def __init__(
         self,
         log_path="logs/test_log.json",
-        trace_path="logs/visual_trace.npy",
+        trace_path="logs/visual_trace",
         img_dir="logs/frames",
-        gemini_api_key=None
+        gemini_api_key=None,
+        export_workers=None,
+        gateway=None,
+        model="gemini-2.5-pro",
+        feedback_timeout=45,
+        context_tokens=3000,
+        history=None,
+        trend_window=50
     ):
+        """
+        :param context_tokens: Token budget for the test log table in the feedback prompt.
+        :param history: RunHistory to report cross-run trends from.
+        :param trend_window: Runs per trend window (latest window vs the one before).
+        """
         self.log_path = log_path
         self.trace_path = trace_path
         self.img_dir = img_dir
+        self.export_workers = export_workers or os.cpu_count() or 1
+        self.model = model
+        self.feedback_timeout = feedback_timeout
+        self.gateway = gateway
+        self.compactor = ContextCompactor(context_tokens)
+        self.history = history
+        self.trend_window = trend_window
         self.gemini_api_key = gemini_api_key or os.getenv("GEMINI_API_KEY")
         if not self.gemini_api_key:
             print("[Supervisor] WARNING: No GEMINI_API_KEY provided. LLM feedback will be skipped.")
         else:
-            genai.configure(api_key=self.gemini_api_key)
-            self.model = genai.GenerativeModel("gemini-2.5-pro") 
+            self.gateway = gateway or get_gateway()
+            if not self.gateway.has_provider("gemini"):
+                self.gateway.register(GeminiProvider(self.gemini_api_key))
 
-    def review(self):
-        # Load logs
-        if not os.path.exists(self.log_path):
+    def review(self, wait=True, trace_since=0):
+        """
+        :param wait: If False, return the pending Gemini feedback future instead of
+                     blocking on it, so the caller can move on to the next task.
+        :param trace_since: Tracer mark where this task's spans start.
+        """
+        tracer = get_tracer()
+        # Load logs, falling back to the streamed JSONL step log (e.g. after a crash)
+        step_log_path = os.path.splitext(self.log_path)[0] + ".jsonl"
+        if os.path.exists(self.log_path):
+            with open(self.log_path) as f:
+                logs = json.load(f)
+        elif os.path.exists(step_log_path):
+            logs = to_test_log(read_step_log(step_log_path))
+        else:
             print("[Supervisor] No log file found.")
             return
-        with open(self.log_path) as f:
-            logs = json.load(f)
 
-        # Load visual traces
-        if os.path.exists(self.trace_path):
-            visual_trace = np.load(self.trace_path, allow_pickle=True)
+        # Open visual trace (frames are read lazily)
+        visual_trace = open_trace(self.trace_path)
+        if visual_trace is not None:
             print(f"[Supervisor] Loaded {len(visual_trace)} frames from {self.trace_path}")
         else:
             print(f"[Supervisor] No visual trace file found at {self.trace_path}")
             visual_trace = []
 
         # Save trace as images for review
-        self._save_frames(visual_trace)
-        self._report_metrics(logs)
+        with tracer.span("supervisor.save_frames"):
+            self._save_frames(visual_trace)
+        self._report_metrics(logs, tracer.summary(trace_since) if tracer.enabled else None)
         if self.gemini_api_key:
-            self._llm_feedback(logs)
+            future = self._llm_feedback(logs)
+            if not wait:
+                return future
+            try:
+                future.result()
+            except Exception:
+                pass  # already reported by the done-callback
         else:
             print("[Supervisor] Skipping Gemini feedback (no API key).")
 
     def _save_frames(self, visual_trace):
         if not os.path.exists(self.img_dir):
             os.makedirs(self.img_dir)
-        for i, frame in enumerate(visual_trace):
-            if isinstance(frame, np.ndarray):
-                img = Image.fromarray(frame.astype("uint8"))
-                img.save(os.path.join(self.img_dir, f"frame_{i:03d}.png"))
+        previous = {e["file"]: e["hash"] for e in self._load_manifest()}
 
-    def _report_metrics(self, logs):
+        manifest, encoded = [], 0
+        pool, in_flight = None, set()
+        try:
+            for i, frame in enumerate(visual_trace):
+                if not isinstance(frame, np.ndarray):
+                    continue
+                frame = np.array(frame, dtype="uint8")
+                name = f"frame_{i:03d}.png"
+                digest = hashlib.blake2b(frame.tobytes(), digest_size=16).hexdigest() + str(frame.shape)
+                manifest.append({"file": name, "hash": digest, "shape": list(frame.shape)})
+                path = os.path.join(self.img_dir, name)
+                if previous.get(name) == digest and os.path.exists(path):
+                    continue
+                encoded += 1
+                if self.export_workers <= 1:
+                    _encode_png(frame, path)
+                    continue
+                if pool is None:
+                    pool = ProcessPoolExecutor(
+                        max_workers=self.export_workers, mp_context=multiprocessing.get_context(_POOL_CONTEXT)
+                    )
+                # Bound the frames held in memory while workers encode
+                if len(in_flight) >= 2 * self.export_workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        fut.result()
+                in_flight.add(pool.submit(_encode_png, frame, path))
+            for fut in in_flight:
+                fut.result()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        # Remove frames left over from earlier, longer runs
+        keep = {e["file"] for e in manifest}
+        stale = [f for f in os.listdir(self.img_dir) if FRAME_FILE_RE.match(f) and f not in keep]
+        for f in stale:
+            os.remove(os.path.join(self.img_dir, f))
+
+        with open(os.path.join(self.img_dir, FRAME_MANIFEST), "w") as f:
+            json.dump({"frames": manifest}, f, indent=2)
+        print(f"[Supervisor] Frames: {encoded} encoded, {len(manifest) - encoded} unchanged, {len(stale)} stale removed")
+
+    def _load_manifest(self):
+        path = os.path.join(self.img_dir, FRAME_MANIFEST)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path) as f:
+                return json.load(f).get("frames", [])
+        except (OSError, ValueError):
+            return []
+
+    def _report_metrics(self, logs, latency=None):
+        """
+        :param latency: Tracer.summary() for the task; adds p50/p95 per span type.
+        """
         total = len(logs)
         fails = [l for l in logs if l["status"] == "fail"]
         passes = [l for l in logs if l["status"] == "pass"]
@@ -68,12 +178,19 @@ class SupervisorAgent:
         print(f" - Agent recovery rate: {recovery_rate:.2f}")
         print(f" - Supervisor feedback effectiveness: {feedback_effectiveness:.2f}")
         print(f" - Steps tested: {total}")
+        if latency:
+            print("[Supervisor] Latency by span (slowest total first):")
+            print(format_summary(latency))
+        if self.history is not None:
+            print("[Supervisor] Trends across runs:")
+            print(format_trends(self.history.trends(self.trend_window)))
 
     def _llm_feedback(self, logs):
+        context = self.compactor.log_table(logs)
+        print(f"[Supervisor] Log context: {context.kept}/{context.total} steps, ~{context.tokens} tokens")
         frames_to_attach = []
-        n_frames = len(os.listdir(self.img_dir)) if os.path.exists(self.img_dir) else 0
-        if n_frames > 0:
-            all_imgs = sorted([f for f in os.listdir(self.img_dir) if f.endswith(".png")])
+        all_imgs = [e["file"] for e in self._load_manifest()]
+        if all_imgs:
             # Select up to 3 frames: first, middle, last (if available)
             idxs = [0, len(all_imgs)//2, -1] if len(all_imgs) >= 3 else list(range(len(all_imgs)))
             for idx in idxs:
@@ -90,22 +207,24 @@ class SupervisorAgent:
             "Recommend extra test coverage or edge cases. "
             "Summarize recovery effectiveness. "
             "Screenshots are attached as reference (from before/after major steps).\n\n"
-            f"Test logs:\n{json.dumps(logs, indent=2)}\n"
+            "Test logs, one row per step (consecutive identical steps collapsed, n = count):\n"
+            f"{context.text}\n"
         )
 
-        def llm_call():
+        def report(future):
             try:
-                gemini_inputs = [prompt] + frames_to_attach
-                print(f"\n[Supervisor] Requesting Gemini 2.5 feedback with {len(frames_to_attach)} images...")
-                response = self.model.generate_content(gemini_inputs)
-                print("\n[Supervisor Gemini feedback]:\n")
-                print(response.text)
+                text = future.result()
             except Exception as e:
                 print(f"[Supervisor] Gemini feedback error: {e}")
+                return
+            print("\n[Supervisor Gemini feedback]:\n")
+            print(text)
 
-        # Run Gemini in a thread with timeout
-        thread = threading.Thread(target=llm_call)
-        thread.start()
-        thread.join(timeout=45)  # seconds
-        if thread.is_alive():
-            print("[Supervisor] Gemini feedback timed out. Skipping LLM report.")
+        # The gateway cancels the request at the deadline instead of abandoning a thread
+        print(f"\n[Supervisor] Requesting Gemini 2.5 feedback with {len(frames_to_attach)} images...")
+        future = self.gateway.submit(
+            "gemini", self.model, prompt, images=frames_to_attach,
+            timeout=self.feedback_timeout, retries=0,
+        )
+        future.add_done_callback(report)
+        return future
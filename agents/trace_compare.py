@@ -0,0 +1,160 @@
+import os
+import hashlib
+import numpy as np
+from PIL import Image
+
+FRAME_SIZE = (320, 320)
+
+# Defaults of skimage.metrics.structural_similarity for uint8 images
+SSIM_WIN = 7
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+SSIM_DATA_RANGE = 255.0
+
+
+def preprocess_frames(frames, size=FRAME_SIZE):
+    """
+    Grayscale + resize every frame, stacked into one (N, H, W) uint8 array.
+    """
+    out = np.empty((len(frames), size[1], size[0]), dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        out[i] = np.asarray(Image.fromarray(np.asarray(frame)).convert('L').resize(size))
+    return out
+
+
+def _box_mean(a, win=SSIM_WIN):
+    """
+    Mean over every fully-contained win x win window of the last two axes.
+    """
+    c = np.cumsum(np.cumsum(a, axis=-1), axis=-2)
+    c = np.pad(c, [(0, 0)] * (a.ndim - 2) + [(1, 0), (1, 0)])
+    s = c[..., win:, win:] - c[..., :-win, win:] - c[..., win:, :-win] + c[..., :-win, :-win]
+    return s / (win * win)
+
+
+class _FrameStats:
+    def __init__(self, frames):
+        self.x = frames.astype(np.float64)
+        self.mu = _box_mean(self.x)
+        np_ = SSIM_WIN * SSIM_WIN
+        self.var = (_box_mean(self.x * self.x) - self.mu * self.mu) * (np_ / (np_ - 1))
+
+
+def ssim_matrix(a, b):
+    """
+    Pairwise mean SSIM between stacks a (N, H, W) and b (M, H, W), matching
+    skimage's structural_similarity defaults. Returns an (N, M) float array.
+    """
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    sa, sb = _FrameStats(a), _FrameStats(b)
+    np_ = SSIM_WIN * SSIM_WIN
+    cov_norm = np_ / (np_ - 1)
+    c1 = (SSIM_K1 * SSIM_DATA_RANGE) ** 2
+    c2 = (SSIM_K2 * SSIM_DATA_RANGE) ** 2
+    out = np.empty((len(a), len(b)))
+    for i in range(len(a)):
+        mu_x, var_x = sa.mu[i], sa.var[i]
+        cov = (_box_mean(sa.x[i] * sb.x) - mu_x * sb.mu) * cov_norm
+        num = (2 * mu_x * sb.mu + c1) * (2 * cov + c2)
+        den = (mu_x * mu_x + sb.mu * sb.mu + c1) * (var_x + sb.var + c2)
+        out[i] = (num / den).mean(axis=(-2, -1))
+    return out
+
+
+def dtw_align(cost):
+    """
+    Dynamic time warping over an (N, M) cost matrix.
+    Returns (total_cost, path) where path is a list of (i, j) pairs.
+    """
+    n, m = cost.shape
+    acc = np.full((n + 1, m + 1), np.inf)
+    acc[0, 0] = 0.0
+    for i in range(1, n + 1):
+        row = cost[i - 1]
+        for j in range(1, m + 1):
+            acc[i, j] = row[j - 1] + min(acc[i - 1, j], acc[i, j - 1], acc[i - 1, j - 1])
+    path = []
+    i, j = n, m
+    while i > 0 and j > 0:
+        path.append((i - 1, j - 1))
+        step = np.argmin((acc[i - 1, j - 1], acc[i - 1, j], acc[i, j - 1]))
+        if step == 0:
+            i, j = i - 1, j - 1
+        elif step == 1:
+            i -= 1
+        else:
+            j -= 1
+    path.reverse()
+    return float(acc[n, m]), path
+
+
+def trace_digest(trace_path):
+    """
+    Content hash of a ground-truth trace file (.npy) or directory of PNGs.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    if os.path.isdir(trace_path):
+        files = sorted(f for f in os.listdir(trace_path) if f.endswith('.png'))
+    else:
+        files = [None]
+    for name in files:
+        full = trace_path if name is None else os.path.join(trace_path, name)
+        h.update((name or "").encode())
+        with open(full, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+class GroundTruthCache:
+    def __init__(self, cache_dir, loader, size=FRAME_SIZE):
+        """
+        :param cache_dir: Where preprocessed (N, H, W) tensors are stored.
+        :param loader: Callable loading raw frames from a trace path (cache misses only).
+        """
+        self.cache_dir = cache_dir
+        self.loader = loader
+        self.size = size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def load(self, trace_path):
+        key = f"{trace_digest(trace_path)}_{self.size[0]}x{self.size[1]}.npy"
+        cached = os.path.join(self.cache_dir, key)
+        if os.path.exists(cached):
+            return np.load(cached)
+        frames = preprocess_frames(self.loader(trace_path), self.size)
+        tmp = cached + ".tmp.npy"
+        np.save(tmp, frames)
+        os.replace(tmp, cached)
+        return frames
+
+
+def compare_preprocessed(gt, agent):
+    """
+    DTW-aligned comparison of two preprocessed traces. Each ground-truth step
+    is scored by the mean SSIM of the agent frames aligned to it.
+    """
+    if len(gt) == 0 or len(agent) == 0:
+        return {
+            "steps_gt": len(gt),
+            "steps_agent": len(agent),
+            "avg_ssim": 0.0,
+            "frame_similarities": [],
+            "alignment": [],
+            "dtw_cost": None,
+        }
+    sim = ssim_matrix(gt, agent)
+    dtw_cost, path = dtw_align(1.0 - sim)
+    per_step = [[] for _ in range(len(gt))]
+    for i, j in path:
+        per_step[i].append(sim[i, j])
+    step_similarity = [float(np.mean(s)) for s in per_step]
+    return {
+        "steps_gt": len(gt),
+        "steps_agent": len(agent),
+        "avg_ssim": float(np.mean(step_similarity)),
+        "frame_similarities": step_similarity,
+        "alignment": [[int(i), int(j)] for i, j in path],
+        "dtw_cost": dtw_cost,
+    }
@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+INDEX_FILE = "index.json"
+
+
+class TraceWriter:
+    """
+    Appends frames to a directory of chunk files plus a small JSON index.
+
+    Frames identical to the previous one are not stored again; the previous
+    index entry's ``repeat`` count is incremented instead, so readers still
+    see one frame per captured step. Compressed chunks (``.npz``) keep disk
+    usage low; with ``compress=False`` chunks are plain ``.npy`` files that
+    readers memory-map.
+    """
+
+    def __init__(self, path="logs/visual_trace", chunk_size=8, compress=True, dedupe=True):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.dedupe = dedupe
+        self._pending = []
+        self._entries = []
+        self._chunks = []
+        self._last_hash = None
+        self.closed = False
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.startswith("chunk_") or name == INDEX_FILE:
+                os.remove(os.path.join(path, name))
+        self._write_index()
+
+    def append(self, frame, step=None, failed=False):
+        """
+        :param step: Step the frame was captured after, recorded in the index.
+        :param failed: Marks the frame of a failed step.
+        """
+        frame = np.ascontiguousarray(frame)
+        digest = hashlib.blake2b(frame.tobytes(), digest_size=16).hexdigest() + str(frame.shape)
+        if self.dedupe and digest == self._last_hash:
+            self._entries[-1]["repeat"] += 1
+            if failed:
+                self._entries[-1]["failed"] = True
+            return
+        self._last_hash = digest
+        if not self.compress and self._pending and frame.shape != self._pending[0].shape:
+            self.flush()  # .npy chunks are stacked arrays, so shapes must agree
+        chunk = len(self._chunks)
+        self._entries.append({
+            "chunk": chunk,
+            "offset": len(self._pending),
+            "shape": list(frame.shape),
+            "dtype": str(frame.dtype),
+            "repeat": 1,
+        })
+        if step is not None:
+            self._entries[-1]["step"] = step
+        if failed:
+            self._entries[-1]["failed"] = True
+        self._pending.append(frame)
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            chunk = len(self._chunks)
+            if self.compress:
+                name = f"chunk_{chunk:05d}.npz"
+                np.savez_compressed(os.path.join(self.path, name), *self._pending)
+            else:
+                name = f"chunk_{chunk:05d}.npy"
+                np.save(os.path.join(self.path, name), np.stack(self._pending))
+            self._chunks.append(name)
+            self._pending = []
+        self._write_index()
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.closed = True
+
+    def __len__(self):
+        return sum(e["repeat"] for e in self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_index(self):
+        tmp_path = os.path.join(self.path, INDEX_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "version": 1,
+                "chunks": self._chunks,
+                "frames": self._entries[:len(self._entries) - len(self._pending)],
+            }, f)
+        os.replace(tmp_path, os.path.join(self.path, INDEX_FILE))
+
+
+class TraceReader:
+    """
+    Lazy, random-access view of a trace written by TraceWriter. Only one
+    chunk is held in memory at a time; ``.npy`` chunks are memory-mapped.
+    """
+
+    def __init__(self, path="logs/visual_trace"):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            index = json.load(f)
+        self._chunks = index["chunks"]
+        self._entries = index["frames"]
+        self._steps = []
+        for i, entry in enumerate(self._entries):
+            self._steps.extend([i] * entry.get("repeat", 1))
+        self._cached = (None, None)
+
+    def __len__(self):
+        return len(self._steps)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        entry = self._entries[self._steps[i]]
+        return self._load_chunk(entry["chunk"])[entry["offset"]]
+
+    @property
+    def unique_frames(self):
+        return len(self._entries)
+
+    def _load_chunk(self, chunk):
+        if self._cached[0] == chunk:
+            return self._cached[1]
+        name = self._chunks[chunk]
+        full = os.path.join(self.path, name)
+        if name.endswith(".npz"):
+            with np.load(full) as data:
+                frames = [data[f"arr_{k}"] for k in range(len(data.files))]
+        else:
+            frames = np.load(full, mmap_mode="r")
+        self._cached = (chunk, frames)
+        return frames
+
+
+def open_trace(path):
+    """
+    Opens a visual trace for reading: a TraceWriter directory, or a legacy
+    ``visual_trace.npy`` object array. Returns None if neither exists.
+    """
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, INDEX_FILE)):
+        return TraceReader(path)
+    legacy = path if path.endswith(".npy") else path + ".npy"
+    if os.path.exists(legacy):
+        return np.load(legacy, allow_pickle=True)
+    return None
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import threading
+
+TRACE_ENV = "QA_TRACE"
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._events.append((self.name, self.start, end - self.start, threading.get_ident(), self.args))
+        return False
+
+
+class Tracer:
+    """
+    Collects timed spans (``with tracer.span("executor.tap"):``) for a Chrome
+    trace-event export and per-span latency percentiles.
+
+    When disabled, ``span()`` returns a shared no-op context manager, so the
+    instrumentation left in the agents costs one attribute check per call.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._events = []
+        self._epoch = time.perf_counter()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def mark(self):
+        """
+        Position in the event list; pass to summary()/export_chrome() as ``since``
+        to report a single task.
+        """
+        return len(self._events)
+
+    def clear(self):
+        self._events = []
+
+    def summary(self, since=0):
+        """
+        {span name: {count, total_ms, p50_ms, p95_ms, max_ms}}.
+        """
+        durations = {}
+        for name, _, dur, _, _ in self._events[since:]:
+            durations.setdefault(name, []).append(dur * 1000)
+        summary = {}
+        for name, values in durations.items():
+            values.sort()
+            summary[name] = {
+                "count": len(values),
+                "total_ms": sum(values),
+                "p50_ms": values[int(0.5 * (len(values) - 1))],
+                "p95_ms": values[int(0.95 * (len(values) - 1))],
+                "max_ms": values[-1],
+            }
+        return summary
+
+    def export_chrome(self, path, since=0):
+        """
+        Writes complete ("X") trace events, loadable in chrome://tracing or Perfetto.
+        """
+        pid = os.getpid()
+        events = []
+        for name, start, dur, tid, args in self._events[since:]:
+            events.append({
+                "name": name,
+                "cat": name.split(".", 1)[0],
+                "ph": "X",
+                "ts": (start - self._epoch) * 1e6,
+                "dur": dur * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": {k: str(v) for k, v in args.items()},
+            })
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+
+_default_tracer = Tracer(enabled=os.getenv(TRACE_ENV, "").lower() in ("1", "true", "yes"))
+
+
+def get_tracer():
+    """
+    Process-wide tracer; enabled with QA_TRACE=1 or ``get_tracer().enabled = True``.
+    """
+    return _default_tracer
+
+
+def span(name, **args):
+    return _default_tracer.span(name, **args)
+
+
+def format_summary(summary, indent=" - "):
+    lines = []
+    for name, s in sorted(summary.items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(
+            f"{indent}{name}: n={s['count']} p50={s['p50_ms']:.1f}ms "
+            f"p95={s['p95_ms']:.1f}ms total={s['total_ms']:.1f}ms"
+        )
+    return "\n".join(lines)
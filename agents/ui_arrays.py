@@ -0,0 +1,198 @@
+import io
+import json
+import numpy as np
+
+STRING_FIELDS = (
+    "text", "content_description", "class_name", "hint_text",
+    "package_name", "resource_name", "tooltip", "resource_id",
+)
+FLAG_FIELDS = (
+    "is_checked", "is_checkable", "is_clickable", "is_editable", "is_enabled", "is_focused",
+    "is_focusable", "is_long_clickable", "is_scrollable", "is_selected", "is_visible",
+)
+FLAG_BITS = {name: 1 << bit for bit, name in enumerate(FLAG_FIELDS)}
+FORMAT_VERSION = 1
+
+
+class UIArrays:
+    """
+    Struct-of-arrays view of a UI tree.
+
+    - ``boxes``: (N, 4) int32 ``x_min, y_min, x_max, y_max``; ``has_box`` marks real ones
+    - ``flags``: uint16 bitset per element, one bit per FLAG_FIELDS entry
+    - ``string_ids``: (N, len(STRING_FIELDS)) int32 into the interned ``strings``, -1 for None
+
+    Queries return element indices (int64 arrays) in original order unless
+    stated otherwise, so results line up with ``state.ui_elements``.
+    """
+
+    def __init__(self, boxes, has_box, flags, string_ids, strings):
+        self.boxes = boxes
+        self.has_box = has_box
+        self.flags = flags
+        self.string_ids = string_ids
+        self.strings = strings
+        self.centers = (boxes[:, :2] + boxes[:, 2:]) // 2
+        self._lower = None
+        self._substring_masks = {}
+
+    @classmethod
+    def from_elements(cls, ui_elements):
+        n = len(ui_elements)
+        boxes = np.zeros((n, 4), dtype=np.int32)
+        has_box = np.zeros(n, dtype=bool)
+        flags = np.zeros(n, dtype=np.uint16)
+        string_ids = np.full((n, len(STRING_FIELDS)), -1, dtype=np.int32)
+        strings, interned = [], {}
+        for i, el in enumerate(ui_elements):
+            bbox = getattr(el, "bbox_pixels", None)
+            if bbox:
+                boxes[i] = (bbox.x_min, bbox.y_min, bbox.x_max, bbox.y_max)
+                has_box[i] = True
+            bits = 0
+            for name, bit in FLAG_BITS.items():
+                if getattr(el, name, False):
+                    bits |= bit
+            flags[i] = bits
+            for j, name in enumerate(STRING_FIELDS):
+                value = getattr(el, name, None)
+                if value is None:
+                    continue
+                sid = interned.get(value)
+                if sid is None:
+                    sid = interned[value] = len(strings)
+                    strings.append(value)
+                string_ids[i, j] = sid
+        return cls(boxes, has_box, flags, string_ids, strings)
+
+    def __len__(self):
+        return len(self.flags)
+
+    # -- column access -----------------------------------------------------
+
+    def flag(self, name):
+        """
+        Boolean array for one of FLAG_FIELDS.
+        """
+        return (self.flags & FLAG_BITS[name]) != 0
+
+    def string(self, i, field):
+        sid = self.string_ids[i, STRING_FIELDS.index(field)]
+        return None if sid < 0 else self.strings[sid]
+
+    def contains(self, field, substring):
+        """
+        Mask of elements whose lower-cased ``field`` contains ``substring`` (lower-cased).
+        Evaluated once per interned string, then broadcast through the id column.
+        """
+        key = (field, substring.lower())
+        mask = self._substring_masks.get(key)
+        if mask is None:
+            if self._lower is None:
+                self._lower = [s.lower() for s in self.strings]
+            per_string = np.fromiter((key[1] in s for s in self._lower), dtype=bool, count=len(self.strings))
+            ids = self.string_ids[:, STRING_FIELDS.index(field)]
+            mask = np.zeros(len(self), dtype=bool)
+            present = ids >= 0
+            mask[present] = per_string[ids[present]]
+            self._substring_masks[key] = mask
+        return mask
+
+    def class_mask(self, class_contains):
+        if class_contains is None:
+            return self.has_box
+        return self.has_box & self.contains("class_name", class_contains)
+
+    # -- spatial queries -----------------------------------------------------
+
+    def hit_test(self, x, y, mask=None):
+        """
+        Elements whose box contains (x, y), edges inclusive, smallest area first.
+        """
+        b = self.boxes
+        hit = self._mask(mask) & (b[:, 0] <= x) & (x <= b[:, 2]) & (b[:, 1] <= y) & (y <= b[:, 3])
+        ids = np.flatnonzero(hit)
+        area = (b[ids, 2] - b[ids, 0]).astype(np.int64) * (b[ids, 3] - b[ids, 1])
+        return ids[np.argsort(area, kind="stable")]
+
+    def in_row(self, y_center, tolerance, mask=None):
+        """
+        Elements whose y-center is strictly within ``tolerance`` px of ``y_center``.
+        """
+        return np.flatnonzero(self._mask(mask) & (np.abs(self.centers[:, 1] - y_center) < tolerance))
+
+    def in_column(self, x_center, tolerance, mask=None):
+        """
+        Elements whose x-center is strictly within ``tolerance`` px of ``x_center``.
+        """
+        return np.flatnonzero(self._mask(mask) & (np.abs(self.centers[:, 0] - x_center) < tolerance))
+
+    def overlapping_rows(self, y_min, y_max, mask=None):
+        """
+        Elements whose vertical extent overlaps the open interval (y_min, y_max).
+        """
+        b = self.boxes
+        return np.flatnonzero(self._mask(mask) & (b[:, 1] < y_max) & (b[:, 3] > y_min))
+
+    def nearest(self, x, y, k=1, mask=None):
+        """
+        Up to ``k`` elements ordered by distance from (x, y) to their centre.
+        """
+        ids = np.flatnonzero(self._mask(mask))
+        d = self.centers[ids].astype(np.int64) - (x, y)
+        dist = d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]
+        return ids[np.argsort(dist, kind="stable")[:k]]
+
+    def _mask(self, mask):
+        return self.has_box if mask is None else self.has_box & mask
+
+    # -- serialization -------------------------------------------------------
+
+    def to_bytes(self, compress=True):
+        """
+        Compact binary form (npz) for dumps and logs; read back with ``from_bytes``.
+        """
+        buf = io.BytesIO()
+        save = np.savez_compressed if compress else np.savez
+        save(
+            buf,
+            version=np.array([FORMAT_VERSION], dtype=np.uint8),
+            boxes=self.boxes,
+            has_box=np.packbits(self.has_box),
+            flags=self.flags,
+            string_ids=self.string_ids,
+            strings=np.frombuffer(json.dumps(self.strings).encode("utf-8"), dtype=np.uint8),
+        )
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data)) as z:
+            if int(z["version"][0]) != FORMAT_VERSION:
+                raise ValueError(f"Unsupported UI array format {int(z['version'][0])}")
+            n = len(z["flags"])
+            strings = json.loads(z["strings"].tobytes().decode("utf-8"))
+            has_box = np.unpackbits(z["has_box"], count=n).astype(bool)
+            return cls(z["boxes"], has_box, z["flags"], z["string_ids"], strings)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def records(self):
+        """
+        Element dicts in the ui_elements_dump.json field names (bbox as [x_min, y_min, x_max, y_max]).
+        """
+        out = []
+        for i in range(len(self)):
+            record = {name: self.string(i, name) for name in STRING_FIELDS}
+            record["bbox_pixels"] = self.boxes[i].tolist() if self.has_box[i] else None
+            bits = int(self.flags[i])
+            record.update({name: bool(bits & bit) for name, bit in FLAG_BITS.items()})
+            out.append(record)
+        return out
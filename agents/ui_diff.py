@@ -0,0 +1,85 @@
+from agents.fingerprint import is_status_bar
+
+# Attributes compared for elements present in both snapshots
+CONTENT_FIELDS = (
+    "text", "content_description", "hint_text",
+    "is_checked", "is_selected", "is_enabled", "is_focused",
+)
+
+
+def element_key(el):
+    """
+    Identity of an element across snapshots: resource name, class and position.
+    """
+    bbox = getattr(el, "bbox_pixels", None)
+    box = (bbox.x_min, bbox.y_min, bbox.x_max, bbox.y_max) if bbox else None
+    return (getattr(el, "resource_name", None), el.class_name, box)
+
+
+def keyed_elements(ui_elements):
+    """
+    {(key, occurrence): index}; the occurrence number separates elements sharing a key.
+    """
+    keyed, seen = {}, {}
+    for i, el in enumerate(ui_elements):
+        if is_status_bar(el):
+            continue
+        key = element_key(el)
+        n = seen.get(key, 0)
+        seen[key] = n + 1
+        keyed[(key, n)] = i
+    return keyed
+
+
+def _content(el):
+    return tuple(getattr(el, name, None) for name in CONTENT_FIELDS)
+
+
+class UIDiff:
+    """
+    Structural difference between two snapshots. ``added`` and ``changed``
+    index into ``after``, ``removed`` into ``before``; ``keys`` holds the
+    element keys touched on either side.
+    """
+
+    def __init__(self, before, after, added, removed, changed, keys):
+        self.before = before
+        self.after = after
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.keys = keys
+
+    @property
+    def empty(self):
+        return not (self.added or self.removed or self.changed)
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def touched(self):
+        """
+        Added and changed elements of the new snapshot.
+        """
+        return [self.after[i] for i in sorted(self.added + self.changed)]
+
+    def __repr__(self):
+        return f"UIDiff(+{len(self.added)} -{len(self.removed)} ~{len(self.changed)})"
+
+
+def diff_ui(before, after):
+    old, new = keyed_elements(before), keyed_elements(after)
+    added, removed, changed, keys = [], [], [], set()
+    for key, j in new.items():
+        i = old.get(key)
+        if i is None:
+            added.append(j)
+            keys.add(key)
+        elif _content(before[i]) != _content(after[j]):
+            changed.append(j)
+            keys.add(key)
+    for key, i in old.items():
+        if key not in new:
+            removed.append(i)
+            keys.add(key)
+    return UIDiff(before, after, sorted(added), sorted(removed), sorted(changed), keys)
@@ -0,0 +1,124 @@
+from agents.fuzzy_match import FuzzyMatcher
+from agents.ui_arrays import UIArrays
+
+
+class UIIndex:
+    """
+    Per-snapshot lookup structure over ``state.ui_elements``.
+
+    Built once per snapshot, it answers the label/class/row queries the
+    Executor and Verifier used to answer by rescanning the element list.
+    Query results are element indices in original order, so callers keep the
+    same tie-breaking as a linear scan.
+    """
+
+    _last = None  # (ui_elements, UIIndex) of the most recent snapshot
+
+    @classmethod
+    def for_elements(cls, ui_elements):
+        last = cls._last
+        if last is not None and last[0] is ui_elements:
+            return last[1]
+        index = cls(ui_elements)
+        cls._last = (ui_elements, index)
+        return index
+
+    def __init__(self, ui_elements):
+        self.elements = list(ui_elements)
+        self._fields = {
+            "text": [(el.text or "").lower() for el in self.elements],
+            "desc": [(el.content_description or "").lower() for el in self.elements],
+        }
+        self._trigrams = {name: self._build_trigrams(values) for name, values in self._fields.items()}
+        self._substring_cache = {}
+        self._fuzzy = {}
+
+        # Geometry and flags as arrays for the spatial queries
+        self.arrays = UIArrays.from_elements(self.elements)
+
+    @staticmethod
+    def y_center(el):
+        return (el.bbox_pixels.y_min + el.bbox_pixels.y_max) // 2
+
+    @staticmethod
+    def _build_trigrams(values):
+        postings = {}
+        for i, value in enumerate(values):
+            for j in range(len(value) - 2):
+                postings.setdefault(value[j:j + 3], set()).add(i)
+        return postings
+
+    def find_substring(self, term, fields=("text", "desc")):
+        """
+        Indices of elements where ``term`` is a substring of any of ``fields``.
+        """
+        term = (term or "").lower()
+        key = (term, tuple(fields))
+        if key in self._substring_cache:
+            return self._substring_cache[key]
+        hits = set()
+        for name in fields:
+            values = self._fields[name]
+            if len(term) < 3:
+                hits.update(i for i, v in enumerate(values) if term in v)
+                continue
+            postings = self._trigrams[name]
+            candidates = None
+            for j in range(len(term) - 2):
+                ids = postings.get(term[j:j + 3])
+                if not ids:
+                    candidates = set()
+                    break
+                candidates = set(ids) if candidates is None else candidates & ids
+                if not candidates:
+                    break
+            hits.update(i for i in candidates if term in values[i])
+        result = sorted(hits)
+        self._substring_cache[key] = result
+        return result
+
+    def find_fuzzy(self, term, fields=("text", "desc"), threshold=0.8):
+        """
+        Indices of elements where difflib's ratio(term, field) > threshold for any of ``fields``.
+        """
+        hits = set()
+        for name in fields:
+            if name not in self._fuzzy:
+                by_label = {}
+                for i, value in enumerate(self._fields[name]):
+                    by_label.setdefault(value, []).append(i)
+                self._fuzzy[name] = (FuzzyMatcher(by_label), by_label)
+            matcher, by_label = self._fuzzy[name]
+            for _, label in matcher.query((term or "").lower(), threshold):
+                hits.update(by_label[label])
+        return sorted(hits)
+
+    def find_any(self, terms, fields=("text", "desc")):
+        hits = set()
+        for term in terms:
+            hits.update(self.find_substring(term, fields))
+        return [self.elements[i] for i in sorted(hits)]
+
+    def in_row(self, y_center, tolerance, class_contains=None):
+        """
+        Elements whose y-center is strictly within ``tolerance`` px of ``y_center``.
+        """
+        return self._select(self.arrays.in_row(y_center, tolerance, self.arrays.class_mask(class_contains)))
+
+    def overlapping_rows(self, y_min, y_max, class_contains=None):
+        """
+        Elements whose vertical extent overlaps the open interval (y_min, y_max).
+        """
+        return self._select(self.arrays.overlapping_rows(y_min, y_max, self.arrays.class_mask(class_contains)))
+
+    def hit_test(self, x, y):
+        """
+        Elements containing the point (x, y), innermost (smallest) first.
+        """
+        return self._select(self.arrays.hit_test(x, y))
+
+    def nearest(self, x, y, k=1, class_contains=None):
+        return self._select(self.arrays.nearest(x, y, k, self.arrays.class_mask(class_contains)))
+
+    def _select(self, ids):
+        return [self.elements[i] for i in ids]
@@ -0,0 +1,140 @@
+import time
+from collections import deque
+from agents.fingerprint import ui_fingerprint
+from agents.tracing import get_tracer
+from agents.qa_logging import get_logger
+
+log = get_logger("Settle")
+
+# (min_seconds, max_seconds) before a UI is considered settled, per action type
+DEFAULT_SETTLE_BOUNDS = {
+    "tap": (0.2, 3.0),
+    "home": (0.2, 2.0),
+    "swipe": (0.3, 3.0),
+    "launch": (0.5, 5.0),
+    "default": (0.2, 3.0),
+}
+
+
+class SettleEngine:
+    def __init__(
+        self,
+        env,
+        bounds=None,
+        stable_polls=2,
+        poll_interval=0.15,
+        history=20,
+        min_floor=0.05,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        observations=None,
+    ):
+        """
+        Waits for the UI to stop changing instead of sleeping a fixed time.
+
+        :param bounds: Per-action (min, max) seconds; merged over DEFAULT_SETTLE_BOUNDS.
+        :param stable_polls: Consecutive identical fingerprints needed to call the UI settled.
+        :param poll_interval: Seconds between fingerprint polls.
+        :param history: Observed settle times kept per action type for tuning.
+        :param clock/sleep: Injectable for tests against a fake env.
+        :param observations: ObservationManager to poll through, so polls are counted
+                             and the settled state becomes the current snapshot.
+        """
+        self.env = env
+        self.observations = observations
+        self.configured = dict(DEFAULT_SETTLE_BOUNDS)
+        self.configured.update(bounds or {})
+        self.bounds = dict(self.configured)
+        self.stable_polls = max(2, stable_polls)
+        self.poll_interval = poll_interval
+        self.min_floor = min_floor
+        self.clock = clock
+        self.sleep = sleep
+        self._history_len = history
+        self.history = {}
+        self.timeouts = {}
+        self.unchanged = {}
+
+    def bounds_for(self, action_type):
+        return self.bounds.get(action_type) or self.bounds["default"]
+
+    def wait(self, action_type="default", before=None):
+        """
+        Polls until ``stable_polls`` consecutive fingerprints match and the min bound
+        has passed, or until the max bound. Returns the last observed state.
+
+        :param before: Fingerprint of the UI before the action, if known. While the UI
+                       still matches it, polling continues up to the max bound, so slow
+                       transitions (app launches) are not mistaken for a settled screen.
+        """
+        with get_tracer().span(f"settle.{action_type}"):
+            return self._wait(action_type, before)
+
+    def _wait(self, action_type, before):
+        min_s, max_s = self.bounds_for(action_type)
+        start = self.clock()
+        if min_s > 0:
+            self.sleep(min_s)
+
+        last_fp, run, run_started, state = None, 0, None, None
+        while True:
+            now = self.clock()
+            if self.observations is not None:
+                state = self.observations.poll()
+            else:
+                state = self.env.get_state(wait_to_stabilize=False)
+            fp = ui_fingerprint(state.ui_elements)
+            if fp == last_fp:
+                run += 1
+            else:
+                last_fp, run, run_started = fp, 1, now
+            elapsed = now - start
+
+            unchanged = before is not None and fp == before
+            if run >= self.stable_polls and not unchanged:
+                self._record(action_type, run_started - start)
+                return state
+            if elapsed >= max_s:
+                if unchanged:
+                    # No transition observed: nothing to learn a settle time from
+                    log.info(f"'{action_type}' left the UI unchanged for {max_s:.2f}s")
+                    self.unchanged[action_type] = self.unchanged.get(action_type, 0) + 1
+                    return state
+                log.warning(f"'{action_type}' did not settle within {max_s:.2f}s")
+                self.timeouts[action_type] = self.timeouts.get(action_type, 0) + 1
+                self._record(action_type, elapsed)
+                return state
+            self.sleep(self.poll_interval)
+
+    def _record(self, action_type, observed):
+        samples = self.history.setdefault(action_type, deque(maxlen=self._history_len))
+        samples.append(observed)
+        self._tune(action_type)
+
+    def _tune(self, action_type):
+        """
+        Lowers the min bound toward half the fast end of observed settle times.
+        The max bound stays as configured: one bucket mixes fast and slow
+        transitions, so a run of fast ones says nothing about the next slow one.
+        """
+        samples = sorted(self.history[action_type])
+        if len(samples) < 5:
+            return
+        conf_min, conf_max = self.configured.get(action_type) or self.configured["default"]
+        p10 = samples[int(0.1 * (len(samples) - 1))]
+        new_min = max(self.min_floor, min(conf_min, 0.5 * p10))
+        self.bounds[action_type] = (new_min, conf_max)
+
+    def stats(self):
+        out = {}
+        for action_type, samples in self.history.items():
+            ordered = sorted(samples)
+            out[action_type] = {
+                "samples": len(ordered),
+                "p50": ordered[len(ordered) // 2],
+                "max": ordered[-1],
+                "timeouts": self.timeouts.get(action_type, 0),
+                "unchanged": self.unchanged.get(action_type, 0),
+                "bounds": self.bounds_for(action_type),
+            }
+        return out
@@ -1,15 +1,38 @@
 # agents/verifier_agent.py
 
-import difflib
+import time
+from agents.ui_index import UIIndex
+from agents.ui_diff import diff_ui, keyed_elements
+from agents.llm_gateway import get_gateway
+from agents.qa_logging import get_logger
+from agents.tracing import span
+from agents.context_compactor import ContextCompactor
+
+log = get_logger("Verifier")
 
 class VerifierAgent:
-    def __init__(self, use_llm=False, llm_client=None):
+    def __init__(self, use_llm=False, gateway=None, provider="openai", model="gpt-4", timeout=60.0, context_tokens=1000):
         """
         :param use_llm: If True, enables LLM-based fallback reasoning.
-        :param llm_client: Optional OpenAI or Gemini client for natural language analysis.
+        :param gateway: LLMGateway used for the fallback (defaults to the shared one).
+        :param provider/model: LLM used for natural language analysis.
+        :param context_tokens: Token budget for the UI table in the fallback prompt.
         """
         self.use_llm = use_llm
-        self.llm = llm_client
+        self.gateway = gateway
+        self.provider = provider
+        self.model = model
+        self.timeout = timeout
+        self.compactor = ContextCompactor(context_tokens)
+        self.pending_feedback = []
+        # (action, label, expected) -> (snapshot, result, keys of the matched elements)
+        self._memo = {}
+
+    def reset(self):
+        """
+        Forgets memoized checks between tasks of a session.
+        """
+        self._memo.clear()
 
     def verify(self, subgoal, ui_elements):
         """
@@ -23,91 +46,126 @@ class VerifierAgent:
         label = (subgoal.get("label") or "").lower()
         expected = subgoal.get("state") if action in ["toggle", "verify"] and "state" in subgoal else subgoal.get("exists", True)
 
-        print(f"\n[Verifier] Verifying action: {action}, label: '{label}'")
+        log.info(f"Verifying action: {action}, label: '{label}'")
 
+        memo_key = (action, label, str(expected))
+        memo = self._memo.get(memo_key)
+        if memo is not None and self._unaffected(label, memo, ui_elements, action == "toggle" or "state" in subgoal):
+            log.info(f"Result (unchanged since last check): {memo[1]}")
+            return dict(memo[1])
+
+        with span("verifier.match", elements=len(ui_elements)):
+            index = UIIndex.for_elements(ui_elements)
+            hits = set(index.find_substring(label)) | set(index.find_fuzzy(label))
         matched_elements = []
-        for el in ui_elements:
+        for i in sorted(hits):
+            el = index.elements[i]
             text = (el.text or "").lower()
-            desc = (el.content_description or "").lower()
             class_name = (el.class_name or "").lower()
             value = getattr(el, "toggle_state", None)
-            if label in text or label in desc or self._fuzzy_match(label, text) or self._fuzzy_match(label, desc):
-                matched_elements.append((el, text, class_name, value))
+            matched_elements.append((el, text, class_name, value))
 
         if action == "verify" and "state" in subgoal:
-            result = self._verify_toggle_state(label, expected, matched_elements, ui_elements)
+            result = self._verify_toggle_state(label, expected, matched_elements, index)
         elif action == "verify":
             result = self._verify_exists(label, expected, matched_elements)
         elif action == "toggle":
-            result = self._verify_toggle_state(label, expected, matched_elements, ui_elements)
+            result = self._verify_toggle_state(label, expected, matched_elements, index)
         else:
             result = {"status": "skip", "reason": f"No verification needed for action '{action}'", "should_replan": False}
 
-        if result["status"] == "fail" and self.use_llm and self.llm:
-            llm_feedback = self._llm_reasoning(subgoal, ui_elements)
-            result["llm_feedback"] = llm_feedback
+        if result["status"] == "fail" and self.use_llm:
+            # Runs in the background; collect with collect_feedback()
+            self.pending_feedback.append((subgoal, self._llm_reasoning(subgoal, ui_elements)))
 
-        print(f"[Verifier] Result: {result}")
+        keys = {key for key, i in keyed_elements(ui_elements).items() if i in hits}
+        self._memo[memo_key] = (ui_elements, dict(result), keys)
+        log.info(f"Result: {result}")
         return result
 
+    def _unaffected(self, label, memo, ui_elements, needs_state):
+        """
+        True when the change since the memoized check cannot alter its result:
+        no matched element was touched, no touched element matches the label
+        and, for state checks, no switch changed. Only the diff is re-examined.
+        """
+        snapshot, _, keys = memo
+        if snapshot is ui_elements:
+            return True
+        diff = diff_ui(snapshot, ui_elements)
+        if diff.keys & keys:
+            return False
+        touched = diff.touched()
+        if needs_state:
+            removed = [diff.before[i] for i in diff.removed]
+            if any("switch" in (el.class_name or "").lower() for el in touched + removed):
+                return False
+        if not touched:
+            return True
+        index = UIIndex(touched)
+        return not (index.find_substring(label) or index.find_fuzzy(label))
+
     def _verify_exists(self, label, should_exist, matched_elements):
         found = len(matched_elements) > 0
-        print(f"[Verifier] Expect exists={should_exist} → Found={found}")
+        log.debug(f"Expect exists={should_exist} → Found={found}")
 
         if found == should_exist:
             return {"status": "pass", "reason": "Label existence matched", "should_replan": False}
         else:
             return {"status": "fail", "reason": f"Label existence mismatch (expected: {should_exist})", "should_replan": True}
 
-    def _verify_toggle_state(self, label, expected_state, matched_elements, ui_elements):
+    def _verify_toggle_state(self, label, expected_state, matched_elements, index):
         expected_bool = str(expected_state).lower() == "on"
         actual = None
         for el, text, class_name, toggle_value in matched_elements:
             label_box = getattr(el, 'bbox_pixels', None)
             if label_box:
-                label_ymin, label_ymax = label_box.y_min, label_box.y_max
-                for sw in ui_elements:
-                    if "switch" in getattr(sw, "class_name", "").lower():
-                        sw_box = getattr(sw, 'bbox_pixels', None)
-                        if sw_box and (sw_box.y_min < label_ymax) and (sw_box.y_max > label_ymin):
-                            actual = getattr(sw, 'is_checked', None)
-                            print(f"[Verifier] Using is_checked: {actual}")
-                            break
+                switches = index.overlapping_rows(label_box.y_min, label_box.y_max, class_contains="switch")
+                if switches:
+                    actual = getattr(switches[0], 'is_checked', None)
+                    log.debug(f"Using is_checked: {actual}")
                 if actual is not None:
                     break
         if actual is None:
-            print("[Verifier] Could not determine toggle state!")
+            log.warning("Could not determine toggle state!")
             return {"status": "fail", "reason": "Toggle state not found or ambiguous", "should_replan": True}
-        print(f"[Verifier] Toggle state: expected={expected_bool}, actual={actual}")
+        log.info(f"Toggle state: expected={expected_bool}, actual={actual}")
         if expected_bool == actual:
             return {"status": "pass", "reason": "Toggle state matched", "should_replan": False}
         else:
             return {"status": "fail", "reason": "Toggle state mismatch", "should_replan": True}
 
-    def _fuzzy_match(self, a, b, threshold=0.8):
-        return difflib.SequenceMatcher(None, a, b).ratio() > threshold
+    def collect_feedback(self, timeout=None):
+        """
+        Waits for background LLM fallbacks and returns [{"subgoal", "llm_feedback"}].
+
+        :param timeout: Total seconds to wait for all of them; late ones are cancelled.
+        """
+        collected = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for subgoal, future in self.pending_feedback:
+            try:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                feedback = future.result(timeout=remaining)
+            except Exception as e:
+                future.cancel()
+                feedback = f"[LLM fallback failed: {e or type(e).__name__}]"
+            collected.append({"subgoal": subgoal, "llm_feedback": feedback})
+        self.pending_feedback = []
+        return collected
 
     def _llm_reasoning(self, subgoal, ui_elements):
-        ui_snapshot = "\n".join(
-            f"TEXT: {el.text}, DESC: {el.content_description}, CLASS: {el.class_name}"
-            for el in ui_elements
-        )
+        context = self.compactor.ui_table(ui_elements, query=subgoal.get("label"))
+        log.info(f"UI context for LLM fallback: {context.kept}/{context.total} elements, ~{context.tokens} tokens")
         prompt = f"""
 You are a mobile QA verifier. The user asked to complete this subgoal:
 
 {subgoal}
 
-The following UI elements are visible:
-{ui_snapshot}
+The following UI elements are visible (x,y = centre in pixels; layout containers omitted):
+{context.text}
 
 The verification failed. Why might that be? Suggest what to check or change.
 """
-        try:
-            response = self.llm.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"[LLM fallback failed: {e}]"
+        gateway = self.gateway or get_gateway()
+        return gateway.submit(self.provider, self.model, prompt, temperature=0.3, timeout=self.timeout)
@@ -0,0 +1,127 @@
+import os
+import re
+import json
+import time
+import dataclasses
+import numpy as np
+from PIL import Image
+from android_world.env import interface
+from android_world.env import representation_utils
+from agents.ui_arrays import UIArrays
+
+BBOX_RE = re.compile(r"(\w+)=(-?\d+)")
+UI_ELEMENT_FIELDS = {f.name for f in dataclasses.fields(representation_utils.UIElement)}
+
+
+def _bbox(value):
+    """
+    Accepts the dump's "BoundingBox(x_min=.., ...)" strings or [x_min, y_min, x_max, y_max].
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        return representation_utils.BoundingBox(**{k: int(v) for k, v in BBOX_RE.findall(value)})
+    x_min, y_min, x_max, y_max = value
+    return representation_utils.BoundingBox(x_min=x_min, x_max=x_max, y_min=y_min, y_max=y_max)
+
+
+def load_ui_elements(records):
+    """
+    Builds UIElements from dump records; returns (elements, keys) where each key is
+    the record's "id", else its text or content description, for transition lookup.
+    """
+    elements, keys = [], []
+    for record in records:
+        fields = {k: v for k, v in record.items() if k in UI_ELEMENT_FIELDS}
+        fields["bbox_pixels"] = _bbox(record.get("bbox_pixels") or record.get("bbox"))
+        fields["bbox"] = None
+        elements.append(representation_utils.UIElement(**fields))
+        keys.append(record.get("id") or record.get("text") or record.get("content_description"))
+    return elements, keys
+
+
+def load_frame(path, size=(1080, 1920)):
+    if path and os.path.exists(path):
+        return np.array(Image.open(path).convert("RGB"))
+    return np.zeros((size[1], size[0], 3), dtype=np.uint8)
+
+
+class FakeAndroidEnv:
+    """
+    Replays a recorded scenario in place of the android_world env, so the
+    pipeline can run without an emulator.
+
+    A scenario names screens (UI element records, inline or from a dump file
+    such as ui_elements_dump.json, plus an optional PNG frame) and scripted
+    transitions: tapping the element keyed ``tap`` on ``screen`` moves to
+    screen ``to`` and/or flips that element's ``is_checked`` (``toggle``).
+    Optional ``latency_ms`` per env call simulates device round trips.
+    """
+
+    def __init__(self, scenario, base_dir=".", frames_dir=None):
+        self.scenario = scenario
+        self.base_dir = base_dir
+        self.frames_dir = frames_dir or os.path.join(base_dir, "logs", "frames")
+        self.latency = {k: v / 1000 for k, v in scenario.get("latency_ms", {}).items()}
+        self.transitions = {(t["screen"], t["tap"]): t for t in scenario.get("transitions", [])}
+        self.calls = {"reset": 0, "get_state": 0, "execute_action": 0, "render": 0}
+        self._screens = {}
+        self._frames = {}
+        for name, spec in scenario["screens"].items():
+            records = spec.get("elements", [])
+            if "dump" in spec:
+                with open(os.path.join(base_dir, spec["dump"])) as f:
+                    records = json.load(f) + records
+            self._screens[name] = records
+            frame = spec.get("frame")
+            self._frames[name] = load_frame(os.path.join(self.frames_dir, frame) if frame else None)
+        self.reset()
+
+    def reset(self, go_home=False):
+        self.calls["reset"] += 1
+        self.screen = self.scenario["start"]
+        self._live = {name: load_ui_elements(records) for name, records in self._screens.items()}
+        # Boxes never change, so hit testing can use arrays built once per reset
+        self._arrays = {name: UIArrays.from_elements(elements) for name, (elements, _) in self._live.items()}
+        return self._state()
+
+    def get_state(self, wait_to_stabilize=False):
+        self.calls["get_state"] += 1
+        self._delay("get_state")
+        return self._state()
+
+    def execute_action(self, action):
+        self.calls["execute_action"] += 1
+        self._delay("execute_action")
+        if action.action_type == "navigate_home":
+            self.screen = self.scenario["start"]
+        elif action.action_type == "click":
+            self._tap(action.x, action.y)
+
+    def render(self):
+        self.calls["render"] += 1
+        self._delay("render")
+        return self._frames[self.screen].copy()
+
+    def close(self):
+        pass
+
+    def _state(self):
+        elements, _ = self._live[self.screen]
+        return interface.State(pixels=self._frames[self.screen], forest=None, ui_elements=list(elements))
+
+    def _tap(self, x, y):
+        elements, keys = self._live[self.screen]
+        hits = [i for i in self._arrays[self.screen].hit_test(x, y) if (self.screen, keys[i]) in self.transitions]
+        if not hits:
+            return
+        hit = hits[0]
+        transition = self.transitions[(self.screen, keys[hit])]
+        if transition.get("toggle"):
+            elements[hit] = dataclasses.replace(elements[hit], is_checked=not elements[hit].is_checked)
+        if transition.get("to"):
+            self.screen = transition["to"]
+
+    def _delay(self, call):
+        if self.latency.get(call):
+            time.sleep(self.latency[call])
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+# Adjust path to import main from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+BENCH_DIR = os.path.join(PROJECT_ROOT, "benchmarks")
+SCENARIO_DIR = os.path.join(BENCH_DIR, "scenarios")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+# Offline run: no device shell, stubbed LLMs, .env keys ignored
+os.environ.pop("ADB_PATH", None)
+os.environ["GEMINI_API_KEY"] = "stub"
+
+from main import main as run_agent
+from agents.llm_gateway import get_gateway, StubProvider
+from agents.qa_logging import read_step_log, set_log_level
+from agents.tracing import get_tracer
+from benchmarks.fake_env import FakeAndroidEnv
+
+# Metrics compared against the baseline; True when higher is better
+BASELINE_METRICS = {"steps_per_sec": True, "p95_step_ms": False, "peak_mem_mb": False}
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] if values else None
+
+
+def load_scenarios(names=None):
+    scenarios = {}
+    for path in sorted(glob.glob(os.path.join(SCENARIO_DIR, "*.json"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if names and name not in names:
+            continue
+        with open(path) as f:
+            scenarios[name] = json.load(f)
+    return scenarios
+
+
+def run_once(scenario, work_dir, measure_memory=False):
+    """
+    One end-to-end main() run against the fake env. Relative paths used by the
+    agents (plan cache, macros, logs) resolve inside ``work_dir``.
+    """
+    gateway = get_gateway()
+    gateway.register(StubProvider(
+        json.dumps(scenario["plan"]), name="openai",
+        delay=scenario.get("llm_delay", 0.0), chunk_delay=scenario.get("llm_chunk_delay", 0.0),
+    ))
+    gateway.register(StubProvider("Stub supervisor feedback.", name="gemini", delay=scenario.get("llm_delay", 0.0)))
+    env = FakeAndroidEnv(scenario, base_dir=PROJECT_ROOT)
+    tracer = get_tracer()
+    mark = tracer.mark()
+
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        if measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        run_agent(
+            scenario["task"], log_dir="logs", use_macros=scenario.get("use_macros", False), env=env,
+            stream_plan=scenario.get("stream_plan", True),
+        )
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+    finally:
+        if measure_memory:
+            tracemalloc.stop()
+        os.chdir(cwd)
+
+    records = read_step_log(os.path.join(work_dir, "logs", "test_log.jsonl"))
+    return {
+        "elapsed": elapsed,
+        "records": records,
+        "spans": tracer.summary(mark),
+        "env_calls": dict(env.calls),
+        "peak_mem_mb": peak / 2 ** 20 if peak is not None else None,
+    }
+
+
+def run_scenario(name, scenario, repeat):
+    runs = []
+    for _ in range(repeat):
+        work_dir = tempfile.mkdtemp(prefix=f"qa_bench_{name}_")
+        try:
+            runs.append(run_once(scenario, work_dir))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    # Separate run for memory: tracemalloc would distort the timings
+    work_dir = tempfile.mkdtemp(prefix=f"qa_bench_{name}_mem_")
+    try:
+        peak_mem = run_once(scenario, work_dir, measure_memory=True)["peak_mem_mb"]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    expected = len(scenario["plan"])
+    steps = sum(len(r["records"]) for r in runs)
+    step_ms = [rec["duration_ms"] for r in runs for rec in r["records"]]
+    per_agent = {}
+    for r in runs:
+        for rec in r["records"]:
+            per_agent.setdefault(rec["agent"], []).append(rec["duration_ms"])
+    failures = [
+        f"run {k}: {len(r['records'])}/{expected} steps, statuses {[rec['status'] for rec in r['records']]}"
+        for k, r in enumerate(runs)
+        if len(r["records"]) != expected or any(rec["status"] == "fail" for rec in r["records"])
+    ]
+    # Device round-trip budgets, e.g. {"get_state": 8}
+    for call, limit in scenario.get("max_env_calls", {}).items():
+        worst = max(r["env_calls"].get(call, 0) for r in runs)
+        if worst > limit:
+            failures.append(f"{worst} env.{call} calls (budget {limit})")
+    return {
+        "runs": repeat,
+        "steps_per_sec": steps / sum(r["elapsed"] for r in runs),
+        "p50_step_ms": _percentile(step_ms, 0.5),
+        "p95_step_ms": _percentile(step_ms, 0.95),
+        "peak_mem_mb": peak_mem,
+        "agents": {
+            agent: {"count": len(v), "p50_ms": _percentile(v, 0.5), "p95_ms": _percentile(v, 0.95)}
+            for agent, v in per_agent.items()
+        },
+        "spans": runs[-1]["spans"],
+        "env_calls": runs[-1]["env_calls"],
+        "failures": failures,
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Messages for every metric that regressed by more than ``tolerance`` (a fraction),
+    and for scenarios the baseline does not cover.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            regressions.append(f"{name}: no baseline entry; record one with --update-baseline")
+            continue
+        for metric, higher_is_better in BASELINE_METRICS.items():
+            if base.get(metric) is None or result.get(metric) is None:
+                continue
+            if higher_is_better:
+                regressed = result[metric] < base[metric] * (1 - tolerance)
+            else:
+                regressed = result[metric] > base[metric] * (1 + tolerance)
+            if regressed:
+                regressions.append(f"{name}.{metric}: {result[metric]:.2f} vs baseline {base[metric]:.2f}")
+    return regressions
+
+
+def report(name, result):
+    print(f"\n[Bench] {name}: {result['runs']} runs")
+    print(f" - Steps/sec: {result['steps_per_sec']:.2f}")
+    print(f" - Step latency p50/p95: {result['p50_step_ms']:.1f} / {result['p95_step_ms']:.1f} ms")
+    print(f" - Peak traced memory: {result['peak_mem_mb']:.1f} MB")
+    for agent, s in sorted(result["agents"].items()):
+        print(f" - {agent}: n={s['count']} p50={s['p50_ms']:.1f}ms p95={s['p95_ms']:.1f}ms")
+    print(f" - Env calls (last run): {result['env_calls']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks against a replaying fake env.")
+    parser.add_argument("scenarios", nargs="*", help="Scenario names (default: all in benchmarks/scenarios)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression as a fraction")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="Also write the full results as JSON")
+    args = parser.parse_args(argv)
+
+    set_log_level("WARNING")
+    get_tracer().enabled = True
+    results = {name: run_scenario(name, sc, args.repeat) for name, sc in load_scenarios(args.scenarios).items()}
+    for name, result in results.items():
+        report(name, result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = [f"{name}: {msg}" for name, r in results.items() for msg in r["failures"]]
+    if args.update_baseline:
+        if failures:
+            print("[Bench] Not updating the baseline: some runs failed.")
+        else:
+            baseline = {}
+            if os.path.exists(args.baseline):
+                with open(args.baseline) as f:
+                    baseline = json.load(f)
+            for name, r in results.items():
+                baseline[name] = {metric: r[metric] for metric in BASELINE_METRICS}
+            with open(args.baseline, "w") as f:
+                json.dump(baseline, f, indent=2)
+            print(f"[Bench] Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            failures += compare_to_baseline(results, json.load(f), args.tolerance)
+    else:
+        failures.append(f"no baseline at {args.baseline}; record one with --update-baseline")
+
+    for msg in failures:
+        print(f"[Bench] FAIL {msg}")
+    get_gateway().close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
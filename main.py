@@ -1,115 +1,416 @@
 import os
 import json
 import time
-from android_world.env.env_launcher import load_and_setup_env
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from agents.planner_agent import PlannerAgent
 from agents.executor_agent import ExecutorAgent
 from agents.verifier_agent import VerifierAgent
 from agents.supervisor_agent import SupervisorAgent
+from agents.trace_store import TraceWriter
+from agents.checkpoints import CheckpointLog
+from agents.fingerprint import ui_fingerprint
+from agents.plan_cache import PlanCache, is_valid_plan
+from agents.macro_replay import MacroStore, MacroReplay
+from agents.qa_logging import get_logger, format_ui, StepLog, write_test_log, read_step_log
+from agents.tracing import get_tracer, span
+from agents.observation import ObservationManager
+from agents.nav_graph import NavGraph
+from agents.plan_stream import StreamingPlan, has_step
+from agents.frame_capture import FrameCapture
+from agents.app_index import foreground_package
+from agents.run_history import RunHistory
 
 from dotenv import load_dotenv
 load_dotenv()
 
 MAX_REPLANS = 2
 
-def main(task_prompt):
-    env = load_and_setup_env(
-        console_port=5554,
-        grpc_port=8554,
-        emulator_setup=False,
-        adb_path=os.getenv("ADB_PATH"),
-        render_mode='rgb_array'
-    )
-    state = env.reset()
-    ui_elements = state.ui_elements
-
-    planner = PlannerAgent(task_prompt)
-    executor = ExecutorAgent(env)
-    verifier = VerifierAgent()
-    supervisor = SupervisorAgent()
-
-    subgoals = planner.generate_subgoals()
-    logs = []
-    visual_trace = []
+log = get_logger("Main")
+
+class QASession:
+    """
+    One environment and one set of agents reused across tasks, so a suite
+    pays environment setup and the gRPC/ADB connections once.
+
+    Between tasks ``reset()`` goes home, stops the apps the previous task
+    brought to the foreground and compares the home screen with the
+    fingerprint taken at setup; only a mismatch costs a full ``env.reset()``.
+
+    LLM reviews (Supervisor feedback, Verifier fallbacks) of a task run in the
+    background while the next task executes; they are collected, with a bound,
+    at the start of the next ``run()`` or in ``close()``.
+    """
+
+    def __init__(
+        self, console_port=5554, grpc_port=8554, adb_serial=None, env=None, use_macros=True, stream_plan=True,
+        capture_policy="every_step", capture_size=(540, 1200), review_timeout=60.0
+    ):
+        """
+        :param env: Ready environment to use instead of connecting to an emulator
+                    (e.g. benchmarks/fake_env.FakeAndroidEnv).
+        :param stream_plan: Start executing subgoals while the rest of the plan is still streaming.
+        :param capture_policy: Steps that get a visual trace frame (agents.frame_capture.POLICIES
+                               or a CapturePolicy); failed steps are always captured.
+        :param capture_size: (width, height) frames are downscaled to fit; None keeps full resolution.
+        :param review_timeout: Seconds to wait for a task's pending LLM reviews when collecting them.
+        """
+        if env is None:
+            from android_world.env.env_launcher import load_and_setup_env
+            with span("env.setup"):
+                env = load_and_setup_env(
+                    console_port=console_port,
+                    grpc_port=grpc_port,
+                    emulator_setup=False,
+                    adb_path=os.getenv("ADB_PATH"),
+                    render_mode='rgb_array'
+                )
+        self.env = env
+        self.use_macros = use_macros
+        self.stream_plan = stream_plan
+        self.capture_policy = capture_policy
+        self.capture_size = capture_size
+        self.observations = ObservationManager(env)
+        with span("env.reset"):
+            state = self.observations.update(env.reset(go_home=True))
+        self.baseline = ui_fingerprint(state.ui_elements)
+        self.home_package = foreground_package(state.ui_elements)
+
+        self.device = adb_serial or f"emulator-{console_port}"
+        self.history = RunHistory()
+        self.plan_cache = PlanCache()
+        self.nav_graph = NavGraph()
+        self.executor = ExecutorAgent(env, adb_serial=adb_serial, observations=self.observations, nav_graph=self.nav_graph)
+        self.verifier = VerifierAgent()
+        self.supervisor = SupervisorAgent(history=self.history)
+        self.macros = MacroStore()
+        self.tasks_run = 0
+        self.full_resets = 0
+        self._packages = set()
+        self.review_timeout = review_timeout
+        self._pending_review = None
+
+    def run(self, task_prompt, log_dir="logs"):
+        """
+        Runs one task; logs, visual trace and the Supervisor review go to ``log_dir``.
+        Returns {"completed", "steps", "frames"}.
+        """
+        tracer = get_tracer()
+        trace_mark = tracer.mark()
+        started_at, start = time.time(), time.perf_counter()
+        self.collect_reviews()
+        if self.tasks_run:
+            with span("session.reset"):
+                self.reset()
+        self.tasks_run += 1
+        self.verifier.reset()
+        ui_elements = self.observations.current().ui_elements
+
+        planner = PlannerAgent(task_prompt, cache=self.plan_cache)
+        self.supervisor.log_path = os.path.join(log_dir, "test_log.json")
+        self.supervisor.trace_path = os.path.join(log_dir, "visual_trace")
+        self.supervisor.img_dir = os.path.join(log_dir, "frames")
+
+        plan_complete = True
+        macro = self.macros.load(task_prompt) if self.use_macros else None
+        if macro:
+            replay = MacroReplay(macro)
+            subgoals = replay.subgoals
+            log.info(f"Replaying recorded macro ({len(subgoals)} steps); planner skipped.")
+        else:
+            replay = None
+            if self.stream_plan:
+                subgoals = StreamingPlan(planner.stream_subgoals())
+            else:
+                with span("planner.generate"):
+                    subgoals = planner.generate_subgoals()
+                plan_complete = planner.complete
+        step_log = StepLog(os.path.join(log_dir, "test_log.jsonl"))
+        visual_trace = TraceWriter(os.path.join(log_dir, "visual_trace"))
+        capture = FrameCapture(self.env, visual_trace, policy=self.capture_policy, max_size=self.capture_size)
+
+        recorded = None
+        stats = {"replans": 0}
+        try:
+            recorded = _run_subgoals(
+                self.env, planner, self.executor, self.verifier, subgoals, ui_elements, step_log, capture, replay,
+                packages=self._packages, stats=stats, plan_complete=plan_complete,
+            )
+            if replay is not None and (recorded is None or stats["replans"]):
+                # A macro that needed recovery must not skip the planner next time
+                log.warning("Replayed macro did not complete cleanly; discarding it.")
+                self.macros.invalidate(task_prompt)
+            elif self.use_macros and recorded:
+                self.macros.save(task_prompt, recorded, stats["plan_steps"])
+        finally:
+            with span("capture.drain"):
+                capture.close()
+            visual_trace.close()
+            step_log.close()
+            self.nav_graph.save()
+            # Convert the streamed step log to the test_log.json the Supervisor reads
+            write_test_log(step_log.path, os.path.join(log_dir, "test_log.json"))
+            log.info(f"Saved {step_log.count} steps and {len(visual_trace)} frames to {log_dir} (capture: {capture.stats()})")
+            log.info(f"Device state round trips: {self.observations.round_trips} ({self.observations.hits} served from cache)")
+            self.history.record_run(
+                task_prompt, read_step_log(step_log.path), device=self.device, completed=recorded is not None,
+                duration_ms=(time.perf_counter() - start) * 1000, started_at=started_at, replans=stats["replans"],
+            )
+
+        with span("supervisor.review"):
+            # Gemini feedback is printed by its done-callback while the next task runs
+            self._pending_review = self.supervisor.review(wait=False, trace_since=trace_mark)
+        if tracer.enabled:
+            _export_trace(tracer, trace_mark, log_dir)
+        return {"completed": recorded is not None, "steps": step_log.count, "frames": len(visual_trace)}
+
+    def reset(self):
+        """
+        Fast reset between tasks: HOME, force-stop the apps the last task used
+        (one ADB round trip) and check the home screen against the baseline
+        fingerprint; falls back to a full ``env.reset()`` on a mismatch.
+        Returns the state the next task starts from.
+        """
+        self.executor.go_home()
+        self.executor.close_apps(self._packages - {self.home_package, None})
+        self._packages.clear()
+        state = self.observations.current()
+        if ui_fingerprint(state.ui_elements) == self.baseline:
+            log.info("Fast reset: home screen matches the session baseline.")
+            return state
+
+        log.warning("Home screen differs from the session baseline; doing a full environment reset.")
+        self.full_resets += 1
+        with span("env.reset"):
+            state = self.observations.update(self.env.reset(go_home=True))
+        fingerprint = ui_fingerprint(state.ui_elements)
+        if fingerprint != self.baseline:
+            log.warning("Home screen still differs after a full reset; adopting it as the new baseline.")
+            self.baseline = fingerprint
+            self.home_package = foreground_package(state.ui_elements)
+        return state
+
+    def collect_reviews(self):
+        """
+        Waits up to ``review_timeout`` for the previous task's Supervisor feedback
+        and Verifier LLM fallbacks; one that is still running is cancelled.
+        """
+        future, self._pending_review = self._pending_review, None
+        if future is not None:
+            try:
+                future.result(timeout=self.review_timeout)
+            except FutureTimeoutError:
+                log.warning(f"Supervisor feedback still pending after {self.review_timeout:.0f}s; cancelling it.")
+                future.cancel()
+            except Exception:
+                pass  # already reported by the done-callback
+        for feedback in self.verifier.collect_feedback(timeout=self.review_timeout):
+            log.info(f"Verifier LLM feedback for {feedback['subgoal']}: {feedback['llm_feedback']}")
+
+    def close(self):
+        self.collect_reviews()
+        self.plan_cache.save()
+        self.executor.close()
+        self.history.close()
+        self.env.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(
+    task_prompt, console_port=5554, grpc_port=8554, log_dir="logs", adb_serial=None, use_macros=True, env=None,
+    stream_plan=True, capture_policy="every_step", capture_size=(540, 1200)
+):
+    """
+    Runs a single task in a fresh QASession; use QASession directly to run several.
+    """
+    with QASession(
+        console_port, grpc_port, adb_serial, env, use_macros, stream_plan, capture_policy, capture_size
+    ) as session:
+        return session.run(task_prompt, log_dir)
+
+
+def _export_trace(tracer, since, log_dir):
+    """
+    Writes the task's Chrome trace (trace.json) and per-span latency breakdown (latency.json).
+    """
+    count = tracer.export_chrome(os.path.join(log_dir, "trace.json"), since=since)
+    with open(os.path.join(log_dir, "latency.json"), "w") as f:
+        json.dump(tracer.summary(since), f, indent=2)
+    log.info(f"Wrote {count} trace spans to {os.path.join(log_dir, 'trace.json')}")
+
+
+def _run_subgoals(
+    env, planner, executor, verifier, subgoals, ui_elements, step_log, capture, replay=None, packages=None, stats=None,
+    plan_complete=True,
+):
+    """
+    Runs the plan to completion. Returns the recorded macro steps when every
+    subgoal finished and the plan being run arrived in full, else None.
+
+    :param packages: Set collecting the foreground package after every step.
+    :param stats: Dict receiving the run's replan count under "replans" and, when
+                  the plan ran to its end, its length under "plan_steps".
+    :param plan_complete: Whether a list ``subgoals`` is the full plan; a StreamingPlan
+                          reports this itself. Replans take PlannerAgent.complete.
+    """
     i = 0
     replans = 0
+    complete = None  # None until a replan replaces the initial plan
+    checkpoints = CheckpointLog(ui_fingerprint(ui_elements))
+    recorded = []
 
-    while i < len(subgoals):
+    while has_step(subgoals, i):
         step = subgoals[i]
-        print(f"\n[DEBUG] Step {i} — Current subgoal: {json.dumps(step)}")
-        print(f"[DEBUG] Number of UI elements: {len(ui_elements)}")
-        for el in ui_elements:
-            print(f"    [UI] TEXT='{el.text}' | CLASS='{el.class_name}' | BBOX={getattr(el, 'bbox_pixels', None)}")
+        step_start = time.perf_counter()
+        log.info(lambda: f"Step {i} — Current subgoal: {json.dumps(step)}")
+        log.debug(lambda: f"Number of UI elements: {len(ui_elements)}\n{format_ui(ui_elements)}")
+
+        pre_fingerprint = ui_fingerprint(ui_elements)
+        macro_step = replay.guard(i, pre_fingerprint) if replay else None
+        actions = []
 
         if step["action"] == "verify":
-            result = verifier.verify(step, ui_elements)
-            logs.append({"agent": "verifier", "action": step, "status": result["status"], "reason": result["reason"]})
+            with span("verifier.verify", step=i):
+                result = verifier.verify(step, ui_elements)
+            step_log.append({
+                "agent": "verifier", "action": step, "status": result["status"], "reason": result["reason"],
+                "step": i, "duration_ms": (time.perf_counter() - step_start) * 1000, "replans": replans,
+            })
 
+            if result["status"] == "fail":
+                capture.step(i, ui_fingerprint(ui_elements), executor.observations.peek(), failed=True)
             if result["status"] == "fail" and result.get("should_replan"):
                 replans += 1
-                print(f"[Main] Replanning triggered by verifier... (attempt {replans}/{MAX_REPLANS})")
+                if stats is not None:
+                    stats["replans"] = replans
+                log.warning(f"Replanning triggered by verifier... (attempt {replans}/{MAX_REPLANS})")
                 if replans > MAX_REPLANS:
-                    print("[Main] Maximum replans reached. Exiting main loop!")
+                    log.error("Maximum replans reached. Exiting main loop!")
                     break
-                print("[Main] Returning to home before replanning...")
-                executor.go_home()
-                state = env.reset()
-                ui_elements = state.ui_elements
-                subgoals = planner.generate_subgoals()
-                i = 0
+                with span("main.replan", step=i):
+                    subgoals, i, ui_elements = _replan(env, planner, executor, checkpoints, step, result)
+                complete = planner.complete
+                del recorded[i:]
+                if replay:
+                    replay.stop()
                 continue
             elif result["status"] == "fail":
-                print("[ERROR] Verification failed, stopping execution.")
+                log.error("Verification failed, stopping execution.")
                 break
         else:
-            result = executor.execute(step, ui_elements)
-            logs.append({"agent": "executor", "action": step, "status": result['status'], "reason": result.get("reason", "")})
+            if macro_step is not None:
+                log.info(f"Replaying {len(macro_step['actions'])} recorded macro actions for step {i}")
+                actions = macro_step["actions"]
+                try:
+                    with span("executor.replay", step=i):
+                        result = {"status": macro_step.get("status", "success"), "state": executor.replay_actions(actions)}
+                except Exception as e:
+                    result = {"status": "fail", "reason": f"Macro replay failed: {e}"}
+            else:
+                executor.begin_recording()
+                with span("executor.execute", step=i, action=step["action"]):
+                    result = executor.execute(step, ui_elements)
+                actions = executor.end_recording()
+            step_log.append({
+                "agent": "executor", "action": step, "status": result['status'], "reason": result.get("reason", ""),
+                "step": i, "duration_ms": (time.perf_counter() - step_start) * 1000, "replans": replans,
+            })
 
             if result["status"] == "fail":
+                capture.step(i, state=result.get("state") or executor.observations.peek(), failed=True)
                 replans += 1
-                print(f"[Main] Executor failed. Triggering replanning... (attempt {replans}/{MAX_REPLANS})")
+                if stats is not None:
+                    stats["replans"] = replans
+                log.warning(f"Executor failed. Triggering replanning... (attempt {replans}/{MAX_REPLANS})")
                 if replans > MAX_REPLANS:
-                    print("[Main] Maximum replans reached. Exiting main loop!")
-                    print("[Main] Emergency: resetting environment for debug info.")
-                    state = env.reset()
+                    log.error("Maximum replans reached. Exiting main loop!")
+                    log.info("Emergency: resetting environment for debug info.")
+                    state = executor.observations.update(env.reset())
                     ui_elements = state.ui_elements
-                    print("[ERROR] UI Dump on ultimate fail:")
-                    for el in ui_elements:
-                        print(f"   [UI] TEXT='{el.text}' | CLASS='{el.class_name}' | BBOX={getattr(el, 'bbox_pixels', None)}")
+                    log.debug(lambda: f"UI Dump on ultimate fail:\n{format_ui(ui_elements, '   ')}")
                     break
-                print("[Main] Returning to home before replanning...")
-                executor.go_home()
-                state = env.get_state(wait_to_stabilize=True)
-                ui_elements = state.ui_elements
-                subgoals = planner.generate_subgoals()
-                i = 0
+                with span("main.replan", step=i):
+                    subgoals, i, ui_elements = _replan(env, planner, executor, checkpoints, step, result)
+                complete = planner.complete
+                del recorded[i:]
+                if replay:
+                    replay.stop()
                 continue
 
-            ui_elements = result.get("state", env.get_state()).ui_elements
+            # The executor's settled state is already the current snapshot; only fetch if it has none
+            state = result.get("state") or executor.observations.current()
+            ui_elements = state.ui_elements
 
-        frame = env.render()
-        if frame is not None:
-            print(f"[Trace] Captured frame at step {i}, shape: {frame.shape}")
-            visual_trace.append(frame)
-        else:
-            print(f"[Trace] No frame captured at step {i} (env.render() returned None)")
+        post_fingerprint = ui_fingerprint(ui_elements)
+        if packages is not None:
+            packages.add(foreground_package(ui_elements))
+        checkpoints.record(step, post_fingerprint)
+        if executor.nav_graph is not None:
+            executor.nav_graph.observe(
+                pre_fingerprint, post_fingerprint, actions, ui_elements, navigational=step.get("action") != "toggle"
+            )
+        recorded.append({"subgoal": step, "pre_fingerprint": pre_fingerprint, "actions": actions, "status": result["status"]})
+
+        # Rendered, downscaled and written by the capture worker
+        capture.step(i, post_fingerprint, executor.observations.peek())
 
         i += 1
 
-    # Save logs and trace
-    if not os.path.exists("logs"):
-        os.makedirs("logs")
-    with open("logs/test_log.json", "w") as f:
-        json.dump(logs, f, indent=2)
+    if i < len(subgoals):
+        return None
+    if stats is not None:
+        stats["plan_steps"] = i
+    if complete is None:
+        complete = subgoals.complete if isinstance(subgoals, StreamingPlan) else plan_complete
+    if not complete:
+        log.warning(f"All {i} subgoals ran, but the plan arrived incomplete; not counting the run as completed.")
+        return None
+    return recorded
+
+
+def _replan(env, planner, executor, checkpoints, failed_step, result):
+    """
+    Resumes from the checkpoint matching the current screen (or reachable by a
+    known route in the navigation graph) with a suffix plan; only goes home and
+    replans from scratch when no checkpoint is matched or reachable.
+    Returns (subgoals, next_index, ui_elements).
+    """
+    state = executor.observations.current()
+    k = checkpoints.match(ui_fingerprint(state.ui_elements))
+    if k is None:
+        k, state = _navigate_to_checkpoint(executor, checkpoints, state)
+    if k is not None:
+        completed = checkpoints.rewind(k)
+        log.info(f"Screen matches checkpoint {k}; resuming after {len(completed)} verified subgoals.")
+        if not completed:
+            return planner.generate_subgoals(refresh=True), 0, state.ui_elements
+        suffix = planner.generate_suffix(completed, failed_step, result.get("reason", ""))
+        if is_valid_plan(suffix):
+            return completed + suffix, len(completed), state.ui_elements
+        log.warning("Suffix plan invalid; falling back to a full replan.")
+
+    log.info("Returning to home before replanning...")
+    executor.go_home()
+    state = executor.observations.current()
+    checkpoints.reset(ui_fingerprint(state.ui_elements))
+    return planner.generate_subgoals(refresh=True), 0, state.ui_elements
 
-    print(f"[Trace] Saving {len(visual_trace)} frames to logs/visual_trace.npy")
-    print(f"[Trace] Current working directory: {os.getcwd()}")
-    import numpy as np
-    np.save("logs/visual_trace.npy", visual_trace)
-    print(f"[Trace] Trace saved! Check logs/visual_trace.npy")
 
-    supervisor.review()
-    env.close()
+def _navigate_to_checkpoint(executor, checkpoints, state):
+    """
+    Takes the shortest known route back to the most advanced reachable checkpoint.
+    Returns (checkpoint index, state), or (None, state) when none is reachable.
+    """
+    for k in range(len(checkpoints) - 1, -1, -1):
+        reached = executor.navigate_to(checkpoints.checkpoints[k].fingerprint)
+        if reached is not None:
+            return k, reached
+        state = executor.observations.current()
+    return None, state
 
 if __name__ == "__main__":
     main("Turn the wifi off and on")
@@ -0,0 +1,36 @@
+import os
+import sys
+import stat
+
+import pytest
+
+# Make the project root importable (agents/, main.py) when running pytest from anywhere
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _write_script(path, body):
+    with open(path, "w", newline="\n") as f:
+        f.write("#!/bin/sh\n" + body + "\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+@pytest.fixture
+def fake_adb(tmp_path):
+    """
+    Factory for a stand-in ``adb`` whose ``shell`` is a local ``sh``. ``programs``
+    maps command names (e.g. "cmd", "input") to sh scripts that come first on
+    its PATH; they can use $FAKE_ADB_DIR for state and logs.
+    """
+    if os.name == "nt":
+        pytest.skip("fake adb needs a POSIX sh")
+
+    def make(programs=None):
+        bin_dir = tmp_path / "fake_adb_bin"
+        bin_dir.mkdir(exist_ok=True)
+        for name, body in (programs or {}).items():
+            _write_script(bin_dir / name, body)
+        adb = tmp_path / "adb"
+        _write_script(adb, f'export FAKE_ADB_DIR="{tmp_path}"\nPATH="{bin_dir}:$PATH" exec sh')
+        return str(adb)
+
+    return make
@@ -0,0 +1,83 @@
+import pytest
+
+from agents.adb_session import AdbSession, AdbError, NOT_RESENT, is_idempotent
+
+# Logs its arguments, then kills the shell that ran it, as if the device dropped mid-batch
+DROPS_SHELL = 'echo "$0 $*" >> "$FAKE_ADB_DIR/ran.log"\nkill -9 $PPID'
+# Drops the shell the first time only
+DROPS_SHELL_ONCE = (
+    'echo "$0 $*" >> "$FAKE_ADB_DIR/ran.log"\n'
+    'if [ ! -f "$FAKE_ADB_DIR/dropped" ]; then touch "$FAKE_ADB_DIR/dropped"; kill -9 $PPID; fi\n'
+    'echo value'
+)
+LOGS = 'echo "$0 $*" >> "$FAKE_ADB_DIR/ran.log"'
+
+
+def ran(tmp_path):
+    path = tmp_path / "ran.log"
+    return [line.rsplit("/", 1)[-1] for line in path.read_text().splitlines()] if path.exists() else []
+
+
+def test_batch_is_one_round_trip(fake_adb):
+    with AdbSession(fake_adb(), timeout=5) as adb:
+        results = adb.run_batch(["echo a", ["echo", "b c"], "echo d; echo e"])
+        assert results == [(0, ["a"]), (0, ["b c"]), (0, ["d", "e"])]
+        assert adb.round_trips == 1
+        assert adb.run("echo again") == ["again"]
+        assert adb.round_trips == 2 and adb.reconnects == 0
+
+
+def test_exit_statuses(fake_adb):
+    with AdbSession(fake_adb(), timeout=5) as adb:
+        results = adb.run_batch(["true", "sh -c 'echo oops; exit 3'", "echo after"], check=False)
+        assert results == [(0, []), (3, ["oops"]), (0, ["after"])]
+        with pytest.raises(AdbError, match="exited with 3"):
+            adb.run_batch(["sh -c 'exit 3'"])
+
+
+def test_output_without_trailing_newline(fake_adb):
+    with AdbSession(fake_adb(), timeout=5) as adb:
+        assert adb.run_batch(["printf abc", "printf 'x\\ny'", "echo z"]) == [(0, ["abc"]), (0, ["x", "y"]), (0, ["z"])]
+
+
+def test_dropped_shell_does_not_resend_input_events(fake_adb, tmp_path):
+    adb_path = fake_adb({"input": DROPS_SHELL, "monkey": LOGS})
+    with AdbSession(adb_path, timeout=5) as adb:
+        results = adb.run_batch(["echo before", "input tap 10 20", "monkey -p com.example 1"], check=False)
+        assert results[0] == (0, ["before"])
+        assert results[1:] == [(-1, [NOT_RESENT]), (-1, [NOT_RESENT])]
+        assert ran(tmp_path) == ["input tap 10 20"]
+        assert adb.reconnects == 0
+
+        with pytest.raises(AdbError):
+            adb.run_batch(["input keyevent 3"])
+        assert ran(tmp_path) == ["input tap 10 20", "input keyevent 3"]
+        # The next batch starts a fresh shell
+        assert adb.run("echo back") == ["back"]
+
+
+def test_dropped_shell_resends_idempotent_commands(fake_adb, tmp_path):
+    adb_path = fake_adb({"getprop": DROPS_SHELL_ONCE, "dumpsys": LOGS})
+    with AdbSession(adb_path, timeout=5) as adb:
+        results = adb.run_batch(["getprop ro.build.version.sdk", "dumpsys window"])
+        assert results == [(0, ["value"]), (0, [])]
+        assert adb.reconnects == 1
+        assert ran(tmp_path) == ["getprop ro.build.version.sdk"] * 2 + ["dumpsys window"]
+
+
+def test_gives_up_after_max_reconnects(fake_adb):
+    adb_path = fake_adb({"getprop": DROPS_SHELL})
+    with AdbSession(adb_path, timeout=5, max_reconnects=2) as adb:
+        with pytest.raises(AdbError, match="unavailable"):
+            adb.run("getprop ro.serialno")
+        assert adb.reconnects == 2
+
+
+def test_is_idempotent():
+    assert is_idempotent("dumpsys window")
+    assert is_idempotent("am force-stop com.example")
+    assert is_idempotent("cmd package query-activities --brief -a android.intent.action.MAIN")
+    assert not is_idempotent("input tap 1 2")
+    assert not is_idempotent("monkey -p com.example 1")
+    assert not is_idempotent("am start -n com.example/.Main")
+    assert not is_idempotent("echoes")
@@ -0,0 +1,124 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from agents.adb_session import AdbSession
+from agents.app_index import AppIndex, parse_launcher_activities, derived_labels
+
+LISTING = """\
+com.android.settings/.Settings
+com.google.android.deskclock/com.android.deskclock.DeskClock
+com.google.android.contacts/com.android.contacts.activities.PeopleActivity
+com.example.notes/.MainActivity
+"""
+
+# Canned `cmd package query-activities --brief` output; every call is logged
+CMD = 'echo "$*" >> "$FAKE_ADB_DIR/cmd.log"\ncat "$FAKE_ADB_DIR/activities.txt"'
+AM = 'echo "Error: Activity class {$3} does not exist."'
+
+
+@pytest.fixture
+def device(fake_adb, tmp_path):
+    (tmp_path / "activities.txt").write_text(LISTING)
+    adb = AdbSession(fake_adb({"cmd": CMD, "am": AM}), serial="emulator-5554", timeout=5)
+    yield SimpleNamespace(adb=adb, dir=tmp_path, index_path=str(tmp_path / "index.json"))
+    adb.close()
+
+
+def listings(device):
+    path = device.dir / "cmd.log"
+    return len(path.read_text().splitlines()) if path.exists() else 0
+
+
+def test_parse_launcher_activities():
+    components = parse_launcher_activities([
+        "com.android.settings/.Settings",
+        "  com.example.notes/com.example.notes.ui.Main  ",
+        "com.android.settings/.SubSettings",
+        "No activities found",
+        "",
+    ])
+    assert components == {
+        "com.android.settings": "com.android.settings/com.android.settings.Settings",
+        "com.example.notes": "com.example.notes/com.example.notes.ui.Main",
+    }
+
+
+def test_derived_labels():
+    assert derived_labels("com.google.android.deskclock", "com.google.android.deskclock/com.android.deskclock.DeskClock") == {"deskclock"}
+    assert derived_labels("com.example.notes", "com.example.notes/com.example.notes.MainActivity") == {"notes"}
+    assert derived_labels("com.example.notes", "com.example.notes/.ui.EditorActivity") == {"notes", "editor"}
+
+
+def test_resolves_aliases_and_derived_labels(device):
+    index = AppIndex(device.adb, path=device.index_path)
+    assert index.resolve("Settings") == "com.android.settings/com.android.settings.Settings"
+    assert index.resolve("  clock ") == "com.google.android.deskclock/com.android.deskclock.DeskClock"
+    assert index.resolve("Contacts") == "com.google.android.contacts/com.android.contacts.activities.PeopleActivity"
+    assert index.resolve("Notes") == "com.example.notes/com.example.notes.MainActivity"
+    assert index.resolve("anything", package_name="com.example.notes") == "com.example.notes/com.example.notes.MainActivity"
+    assert listings(device) == 1
+
+
+def test_index_is_reused_from_disk(device):
+    AppIndex(device.adb, path=device.index_path).resolve("Settings")
+    reloaded = AppIndex(device.adb, path=device.index_path)
+    assert reloaded.resolve("Settings") == "com.android.settings/com.android.settings.Settings"
+    assert listings(device) == 1
+
+
+def test_unique_fuzzy_match_resolves(device):
+    index = AppIndex(device.adb, path=device.index_path)
+    assert index.resolve("Setings") == "com.android.settings/com.android.settings.Settings"
+
+
+def test_ambiguous_fuzzy_match_falls_back_to_drawer(device):
+    (device.dir / "activities.txt").write_text("com.a.contacts/.Main\ncom.b.contact/.Main\n")
+    index = AppIndex(device.adb, path=device.index_path, miss_refresh_interval=3600)
+    assert index.resolve("contacts") == "com.a.contacts/com.a.contacts.Main"
+    assert index.resolve("contact") == "com.b.contact/com.b.contact.Main"
+    # "contactz" is as close to both apps; guessing could open the wrong one
+    assert index.resolve("contactz") is None
+
+
+def test_miss_refresh_is_throttled(device):
+    index = AppIndex(device.adb, path=device.index_path, miss_refresh_interval=3600)
+    assert index.resolve("Camera") is None
+    assert index.resolve("Camera") is None
+    assert listings(device) == 1
+
+    # A newly installed app is found by the refresh a miss triggers once the interval has passed
+    with open(device.dir / "activities.txt", "a") as f:
+        f.write("com.android.camera2/com.android.camera.CameraLauncher\n")
+    index.built_at -= 3600
+    assert index.resolve("Camera") == "com.android.camera2/com.android.camera.CameraLauncher"
+    assert listings(device) == 2
+
+
+def test_learned_labels_and_forget(device):
+    index = AppIndex(device.adb, path=device.index_path, miss_refresh_interval=3600)
+    index.resolve("Settings")
+    index.learn("My Notes", "com.example.notes")
+    assert AppIndex(device.adb, path=device.index_path).resolve("my notes") == "com.example.notes/com.example.notes.MainActivity"
+
+    index.forget("com.example.notes")
+    assert index.resolve("My Notes") is None
+    assert index.resolve("Notes") is None
+    assert "com.example.notes" not in AppIndex(device.adb, path=device.index_path).components
+
+
+def test_executor_forgets_app_after_failed_launch(device, monkeypatch):
+    pytest.importorskip("android_world")
+    from agents.executor_agent import ExecutorAgent
+
+    monkeypatch.setenv("ADB_PATH", device.adb.adb_path)
+    index = AppIndex(device.adb, path=device.index_path, miss_refresh_interval=3600)
+    observations = SimpleNamespace(invalidate=lambda: None)
+    executor = ExecutorAgent(env=None, observations=observations, settle=SimpleNamespace(), app_index=index)
+    try:
+        assert executor._launch_indexed("Notes") is None
+    finally:
+        executor.adb.close()
+    assert "com.example.notes" not in index.components
+    assert index.resolve("Notes") is None
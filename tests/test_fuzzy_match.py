@@ -0,0 +1,90 @@
+import difflib
+import json
+import os
+from types import SimpleNamespace
+
+from agents.fuzzy_match import FuzzyMatcher
+from agents.ui_index import UIIndex
+
+DUMP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ui_elements_dump.json")
+
+
+def load_dump():
+    with open(DUMP_PATH) as f:
+        records = json.load(f)
+    return [SimpleNamespace(text=r.get("text"), content_description=r.get("content_description")) for r in records]
+
+
+def baseline_matches(label, elements):
+    """
+    The Verifier's matching before the index: substring or difflib ratio > 0.8
+    on the lower-cased text or content description.
+    """
+    label = (label or "").lower()
+    hits = []
+    for i, el in enumerate(elements):
+        text = (el.text or "").lower()
+        desc = (el.content_description or "").lower()
+        if (
+            label in text or label in desc
+            or difflib.SequenceMatcher(None, label, text).ratio() > 0.8
+            or difflib.SequenceMatcher(None, label, desc).ratio() > 0.8
+        ):
+            hits.append(i)
+    return hits
+
+
+def near_misses(label):
+    """
+    Typos around ``label``: one character dropped, doubled or replaced, and a truncation.
+    """
+    variants = {label[:-1], label + label[-1], label[1:], label[: len(label) // 2 + 1]}
+    for k in range(len(label)):
+        variants.add(label[:k] + label[k + 1:])
+        variants.add(label[:k] + "x" + label[k + 1:])
+    return variants
+
+
+ELEMENTS = load_dump()
+LABELS = sorted({v.lower() for el in ELEMENTS for v in (el.text, el.content_description) if v})
+QUERIES = sorted(
+    set(LABELS)
+    | {q for label in LABELS for q in near_misses(label)}
+    | {"", "wifi", "wi-fi", "bluetooth", "airplane mode", "network and internet", "zzzz"}
+)
+
+
+def test_dump_has_labels():
+    assert len(LABELS) > 5
+
+
+def test_index_matches_difflib_baseline():
+    index = UIIndex(ELEMENTS)
+    mismatches = {}
+    for query in QUERIES:
+        found = sorted(set(index.find_substring(query)) | set(index.find_fuzzy(query)))
+        expected = baseline_matches(query, ELEMENTS)
+        if found != expected:
+            mismatches[query] = (found, expected)
+    assert not mismatches
+
+
+def test_matcher_scores_match_sequence_matcher():
+    matcher = FuzzyMatcher(LABELS)
+    for query in ("network & internt", "settngs", "wi-fi", "dispaly"):
+        expected = sorted(
+            ((difflib.SequenceMatcher(None, query, l).ratio(), l) for l in LABELS
+             if difflib.SequenceMatcher(None, query, l).ratio() > 0.8),
+            key=lambda h: (-h[0], LABELS.index(h[1])),
+        )
+        assert matcher.query(query) == expected
+
+
+def test_empty_label():
+    matcher = FuzzyMatcher(["", "settings"])
+    assert matcher.query("") == [(1.0, "")]
+    assert matcher.query("", threshold=1.0) == []
+    assert FuzzyMatcher(["settings"]).query("") == []
+    # An empty label is a substring of everything, as in the baseline loop
+    index = UIIndex(ELEMENTS)
+    assert sorted(set(index.find_substring("")) | set(index.find_fuzzy(""))) == list(range(len(ELEMENTS)))
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from agents.llm_gateway import LLMGateway, StubProvider, LLMError, LLMTimeoutError
+
+
+class FlakyProvider:
+    """
+    Fails its first ``failures`` calls, then answers "ok".
+    """
+
+    name = "flaky"
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    async def complete(self, model, prompt, temperature=None, images=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError(f"boom {self.calls}")
+        return "ok"
+
+
+class CountingProvider:
+    """
+    Records the highest number of requests it was serving at once.
+    """
+
+    name = "counting"
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def complete(self, model, prompt, temperature=None, images=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        return prompt
+
+
+@pytest.fixture
+def gateway_factory():
+    gateways = []
+
+    def make(providers, **kwargs):
+        gateway = LLMGateway(providers, **kwargs)
+        gateways.append(gateway)
+        return gateway
+
+    yield make
+    for gateway in gateways:
+        gateway.close()
+
+
+def test_identical_inflight_requests_are_coalesced(gateway_factory):
+    stub = StubProvider("plan", delay=0.1)
+    gateway = gateway_factory([stub])
+    futures = [gateway.submit("stub", "m", "same prompt", temperature=0.3) for _ in range(5)]
+    other = gateway.submit("stub", "m", "other prompt", temperature=0.3)
+    assert [f.result(timeout=5) for f in futures + [other]] == ["plan"] * 6
+    assert stub.calls == 2
+    assert gateway.latency_summary()["stub"]["coalesced"] == 4
+    # Finished requests are not reused
+    gateway.complete("stub", "m", "same prompt", temperature=0.3)
+    assert stub.calls == 3
+
+
+def test_timeouts_are_counted_and_raised(gateway_factory):
+    gateway = gateway_factory([StubProvider("late", delay=1.0)], retries=1, backoff=0.01)
+    with pytest.raises(LLMTimeoutError):
+        gateway.complete("stub", "m", "prompt", timeout=0.05)
+    stats = gateway.latency_summary()["stub"]
+    assert stats["timeouts"] == 2 and stats["retries"] == 1 and stats["calls"] == 2
+
+
+def test_errors_are_retried_with_backoff(gateway_factory):
+    flaky = FlakyProvider(failures=2)
+    gateway = gateway_factory([flaky], retries=2, backoff=0.01)
+    assert gateway.complete("flaky", "m", "prompt") == "ok"
+    stats = gateway.latency_summary()["flaky"]
+    assert flaky.calls == 3
+    assert stats["errors"] == 2 and stats["retries"] == 2 and stats["calls"] == 3
+
+
+def test_gives_up_after_the_last_retry(gateway_factory):
+    flaky = FlakyProvider(failures=10)
+    gateway = gateway_factory([flaky], retries=1, backoff=0.01)
+    with pytest.raises(LLMError, match="boom 2"):
+        gateway.complete("flaky", "m", "prompt")
+    assert flaky.calls == 2
+
+
+def test_per_provider_concurrency_limit(gateway_factory):
+    provider = CountingProvider()
+    gateway = gateway_factory([provider], concurrency={"counting": 2})
+    futures = [gateway.submit("counting", "m", f"prompt {k}") for k in range(6)]
+    assert sorted(f.result(timeout=5) for f in futures) == [f"prompt {k}" for k in range(6)]
+    assert provider.peak == 2
+
+
+def test_stream_yields_chunks(gateway_factory):
+    gateway = gateway_factory([StubProvider("abcdefgh", chunk_size=3)])
+    assert list(gateway.stream("stub", "m", "prompt")) == ["abc", "def", "gh"]
+
+
+def test_unknown_provider(gateway_factory):
+    gateway = gateway_factory([])
+    with pytest.raises(LLMError, match="Unknown LLM provider"):
+        gateway.complete("nope", "m", "prompt")
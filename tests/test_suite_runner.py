@@ -0,0 +1,168 @@
+import threading
+import time
+
+import pytest
+
+from agents.adb_session import AdbError
+from agents.suite_runner import SuiteRunner, DeviceEndpoint, parse_devices
+
+
+def devices(n):
+    return [DeviceEndpoint(5554 + 2 * i, 8554 + 2 * i) for i in range(n)]
+
+
+class FakeSession:
+    def __init__(self, device):
+        self.device = device
+        self.tasks = []
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_parse_devices():
+    parsed = parse_devices("5554:8554, 5556:8556:emu-b,")
+    assert [(d.console_port, d.grpc_port, d.serial) for d in parsed] == [
+        (5554, 8554, "emulator-5554"),
+        (5556, 8556, "emu-b"),
+    ]
+
+
+def test_shards_round_robin_and_keeps_result_order(tmp_path):
+    # Both workers wait for each other on every task, so neither runs dry and steals
+    barrier = threading.Barrier(2, timeout=5)
+
+    def run_task(payload, device, run_dir):
+        barrier.wait()
+        return payload * 10
+
+    pool = devices(2)
+    runner = SuiteRunner(pool, run_task, runs_dir=str(tmp_path))
+    results = runner.run([0, 1, 2, 3])
+
+    assert [r["result"] for r in results] == [0, 10, 20, 30]
+    assert [r["device"] for r in results] == [pool[0].name, pool[1].name] * 2
+    assert all(runner.stats[d.name]["stolen"] == 0 for d in pool)
+    # Every attempt gets its own run directory
+    assert len({r["run_dir"] for r in results}) == 4
+
+
+def test_idle_device_steals_from_busy_queue(tmp_path):
+    slow, fast = devices(2)
+
+    def run_task(payload, device, run_dir):
+        if device.name == slow.name:
+            time.sleep(0.2)
+        return device.name
+
+    runner = SuiteRunner([slow, fast], run_task, runs_dir=str(tmp_path))
+    results = runner.run(list(range(8)))
+
+    assert all(r is not None and "result" in r for r in results)
+    assert runner.stats[fast.name]["stolen"] > 0
+    assert runner.stats[fast.name]["completed"] > runner.stats[slow.name]["completed"]
+
+
+def test_infra_failure_is_retried_on_another_device(tmp_path):
+    broken, healthy = devices(2)
+
+    def run_task(payload, device, run_dir):
+        if device.name == broken.name:
+            raise AdbError("device offline")
+        return "ok"
+
+    runner = SuiteRunner([broken, healthy], run_task, runs_dir=str(tmp_path), max_device_failures=5)
+    result = runner.run(["task"])[0]
+
+    assert result["result"] == "ok"
+    assert result["device"] == healthy.name
+    assert result["attempts"] == 2
+    assert runner.stats[broken.name]["infra_failures"] == 1
+
+
+def test_device_is_retired_after_consecutive_infra_failures(tmp_path):
+    broken, healthy = devices(2)
+    ran_on = []
+
+    def run_task(payload, device, run_dir):
+        ran_on.append(device.name)
+        if device.name == broken.name:
+            raise TimeoutError("no response from emulator")
+        time.sleep(0.05)  # keep the healthy device busy so it does not steal the broken one's queue
+        return payload
+
+    runner = SuiteRunner([broken, healthy], run_task, runs_dir=str(tmp_path), max_attempts=3, max_device_failures=2)
+    results = runner.run(list(range(6)))
+
+    assert [r["result"] for r in results] == list(range(6))
+    assert all(r["device"] == healthy.name for r in results)
+    assert ran_on.count(broken.name) == 2
+    assert runner.stats[broken.name]["infra_failures"] == 2
+
+
+def test_task_errors_are_not_retried_and_do_not_retire_devices(tmp_path):
+    calls = []
+
+    def run_task(payload, device, run_dir):
+        calls.append(payload)
+        raise KeyError("bug in the pipeline")
+
+    pool = devices(2)
+    runner = SuiteRunner(pool, run_task, runs_dir=str(tmp_path), max_device_failures=1)
+    results = runner.run(list(range(4)))
+
+    assert sorted(calls) == [0, 1, 2, 3]
+    assert all(r["attempts"] == 1 and r["error"].startswith("KeyError") for r in results)
+    assert all(runner.stats[d.name]["infra_failures"] == 0 for d in pool)
+    assert sum(runner.stats[d.name]["task_errors"] for d in pool) == 4
+
+
+def test_missing_local_file_is_a_task_error(tmp_path):
+    calls = []
+
+    def run_task(payload, device, run_dir):
+        calls.append(device.name)
+        with open(tmp_path / "gt_traces" / "missing.npy", "rb"):
+            pass
+
+    pool = devices(2)
+    runner = SuiteRunner(pool, run_task, runs_dir=str(tmp_path / "runs"), max_device_failures=1)
+    result = runner.run(["task"])[0]
+
+    assert len(calls) == 1
+    assert result["attempts"] == 1 and result["error"].startswith("FileNotFoundError")
+    assert all(runner.stats[d.name]["infra_failures"] == 0 for d in pool)
+
+
+def test_sessions_are_reused_per_device_and_rebuilt_after_infra_failure(tmp_path):
+    created = []
+    failed_once = threading.Event()
+
+    def session_factory(device):
+        session = FakeSession(device)
+        created.append(session)
+        return session
+
+    def run_task(payload, device, run_dir, session):
+        assert session.device is device
+        if payload == 2 and not failed_once.is_set():
+            failed_once.set()
+            raise ConnectionError("gRPC channel closed")
+        session.tasks.append(payload)
+        return payload
+
+    (device,) = devices(1)
+    runner = SuiteRunner([device], run_task, runs_dir=str(tmp_path), session_factory=session_factory)
+    results = runner.run(list(range(4)))
+
+    assert [r["result"] for r in results] == list(range(4))
+    assert len(created) == 2
+    assert created[0].tasks == [0, 1] and created[0].closed
+    assert created[1].tasks == [2, 3] and created[1].closed
+    assert runner.stats[device.name]["sessions"] == 2
+
+
+def test_needs_devices():
+    with pytest.raises(ValueError):
+        SuiteRunner([], lambda *a: None)
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+from agents.fingerprint import ui_fingerprint
+from agents.ui_settle import SettleEngine
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def screen(label):
+    return [SimpleNamespace(text=label, content_description=None, class_name="android.widget.TextView", bbox_pixels=None)]
+
+
+class ScriptedEnv:
+    """
+    Shows ``script[k][1]`` from time ``script[k][0]`` on, by the fake clock.
+    """
+
+    def __init__(self, clock, script):
+        self.clock = clock
+        self.script = script
+        self.polls = 0
+
+    def get_state(self, wait_to_stabilize=False):
+        self.polls += 1
+        label = [label for start, label in self.script if start <= self.clock.now][-1]
+        return SimpleNamespace(ui_elements=screen(label))
+
+
+def engine(script, **kwargs):
+    clock = FakeClock()
+    env = ScriptedEnv(clock, script)
+    settle = SettleEngine(env, bounds={"tap": (0.2, 3.0)}, poll_interval=0.1, clock=clock, sleep=clock.sleep, **kwargs)
+    return settle, env, clock
+
+
+def texts(state):
+    return [el.text for el in state.ui_elements]
+
+
+def test_returns_once_the_new_screen_is_stable():
+    settle, env, clock = engine([(0.0, "A"), (0.5, "B")])
+    state = settle.wait("tap", before=ui_fingerprint(screen("A")))
+    assert texts(state) == ["B"]
+    assert clock.now < 1.0
+    assert list(settle.history["tap"]) == [0.5]
+    assert settle.timeouts == {} and settle.unchanged == {}
+
+
+def test_waits_for_a_late_transition_while_the_ui_matches_before():
+    settle, env, clock = engine([(0.0, "A"), (2.0, "B")])
+    state = settle.wait("tap", before=ui_fingerprint(screen("A")))
+    assert texts(state) == ["B"]
+    assert 2.0 <= clock.now < 3.0
+
+
+def test_unchanged_ui_waits_to_max_without_recording_a_sample():
+    settle, env, clock = engine([(0.0, "A")])
+    state = settle.wait("tap", before=ui_fingerprint(screen("A")))
+    assert texts(state) == ["A"]
+    assert clock.now >= 3.0
+    assert settle.unchanged == {"tap": 1}
+    assert "tap" not in settle.history and settle.timeouts == {}
+
+
+def test_without_before_a_stable_screen_returns_after_the_min_bound():
+    settle, env, clock = engine([(0.0, "A")])
+    settle.wait("tap")
+    assert clock.now < 0.5
+    assert env.polls == 2
+
+
+def test_a_screen_that_never_settles_times_out():
+    # Changes between every two polls
+    settle, env, clock = engine([(k * 0.05, str(k)) for k in range(100)])
+    settle.wait("tap", before=ui_fingerprint(screen("A")))
+    assert clock.now >= 3.0
+    assert settle.timeouts == {"tap": 1}
+    assert list(settle.history["tap"]) == [clock.now]
+
+
+def test_tuning_lowers_the_min_bound_and_keeps_the_max():
+    settle, env, clock = engine([(0.0, "A")])
+    for k in range(5):
+        env.script = [(0.0, "A"), (clock.now + 0.3, f"B{k}")]
+        settle.wait("tap", before=ui_fingerprint(screen("A")))
+        env.script = [(0.0, "A")]
+    min_s, max_s = settle.bounds_for("tap")
+    assert min_s < 0.2
+    assert max_s == 3.0
+    assert settle.stats()["tap"]["samples"] == 5